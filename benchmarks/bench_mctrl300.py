@@ -0,0 +1,226 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+"""Throughput and latency benchmarks for the MCTRL300 driver.
+
+Runs against the pty emulator (Linux/POSIX only), so no hardware is needed. Results are written as
+JSON; pass an earlier result file with --compare to see the change per metric.
+
+Cold start of the CLI and of the GUI (until the window is shown, offscreen if there is no display)
+is measured in fresh interpreters and checked against STARTUP_TARGETS_MS.
+
+    python benchmarks/bench_mctrl300.py --output results.json
+    python benchmarks/bench_mctrl300.py --compare results.json
+"""
+
+__author__ = 'Dieter Vansteenwegen'
+__project__ = 'Novastar_MCTRL300_basic_controller'
+__project_link__ = 'https://github.com/dietervansteenwegen/Novastar_MCTRL300_basic_controller'
+
+import argparse
+import datetime as dt
+import json
+import os
+import pathlib
+import platform
+import random
+import statistics
+import subprocess
+import sys
+from concurrent.futures import wait
+from time import perf_counter
+from typing import Callable, Dict, List
+
+SRC = pathlib.Path(__file__).resolve().parent.parent / 'src'
+sys.path.insert(0, str(SRC))
+
+from novastar_mctrl300.decoder import MCTRL300FrameDecoder  # noqa: E402
+from novastar_mctrl300.emulator import MCTRL300Emulator  # noqa: E402
+from novastar_mctrl300.mctrl300 import (  # noqa: E402
+    MCTRL300,
+    MCTRL300Command,
+    MCTRL300CreateCommand,
+)
+from novastar_mctrl300.pipeline import MCTRL300Pipeline  # noqa: E402
+from novastar_mctrl300.serports import Mctrl300Serial  # noqa: E402
+
+# metrics where a lower value is better, all others are rates
+LOWER_IS_BETTER = ('_p50_ms', '_p99_ms', '_startup_ms')
+
+# cold start, from launching the interpreter until the command ran or the window is shown
+STARTUP_TARGETS_MS = {
+    'cli_startup_ms': 100,  # on top of a bare interpreter, see interpreter_startup_ms
+    'gui_startup_ms': 1000,
+}
+STARTUP_RUNS = 5
+GUI_STARTUP = (
+    'from PyQt5 import QtCore, QtWidgets\n'
+    'import gui.gui\n'
+    'app = QtWidgets.QApplication([])\n'
+    'window = gui.gui.MainWindow()\n'
+    'window.show()\n'
+    'QtCore.QTimer.singleShot(0, app.quit)\n'
+    'app.exec_()\n'
+)
+
+
+def rate(fn: Callable[[], None], n: int) -> float:
+    """Call fn n times and return the number of calls per second."""
+    start = perf_counter()
+    for _ in range(n):
+        fn()
+    return n / (perf_counter() - start)
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def bench_encode(results: Dict[str, float], n: int) -> None:
+    creator = MCTRL300CreateCommand()
+    results['encode_frames_per_s'] = rate(
+        lambda: creator.generate(
+            serno=1,
+            reg_addr=MCTRL300.REG_BRIGHTNESS_OVERALL,
+            data_len=1,
+            data=0x40,
+            port=1,
+        ),
+        n,
+    )
+    batch = [
+        MCTRL300Command(i & 0xFF, 1 + i % 2, MCTRL300.REG_BRIGHTNESS_OVERALL, 1, i & 0xFF)
+        for i in range(1000)
+    ]
+    creator.generate_batch(batch)  # imports NumPy, which should not count in the rate
+    results['encode_batch_frames_per_s'] = rate(lambda: creator.generate_batch(batch), 20) * 1000
+
+
+def bench_decode(results: Dict[str, float], n: int) -> None:
+    """Decode a stream of reply frames with random garbage in between."""
+    creator = MCTRL300CreateCommand()
+    rnd = random.Random(0)  # noqa: S311
+    stream = bytearray()
+    for i in range(n):
+        stream += bytes(rnd.randrange(256) for _ in range(rnd.randrange(4)))
+        stream += creator.generate(
+            serno=i & 0xFF,
+            reg_addr=MCTRL300.REG_BRIGHTNESS_OVERALL,
+            data_len=1,
+            data=i & 0xFF,
+            port=1,
+            is_cmd=False,
+            is_write=False,
+        )
+    chunks = [stream[i : i + 64] for i in range(0, len(stream), 64)]
+    decoder = MCTRL300FrameDecoder(max_data_len=MCTRL300.MAX_FRAME_DATA_LEN)
+    start = perf_counter()
+    decoded = sum(len(decoder.feed(chunk)) for chunk in chunks)
+    elapsed = perf_counter() - start
+    results['decode_noisy_frames_per_s'] = decoded / elapsed
+    results['decode_noisy_mb_per_s'] = len(stream) / elapsed / 1e6
+
+
+def bench_driver(results: Dict[str, float], n: int, latency: float) -> None:
+    with MCTRL300Emulator(latency=latency) as emulator:
+        serport = Mctrl300Serial(emulator.port)
+        screen = MCTRL300(serport, wait_for_ack=True)
+        results['set_brightness_per_s'] = rate(lambda: screen.set_brightness(1, 0x40), n)
+        results['set_pattern_per_s'] = rate(lambda: screen.set_pattern(MCTRL300.PATTERN_RED, 1), n)
+        samples = []
+        for _ in range(n):
+            start = perf_counter()
+            screen.get_brightness(1)
+            samples.append((perf_counter() - start) * 1000)
+        results['get_brightness_p50_ms'] = statistics.median(samples)
+        results['get_brightness_p99_ms'] = percentile(samples, 99)
+        with MCTRL300Pipeline(serport, window=32) as pipeline:
+            start = perf_counter()
+            wait(
+                [pipeline.submit_write(1, MCTRL300.REG_BRIGHTNESS_OVERALL, 0x40) for _ in range(n)],
+            )
+            results['pipelined_writes_per_s'] = n / (perf_counter() - start)
+        serport.close()
+
+
+def cold_start_ms(args: List[str], env: Dict[str, str]) -> float:
+    """Median wall clock time of running a fresh interpreter with args, in ms."""
+    samples = []
+    for _ in range(STARTUP_RUNS):
+        start = perf_counter()
+        subprocess.run(
+            [sys.executable, *args],  # noqa: S603
+            env=env,
+            cwd=SRC,
+            check=True,
+            capture_output=True,
+        )
+        samples.append((perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def bench_startup(results: Dict[str, float]) -> None:
+    env = dict(os.environ, PYTHONPATH=str(SRC), MCTRL300_LOGFILE=os.devnull)
+    if not env.get('DISPLAY') and not env.get('WAYLAND_DISPLAY'):
+        env['QT_QPA_PLATFORM'] = 'offscreen'
+    results['interpreter_startup_ms'] = cold_start_ms(['-c', 'pass'], env)
+    cli = cold_start_ms(['-m', 'novastar_mctrl300', '--help'], env)
+    results['cli_startup_ms'] = cli - results['interpreter_startup_ms']
+    try:
+        results['gui_startup_ms'] = cold_start_ms(['-c', GUI_STARTUP], env)
+    except subprocess.CalledProcessError:
+        print('GUI startup not measured, is PyQt5 installed?', file=sys.stderr)
+
+
+def check_targets(results: Dict[str, float]) -> None:
+    for name, target in STARTUP_TARGETS_MS.items():
+        if name in results and results[name] > target:
+            print(f'{name} {results[name]:.0f} ms, target is {target} ms', file=sys.stderr)
+
+
+def compare(results: Dict[str, float], baseline_file: str) -> None:
+    baseline = json.loads(pathlib.Path(baseline_file).read_text())['results']
+    for name, value in results.items():
+        if name not in baseline or not baseline[name]:
+            continue
+        change = value / baseline[name] - 1
+        if name.endswith(LOWER_IS_BETTER):
+            change = -change
+        flag = 'REGRESSION' if change < -0.1 else ''
+        print(f'{name:32} {baseline[name]:14.3f} -> {value:14.3f} {change:+8.1%} {flag}')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', type=int, default=500, help='operations per serial benchmark')
+    parser.add_argument('--latency', type=float, default=0.0005, help='emulator latency (s)')
+    parser.add_argument('--output', help='write the JSON results to this file')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare with')
+    args = parser.parse_args()
+
+    results: Dict[str, float] = {}
+    bench_encode(results, n=100000)
+    bench_decode(results, n=100000)
+    bench_driver(results, n=args.n, latency=args.latency)
+    bench_startup(results)
+    check_targets(results)
+
+    report = {
+        'timestamp': dt.datetime.now(dt.timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': {'n': args.n, 'latency': args.latency},
+        'startup_targets_ms': STARTUP_TARGETS_MS,
+        'results': results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        pathlib.Path(args.output).write_text(text)
+    if args.compare:
+        compare(results, args.compare)
+    elif not args.output:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -5,29 +5,35 @@
 __project__ = 'Novastar_MCTRL300_basic_controller'
 __project_link__ = 'https://github.com/dietervansteenwegen/Novastar_MCTRL300_basic_controller'
 
-import contextlib
+import atexit
 import datetime as dt
-import itertools
 import logging
 import logging.handlers
-from typing import List
+import os
+import queue
+from typing import List, Optional
 
 import novastar_mctrl300.mctrl300 as mctrl300
 import serial.serialutil
 from novastar_mctrl300 import serports
-from PyQt5 import QtWidgets
+from novastar_mctrl300.sequencer import color_cycle
+from PyQt5 import QtGui, QtWidgets
 from PyQt5.QtCore import QTimer
 
 from .main_window import Ui_MainWindow
+from .worker import HotplugWatcher, PortScanner, ScreenWorker
 
 LOG_FMT = (
-    '%(asctime)s|%(levelname)-8.8s|%(module)-15.15s|%(lineno)-0.3d|'
-    '%(funcName)-20.20s |%(message)s'
+    '%(asctime)s|%(levelname)-8.8s|%(module)-15.15s|%(lineno)-0.3d|%(funcName)-20.20s |%(message)s'
 )
 DATEFMT = '%d/%m/%Y %H:%M:%S'
 LOGFILE = './logfile.log'
+LOGLEVEL = 'INFO'
 LOGMAXBYTES = 500000
-TMR_MSECS = 750
+CYCLE_DWELL_MSECS = 750  # time each color is shown by cycle colors
+RECONNECT_DELAY_MSECS = 500  # give the OS time to set up a port that reappeared
+
+_listener: Optional[logging.handlers.QueueListener] = None
 
 
 class MilliSecondsFormatter(logging.Formatter):
@@ -42,71 +48,121 @@ def formatTime(self, record, datefmt=None):  # noqa: N802
         return s
 
 
-def setup_logger() -> logging.Logger:
+def setup_logger(level: int = logging.DEBUG) -> logging.Logger:
     """Setup logging.
-    Returns logger object with (at least) 1 streamhandler to stdout.
+    Returns the root logger with a QueueHandler. Records are handled by a QueueListener on a
+    background thread, which has (at least) 1 streamhandler to stdout.
+
+    Args:
+        level (int, optional): level of the root logger. Defaults to logging.DEBUG.
 
     Returns:
         logging.Logger: configured logger object
     """
+    global _listener  # noqa: PLW0603
     logger = logging.getLogger()  # DON'T specifiy name in order to create root logger!
-    logger.setLevel(logging.DEBUG)
+    logger.setLevel(level)
 
     stream_handler = logging.StreamHandler()  # handler to stdout
     stream_handler.setLevel(logging.ERROR)
     stream_handler.setFormatter(MilliSecondsFormatter(LOG_FMT))
-    logger.addHandler(stream_handler)
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    _listener = logging.handlers.QueueListener(
+        log_queue,
+        stream_handler,
+        respect_handler_level=True,
+    )
+    _listener.start()
+    atexit.register(stop_logging)
     return logger
 
 
-def add_rotating_file(logger: logging.Logger) -> logging.Logger:
-    rot_fil_handler = logging.handlers.RotatingFileHandler(
-        LOGFILE,
+def add_rotating_file(
+    logger: logging.Logger,
+    path: str = LOGFILE,
+    level: int = logging.DEBUG,
+) -> logging.Logger:
+    """Add a rotating logfile to the QueueListener created by setup_logger.
+
+    The file is only opened (and the previous one rotated) by the listener thread when the first
+    record is written, so nothing blocks the caller.
+
+    Args:
+        logger (logging.Logger): logger returned by setup_logger.
+        path (str, optional): path of the logfile. Defaults to LOGFILE.
+        level (int, optional): level of the records written to the file.
+                                    Defaults to logging.DEBUG.
+
+    Raises:
+        RuntimeError: setup_logger was not called (or logging was stopped).
+
+    Returns:
+        logging.Logger: configured logger object
+    """
+    if _listener is None:
+        msg = 'Call setup_logger before add_rotating_file.'
+        raise RuntimeError(msg)
+    rot_fil_handler = RolloverOnStartHandler(
+        path,
         maxBytes=LOGMAXBYTES,
         backupCount=3,
     )
-    rot_fil_handler.doRollover()
-    rot_fil_handler.setLevel(logging.DEBUG)
+    rot_fil_handler.setLevel(level)
     rot_fil_handler.setFormatter(MilliSecondsFormatter(LOG_FMT))
-    logger.addHandler(rot_fil_handler)
+    _listener.handlers = (*_listener.handlers, rot_fil_handler)
 
     return logger
 
 
+def stop_logging() -> None:
+    """Stop the QueueListener, after writing all queued records."""
+    global _listener  # noqa: PLW0603
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+class RolloverOnStartHandler(logging.handlers.RotatingFileHandler):
+    def __init__(self, *args, **kwargs):
+        """RotatingFileHandler that starts a new file when the first record is written."""
+        super().__init__(*args, delay=True, **kwargs)
+        self._rolled_over = False
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if not self._rolled_over:
+            self._rolled_over = True
+            self.doRollover()
+        super().emit(record)
+
+
 class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
     def __init__(self, *args, obj=None, **kwargs):
         super(MainWindow, self).__init__(*args, **kwargs)
-        log = setup_logger()
-        self.log = add_rotating_file(log)
+        self.log = logging.getLogger()
         self.log.debug('Starting')
         self.setupUi(self)
-        self._refresh_serial_ports()
+        self.serial_available_ports: List = []
+        self._port_scanner = None
+        self._lost_port: Optional[tuple] = None  # controller that was unplugged while open
+        self._replay_state: dict = {}  # last pattern/brightness sent to the lost controller
+        self.hotplug = HotplugWatcher(self)
+        self.hotplug.port_added.connect(self._port_added)
+        self.hotplug.port_removed.connect(self._port_removed)
+        self.hotplug.ports_listed.connect(self._ports_found)
         self.serport = None
         self.led_screen = None
         self.state = 1
         self._connect_slots()
         self._update_to_state()
         self._set_up_timer_brightness()
-        self._set_up_timer()
-        self._setup_pattern_generator()
         self.statusbar = QtWidgets.QStatusBar()
         self.setStatusBar(self.statusbar)
         self.statusbar.showMessage('Started...', msecs=2000)
 
-    def _setup_pattern_generator(self) -> None:
-        self.pattern_list = itertools.cycle(
-            [
-                mctrl300.MCTRL300.PATTERN_RED,
-                mctrl300.MCTRL300.PATTERN_GREEN,
-                mctrl300.MCTRL300.PATTERN_BLUE,
-            ],
-        )
-
-    def _set_up_timer(self) -> None:
-        self.timer = QTimer()
-        self.timer.setInterval(TMR_MSECS)
-        self.timer.timeout.connect(self._timer_timeout)
-
     def _set_up_timer_brightness(self):
         # TODO: Timer querying brightness and setting slider value + label
         # TODO: Code for setting/getting brightness
@@ -120,6 +176,7 @@ def _connect_slots(self):
         self.btn_blue.clicked.connect(self._pattern_blue)
         self.btn_freeze.clicked.connect(self._pattern_freeze)
         self.btn_cycle_colors.clicked.connect(self._pattern_cycle_colors)
+        self.btn_cycle_colors.toggled.connect(self._cycle_colors_toggled)
         self.btn_green.clicked.connect(self._pattern_green)
         self.btn_normal.clicked.connect(self._pattern_normal)
         self.btn_red.clicked.connect(self._pattern_red)
@@ -148,38 +205,59 @@ def _brightness_value_changed(self, v):
             self.led_screen.set_brightness(self.selected_port, v)
 
     def _output_changed(self, index: int):
-        success = False
         if index in {1, 2} and self.serport is not None:
-            success: bool = bool(self.create_screen(index))
-
-        if not success:
+            self.create_screen(index)
+        else:
             self._initialize_state()
 
     def _initialize_state(self) -> None:
-        self.led_screen = None
+        self._stop_screen_worker()
         self._change_state_to(2)
 
-    def create_screen(self, output):
-        success = False
-        with contextlib.suppress(mctrl300.MCTRL300Error):
-            self.led_screen: mctrl300.MCTRL300 = mctrl300.MCTRL300(serport=self.serport)
-            self.selected_port = output
-            self._change_state_to(3)
-            self._update_brightness_from_screen()
-            success = True
-        return success
+    def create_screen(self, output, replay: Optional[dict] = None):
+        """Start the worker owning the MCTRL300 (if needed) and select output.
+
+        Args:
+            output (int): output of the controller, 1 or 2.
+            replay (Optional[dict], optional): ScreenWorker.last_state of an earlier worker, sent
+                                    to the new one before the brightness is queried.
+                                    Defaults to None.
+        """
+        if self.led_screen is None:
+            self.led_screen = ScreenWorker(self.serport, parent=self)
+            self.led_screen.failed.connect(self._screen_failed)
+            self.led_screen.brightness_received.connect(self._brightness_received)
+            self.led_screen.command_failed.connect(
+                lambda e: self.statusbar.showMessage(f'Command failed: {e}', msecs=5000),
+            )
+            self.led_screen.start()
+            if replay:
+                self.led_screen.replay(replay)
+        self.selected_port = output
+        self._change_state_to(3)
+        self._update_brightness_from_screen()
+
+    def _stop_screen_worker(self) -> None:
+        if self.led_screen is not None:
+            self.led_screen.stop()
+            self.led_screen = None
+
+    def _screen_failed(self, error: str) -> None:
+        self.log.error('Could not create screen: %s', error)
+        self.led_screen = None
+        self._initialize_state()
 
     def _update_brightness_from_screen(self) -> None:
-        self.log.debug(f'Querying brightness from output {self.selected_port}')
-        try:
-            brightness = self.led_screen.get_brightness(self.selected_port)
-        except mctrl300.MCTRL300IncorrectReplyError:
-            brightness = None
+        self.log.debug('Querying brightness from output %s', self.selected_port)
+        self.led_screen.get_brightness(self.selected_port)
 
+    def _brightness_received(self, port: int, brightness) -> None:
+        if self.led_screen is None or port != self.selected_port:
+            return
         if brightness is not None:
             self.lbl_brightness_value.setText(brightness.__str__())
             self.sldr_brightness.setValue(brightness)
-            self.log.debug(f'Response: {brightness}')
+            self.log.debug('Response: %s', brightness)
         else:
             QtWidgets.QMessageBox.critical(
                 self,
@@ -194,25 +272,83 @@ def _update_brightness_from_screen(self) -> None:
             self._change_state_to(2)
 
     def _refresh_serial_ports(self) -> None:
+        """List the serial ports in the background, the list is filled in by _ports_found."""
+        if self._port_scanner is not None and self._port_scanner.isRunning():
+            return
+        self.btn_serial_open.setEnabled(False)
+        self.lbl_serial_status.setText('Searching for ports...')
+        self._port_scanner = PortScanner(self)
+        self._port_scanner.ports_found.connect(self._ports_found)
+        self._port_scanner.start()
+
+    def _ports_found(self, ports: List) -> None:
         self.lst_serial_ports.clear()
-        self.serial_available_ports: List = []
-        for port in sorted(serports.get_available_ports()):
+        self.serial_available_ports = []
+        for port in ports:
             self.serial_available_ports.append(port)
-            self.log.debug(f'Found serial port: {port[1:]}')
+            self.log.debug('Found serial port: %s', port[1:])
             self.lst_serial_ports.addItem(f' {port[1]}  ({port[2]}, {port[3]})')
-            # if port[3][:6] == 'CP2102':
-            # TODO: color item in list green (this is a possible controller)
+            if serports.is_controller_port(port):  # USB to UART bridge of the MCTRL300
+                item = self.lst_serial_ports.item(self.lst_serial_ports.count() - 1)
+                item.setBackground(QtGui.QColor('lightgreen'))
         if len(self.serial_available_ports) > 0:
             self.btn_serial_open.setEnabled(True)
-            self.lst_serial_ports.setCurrentRow(0)
+            controllers = [i for i, p in enumerate(ports) if serports.is_controller_port(p)]
+            self.lst_serial_ports.setCurrentRow(controllers[0] if controllers else 0)
+            self.lbl_serial_status.setText('No port')
         else:
             self.btn_serial_open.setEnabled(False)
             self.lbl_serial_status.setText('No ports found...')
             self.lbl_serial_status.setStyleSheet('background-color:orange')
             self._change_state_to(1)
 
+    def _port_added(self, port: tuple) -> None:
+        lost = self._lost_port
+        if lost is not None and (
+            port[1] == lost[1] or (serports.is_controller_port(port) and port[2:] == lost[2:])
+        ):
+            self.lbl_serial_status.setText(f'{port[1]} is back, reconnecting...')
+            QTimer.singleShot(RECONNECT_DELAY_MSECS, lambda: self._reconnect(port))
+        elif self.serport is None:
+            self._ports_found(self.hotplug.ports)
+
+    def _port_removed(self, port: tuple) -> None:
+        if self.serport is None or port[1] != self.serport.port:
+            if self.serport is None:
+                self._ports_found(self.hotplug.ports)
+            return
+        self.log.error('Controller on %s was unplugged.', port[1])
+        self._replay_state = self.led_screen.last_state if self.led_screen else {}
+        self._close_serial_port()
+        self._lost_port = port
+        self._ports_found(self.hotplug.ports)
+        self.lbl_serial_status.setText(f'Lost {port[1]}, waiting for it to return...')
+        self.lbl_serial_status.setStyleSheet('background-color:red')
+
+    def _reconnect(self, port: tuple) -> None:
+        """Open the controller that reappeared and send it the last pattern and brightness."""
+        if self._lost_port is None or self.serport is not None:
+            return  # the user opened a port in the meantime
+        self._ports_found(self.hotplug.ports)
+        devices = [p[1] for p in self.serial_available_ports]
+        if port[1] not in devices:
+            return
+        self.lst_serial_ports.setCurrentRow(devices.index(port[1]))
+        self.btn_serial_open.setChecked(True)
+        lost = self._lost_port
+        self._open_serial_port(True)  # resets _lost_port
+        if self.serport is None:
+            self._lost_port = lost  # stays lost, retried when the port reappears again
+            return
+        self._lost_port = None
+        output = self.cmb_output.currentIndex()
+        if output in {1, 2}:
+            self.create_screen(output, replay=self._replay_state)
+        self.statusbar.showMessage(f'Reconnected to {port[1]}', msecs=5000)
+
     def _open_serial_port(self, checked) -> None:
         if checked:
+            self._lost_port = None
             if len(self.serial_available_ports) == 0:
                 # self.lbl_serial_status.setText('No serial ports')
                 self.btn_serial_open.setChecked(False)
@@ -221,7 +357,7 @@ def _open_serial_port(self, checked) -> None:
             index = self.lst_serial_ports.currentRow()
             try:
                 p = self.serial_available_ports[index]
-                self.log.debug(f'opening serial port {p[1:]}')
+                self.log.debug('opening serial port %s', p[1:])
                 self.serport = serports.Mctrl300Serial(p[1])
             except (FileNotFoundError, serial.serialutil.SerialException):
                 self.log.exception('Issue during opening.')
@@ -237,19 +373,29 @@ def _open_serial_port(self, checked) -> None:
                 self.lbl_serial_status.setStyleSheet('background-color:green')
                 self._change_state_to(2)
             else:
-                self.log.error(f'Issue during opening port {p}.')
+                self.log.error('Issue during opening port %s.', p)
                 self.lbl_serial_status.setText('Error opening port. See logs.')
                 self.lbl_serial_status.setStyleSheet('background-color:red')
                 self.serport = None
                 self._change_state_to(1)
         else:
-            if self.serport:
-                self.serport.close()
-                self.log.debug(f'Closed {self.serport}')
+            self._lost_port = None
+            self._close_serial_port()
             self.lbl_serial_status.setText('Closed serial port')
             self.lbl_serial_status.setStyleSheet('background-color:orange')
-            self.btn_serial_open.setText('Click to open selected port')
-            self._change_state_to(1)
+
+    def _close_serial_port(self) -> None:
+        self._stop_screen_worker()
+        if self.serport:
+            try:
+                self.serport.close()
+            except (OSError, serial.serialutil.SerialException):
+                self.log.exception('Issue while closing.')  # i.e. the port was unplugged
+            self.log.debug('Closed %s', self.serport)
+            self.serport = None
+        self.btn_serial_open.setChecked(False)
+        self.btn_serial_open.setText('Click to open selected port')
+        self._change_state_to(1)
 
     def _change_state_to(self, state: int):
         if state == 2 and self.cmb_output.currentIndex() > 0:
@@ -273,21 +419,18 @@ def _update_to_state(self):
         self.btn_freeze.setEnabled(False)
         self.btn_blackout.setEnabled(False)
 
-    def _timer_timeout(self) -> None:
-        if self.btn_cycle_colors.isChecked():
-            next_pattern = next(self.pattern_list)
-            self.led_screen.set_pattern(next_pattern, self.selected_port)
-        else:
-            self.timer.stop()
-            self._setup_pattern_generator()
+    def _cycle_colors_toggled(self, checked: bool) -> None:
+        if not checked and self.led_screen:
+            self.led_screen.stop_sequence()
 
     def _pattern_cycle_colors(self) -> None:
         if self.led_screen:
-            # self.led_screen.set_pattern(mctrl300.MCTRL300.PATTERN_RED, self.selected_port)
             self.btn_cycle_colors.setChecked(True)
             self.log.debug('Cycle colors activated.')
-            self.timer.start()
-            self._timer_timeout()
+            self.led_screen.start_sequence(
+                color_cycle(CYCLE_DWELL_MSECS / 1000),
+                self.selected_port,
+            )
 
     def _pattern_red(self):
         if self.led_screen:
@@ -329,9 +472,26 @@ def _pattern_freeze(self):
             self.led_screen.set_pattern(mctrl300.MCTRL300.PATTERN_RED, self.selected_port)
             self.btn_freeze.setChecked(True)
 
+    def closeEvent(self, event) -> None:  # noqa: N802
+        self._stop_screen_worker()
+        self.hotplug.stop()
+        if self._port_scanner is not None:
+            self._port_scanner.wait()
+        super().closeEvent(event)
+
 
 def start_gui():
+    name = os.environ.get('MCTRL300_LOGLEVEL', LOGLEVEL)
+    level = logging.getLevelName(name.upper())  # the string 'Level <name>' if unknown
+    known = isinstance(level, int)
+    if not known:
+        level = logging.getLevelName(LOGLEVEL)
+    log = add_rotating_file(setup_logger(level), os.environ.get('MCTRL300_LOGFILE', LOGFILE), level)
+    if not known:
+        log.warning('Unknown log level %r in MCTRL300_LOGLEVEL, using %s.', name, LOGLEVEL)
     app = QtWidgets.QApplication([])
     window = MainWindow()
     window.show()
+    QTimer.singleShot(0, window.hotplug.start)  # lists the ports once the window is on screen
     app.exec_()
+    stop_logging()
@@ -6,16 +6,11 @@
 __project_link__ = 'https://github.com/dietervansteenwegen/Novastar_MCTRL300_basic_controller'
 
 import logging
-import os
 import pathlib
 
 from PyQt5 import QtCore, QtGui, QtWidgets
 
-base = os.path.dirname(__file__)
-base = pathlib.Path(base).parent.parent
-print(f'{base=}')
-logo_location = os.path.join(base, 'assets', 'include', 'logo.png')
-print(f'{logo_location=}')
+LOGO = ('assets', 'include', 'logo.png')  # relative to the repository root
 
 
 class Ui_MainWindow(object):
@@ -27,7 +22,7 @@ def setupUi(self, MainWindow):
         MainWindow.setWindowTitle('Novastar MCTRL300 basic controller')
         icon = QtGui.QIcon()
         icon.addPixmap(
-            QtGui.QPixmap(os.path.join(base, 'assets', 'include', 'logo.png')),
+            QtGui.QPixmap(str(pathlib.Path(__file__).parents[2].joinpath(*LOGO))),
             QtGui.QIcon.Normal,
             QtGui.QIcon.Off,
         )
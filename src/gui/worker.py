@@ -0,0 +1,177 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+
+__author__ = 'Dieter Vansteenwegen'
+__project__ = 'Novastar_MCTRL300_basic_controller'
+__project_link__ = 'https://github.com/dietervansteenwegen/Novastar_MCTRL300_basic_controller'
+
+import collections
+import logging
+from typing import Deque, Dict, Optional, Sequence, Tuple
+
+import novastar_mctrl300.mctrl300 as mctrl300
+import serial
+from novastar_mctrl300 import serports
+from novastar_mctrl300.cmdqueue import MCTRL300CommandQueue, QueuedCommand
+from novastar_mctrl300.hotplug import PortWatcher
+from novastar_mctrl300.sequencer import PatternSequencer, SequenceStep, StepReport
+from PyQt5 import QtCore
+
+STOP_TIMEOUT_MSECS = 3000
+CACHE_TTL = 2  # seconds, repeated brightness queries and unchanged writes stay off the wire
+
+
+class ScreenWorker(QtCore.QThread):
+    """Thread that owns the MCTRL300 instance and executes all serial I/O.
+
+    The public methods mirror those of MCTRL300 but only queue the command and return immediately.
+    Queued writes to the same register are coalesced, so only the latest slider value is sent.
+    Results and errors are reported back through Qt signals, which are delivered in the GUI thread.
+    """
+
+    ready = QtCore.pyqtSignal()
+    failed = QtCore.pyqtSignal(str)
+    brightness_received = QtCore.pyqtSignal(int, object)  # port, brightness (None if no reply)
+    command_failed = QtCore.pyqtSignal(str)
+
+    def __init__(self, serport: serial.Serial, parent=None):
+        super().__init__(parent)
+        self.log = logging.getLogger(__name__)
+        self.serport = serport
+        self._queue = MCTRL300CommandQueue()
+        self.last_state: Dict[Tuple[str, int], QueuedCommand] = {}  # (setting, port): command
+        self._screen: Optional[mctrl300.MCTRL300] = None  # set by run
+        self._sequencer: Optional[PatternSequencer] = None
+        self._stopping: Deque[PatternSequencer] = collections.deque()  # joined by run
+
+    def set_pattern(self, pattern: int, port: int) -> None:
+        self.stop_sequence()
+        self._put(('pattern', port), 'set_pattern', pattern, port)
+
+    def deactivate_pattern(self, port: int) -> None:
+        self.stop_sequence()
+        self._put(('pattern', port), 'deactivate_pattern', port)
+
+    def start_sequence(self, steps: Sequence[SequenceStep], port: int) -> None:
+        """Run a PatternSequencer on port, until stop_sequence or a pattern is set.
+
+        The sequencer has its own thread and shares the MCTRL300 of this worker, so its timing
+        does not depend on the commands queued here.
+        """
+        self.stop_sequence()
+        if self._screen is None:
+            self.log.warning('Screen not ready, sequence not started.')
+            return
+        self._sequencer = PatternSequencer([(self._screen, port)], steps, on_step=self._step_done)
+        self._sequencer.start()
+
+    def stop_sequence(self) -> None:
+        """Stop the sequence without waiting for the step being sent, see _reap_sequencers."""
+        if self._sequencer is not None:
+            self._sequencer.stop(timeout=0)
+            self._stopping.append(self._sequencer)
+            self._sequencer = None
+
+    def _reap_sequencers(self) -> None:
+        """Wait in this thread for stopped sequencers, so their last step is not sent later."""
+        while self._stopping:
+            self._stopping.popleft().wait()
+
+    def _step_done(self, report: StepReport) -> None:
+        if report.error is not None:
+            self.command_failed.emit(str(report.error))
+
+    def set_brightness(self, port: int, value: int) -> None:
+        self._put(('brightness', port), 'set_brightness', port, value)
+
+    def replay(self, state: Dict[Tuple[str, int], QueuedCommand]) -> None:
+        """Queue the last pattern and brightness of every port, see last_state."""
+        for key, cmd in state.items():
+            self._put(key, cmd.name, *cmd.args)
+
+    def _put(self, key: Tuple[str, int], name: str, *args) -> None:
+        self.last_state[key] = QueuedCommand(name, args)
+        self._queue.put(name, *args)
+
+    def get_brightness(self, port: int) -> None:
+        """Query the brightness, result is emitted with brightness_received."""
+        self._queue.put('get_brightness', port)
+
+    def stop(self) -> None:
+        """Drop the queued commands and stop the thread after the current one."""
+        self.stop_sequence()
+        self._queue.close()
+        if not self.wait(STOP_TIMEOUT_MSECS):
+            self.log.error('Screen worker did not stop in time.')
+
+    def run(self) -> None:
+        try:
+            led_screen = mctrl300.MCTRL300(
+                serport=self.serport,
+                wait_for_ack=True,  # so failed writes are retried and only applied ones cached
+                cache_ttl=CACHE_TTL,
+                retry=mctrl300.RetryPolicy(),
+            )
+        except (mctrl300.MCTRL300Error, serial.SerialException) as e:
+            self.log.exception('Could not create screen.')
+            self.failed.emit(str(e))
+            return
+        self._screen = led_screen
+        self.ready.emit()
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            self._reap_sequencers()
+            name, args = item
+            try:
+                result = getattr(led_screen, name)(*args)
+            except (mctrl300.MCTRL300Error, serial.SerialException) as e:
+                self.log.exception('Issue while executing %s%s.', name, args)
+                if name == 'get_brightness':
+                    self.brightness_received.emit(args[0], None)
+                else:
+                    self.command_failed.emit(str(e))
+                continue
+            if name == 'get_brightness':
+                self.brightness_received.emit(args[0], result)
+        self._reap_sequencers()  # before the serial port is closed
+        self.log.debug('Screen worker stopped.')
+
+
+class PortScanner(QtCore.QThread):
+    """Thread that lists the available serial ports, which can take a while on some systems.
+
+    The ports (see serports.get_available_ports) are emitted with ports_found.
+    """
+
+    ports_found = QtCore.pyqtSignal(list)
+
+    def run(self) -> None:
+        self.ports_found.emit(sorted(serports.get_available_ports()))
+
+
+class HotplugWatcher(QtCore.QObject):
+    """Qt wrapper of PortWatcher, added/removed ports are emitted in the GUI thread."""
+
+    port_added = QtCore.pyqtSignal(tuple)
+    port_removed = QtCore.pyqtSignal(tuple)
+    ports_listed = QtCore.pyqtSignal(list)  # the ports found when the watcher started
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._watcher = PortWatcher(
+            on_added=self.port_added.emit,
+            on_removed=self.port_removed.emit,
+            on_listed=self.ports_listed.emit,
+        )
+
+    @property
+    def ports(self) -> list:
+        return sorted(self._watcher.ports.values())
+
+    def start(self) -> None:
+        self._watcher.start()
+
+    def stop(self) -> None:
+        self._watcher.close()
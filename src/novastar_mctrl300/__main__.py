@@ -0,0 +1,12 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+
+__author__ = 'Dieter Vansteenwegen'
+__project__ = 'Novastar_MCTRL300_basic_controller'
+__project_link__ = 'https://github.com/dietervansteenwegen/Novastar_MCTRL300_basic_controller'
+
+import sys
+
+from novastar_mctrl300.cli import main
+
+sys.exit(main())
@@ -0,0 +1,380 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+
+__author__ = 'Dieter Vansteenwegen'
+__project__ = 'Novastar_MCTRL300_basic_controller'
+__project_link__ = 'https://github.com/dietervansteenwegen/Novastar_MCTRL300_basic_controller'
+
+import asyncio
+import logging
+import os
+from typing import Dict, List, Optional, Tuple, Union
+
+import serial
+
+from novastar_mctrl300.decoder import MCTRL300FrameDecoder
+from novastar_mctrl300.mctrl300 import (
+    MCTRL300,
+    MCTRL300CreateCommand,
+    MCTRL300Error,
+    MCTRL300IncorrectReplyError,
+    MCTRL300NoReplyError,
+    ack_error,
+)
+from novastar_mctrl300.pipeline import MAX_WINDOW
+from novastar_mctrl300.serports import Mctrl300Serial
+
+READ_SIZE = 4096
+
+
+class SerialTransport(asyncio.Transport):
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        protocol: asyncio.Protocol,
+        serport: serial.Serial,
+    ):
+        """Asyncio transport on top of an open pyserial port.
+
+        Uses loop.add_reader/add_writer on the (non-blocking) file descriptor of the port, so it
+        only works on POSIX systems with a selector event loop.
+
+        Args:
+            loop (asyncio.AbstractEventLoop): event loop to run on.
+            protocol (asyncio.Protocol): protocol receiving the data.
+            serport (serial.Serial): open serial port.
+        """
+        super().__init__()
+        self._loop = loop
+        self._protocol = protocol
+        self.serport = serport
+        self._fd = serport.fileno()
+        self._write_buff = bytearray()
+        self._closing = False
+        self._loop.add_reader(self._fd, self._read_ready)
+        self._loop.call_soon(protocol.connection_made, self)
+
+    def get_protocol(self) -> asyncio.BaseProtocol:
+        return self._protocol
+
+    def set_protocol(self, protocol: asyncio.BaseProtocol) -> None:
+        self._protocol = protocol
+
+    def is_closing(self) -> bool:
+        return self._closing
+
+    def write(self, data: Union[bytes, bytearray, memoryview]) -> None:
+        if self._closing:
+            return
+        if not self._write_buff:
+            try:
+                written = os.write(self._fd, data)
+            except (BlockingIOError, InterruptedError):
+                written = 0
+            except OSError as e:
+                self._fatal_error(e)
+                return
+            if written == len(data):
+                return
+            data = memoryview(data)[written:]
+            self._loop.add_writer(self._fd, self._write_ready)
+        self._write_buff += data
+
+    def get_write_buffer_size(self) -> int:
+        return len(self._write_buff)
+
+    def close(self) -> None:
+        if self._closing:
+            return
+        self._closing = True
+        self._loop.remove_reader(self._fd)
+        if not self._write_buff:
+            self._loop.call_soon(self._call_connection_lost, None)
+
+    def abort(self) -> None:
+        self._write_buff.clear()
+        self._loop.remove_writer(self._fd)
+        self.close()
+
+    def _read_ready(self) -> None:
+        try:
+            data = os.read(self._fd, READ_SIZE)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            self._fatal_error(e)
+            return
+        if data:
+            self._protocol.data_received(data)
+
+    def _write_ready(self) -> None:
+        try:
+            written = os.write(self._fd, self._write_buff)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            self._fatal_error(e)
+            return
+        del self._write_buff[:written]
+        if not self._write_buff:
+            self._loop.remove_writer(self._fd)
+            if self._closing:
+                self._call_connection_lost(None)
+
+    def _fatal_error(self, exc: Exception) -> None:
+        self._closing = True
+        self._write_buff.clear()
+        self._loop.remove_reader(self._fd)
+        self._loop.remove_writer(self._fd)
+        self._loop.call_soon(self._call_connection_lost, exc)
+
+    def _call_connection_lost(self, exc: Optional[Exception]) -> None:
+        try:
+            self._protocol.connection_lost(exc)
+        finally:
+            self.serport.close()
+
+
+class MCTRL300Protocol(asyncio.Protocol):
+    def __init__(self):
+        """Asyncio protocol matching MCTRL300 replies to their request by serial number."""
+        self.log = logging.getLogger(__name__)
+        self.transport: Optional[asyncio.Transport] = None
+        self._decoder = MCTRL300FrameDecoder(max_data_len=MCTRL300.MAX_FRAME_DATA_LEN)
+        self._pending: Dict[int, Tuple[asyncio.Future, int]] = {}
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        self.transport = transport
+
+    def data_received(self, data: bytes) -> None:
+        for reply in self._decoder.feed(data):
+            pending = self._pending.pop(reply.serno, None)
+            if pending is None:
+                self.log.warning('Dropped reply to unknown message %s.', reply.serno)
+                continue
+            future, reply_data_length = pending
+            if future.done():
+                continue
+            error = ack_error(reply.ack, reply.serno)
+            if error is None and len(reply.data) != reply_data_length:
+                error = MCTRL300IncorrectReplyError(reply)
+            if error:
+                future.set_exception(error)
+            else:
+                future.set_result(reply.data)
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        pending, self._pending = self._pending, {}
+        for future, _ in pending.values():
+            if not future.done():
+                future.set_exception(MCTRL300Error(exc or 'Connection closed.'))
+
+    def expect(self, serno: int, reply_data_length: int) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self._pending[serno] = (future, reply_data_length)
+        return future
+
+    def forget(self, serno: int) -> None:
+        self._pending.pop(serno, None)
+
+    def in_use(self, serno: int) -> bool:
+        return serno in self._pending
+
+
+async def open_serial_connection(port: str) -> Tuple[SerialTransport, MCTRL300Protocol]:
+    """Open the serial port to an MCTRL300 and connect an MCTRL300Protocol to it.
+
+    Args:
+        port (str): serial port, i.e. '/dev/ttyUSB0'.
+
+    Returns:
+        Tuple[SerialTransport, MCTRL300Protocol]: transport and protocol.
+    """
+    loop = asyncio.get_running_loop()
+    serport = Mctrl300Serial(port)
+    serport.reset_input_buffer()
+    protocol = MCTRL300Protocol()
+    transport = SerialTransport(loop, protocol, serport)
+    await asyncio.sleep(0)  # let connection_made run
+    return transport, protocol
+
+
+class AsyncMCTRL300:
+    REG_TEST_PATTERN = MCTRL300.REG_TEST_PATTERN
+    REG_BRIGHTNESS_OVERALL = MCTRL300.REG_BRIGHTNESS_OVERALL
+    PATTERN_NORMAL = MCTRL300.PATTERN_NORMAL
+    MAX_FRAME_DATA_LEN = MCTRL300.MAX_FRAME_DATA_LEN
+    MAX_BLOCK_LEN = MCTRL300.MAX_BLOCK_LEN
+
+    def __init__(
+        self,
+        transport: asyncio.Transport,
+        protocol: MCTRL300Protocol,
+        timeout: float = 1,
+        window: int = 16,
+    ):
+        """Asyncio client for the Novastar MCTRL300 LED controller.
+
+        Every call waits for the ACK or data reply of its own frames only, so many calls (on one or
+        more controllers) can be outstanding at the same time. Use AsyncMCTRL300.open to connect.
+
+        Args:
+            transport (asyncio.Transport): transport to the controller.
+            protocol (MCTRL300Protocol): protocol connected to the transport.
+            timeout (float, optional): seconds to wait for each reply. Defaults to 1.
+            window (int, optional): max number of outstanding frames, 1 to 255. Defaults to 16.
+        """
+        if not 1 <= window <= MAX_WINDOW:
+            msg = f'window should be 1 to {MAX_WINDOW}, not {window}'
+            raise ValueError(msg)
+        self.log = logging.getLogger(__name__)
+        self.transport = transport
+        self.protocol = protocol
+        self.timeout = timeout
+        self.creator = MCTRL300CreateCommand()
+        self._slots = asyncio.Semaphore(window)
+        self._msg_id = 0
+
+    @classmethod
+    async def open(cls, port: str, **kwargs) -> 'AsyncMCTRL300':  # noqa: A003
+        """Open the serial port and return a connected client.
+
+        Args:
+            port (str): serial port, i.e. '/dev/ttyUSB0'.
+            kwargs: passed to AsyncMCTRL300.
+        """
+        transport, protocol = await open_serial_connection(port)
+        return cls(transport, protocol, **kwargs)
+
+    async def close(self) -> None:
+        self.transport.close()
+
+    async def __aenter__(self) -> 'AsyncMCTRL300':
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    async def set_pattern(self, pattern: int, port: int, board: Optional[int] = None) -> None:
+        """Activate an internal test pattern, see MCTRL300.set_pattern."""
+        await self._write_frame(port, self.REG_TEST_PATTERN, pattern, board)
+
+    async def deactivate_pattern(self, port: int, board: Optional[int] = None) -> None:
+        """Deactivate test pattern on port, see MCTRL300.deactivate_pattern."""
+        await self._write_frame(port, self.REG_TEST_PATTERN, self.PATTERN_NORMAL, board)
+
+    async def set_brightness(self, port: int, value: int, board: Optional[int] = None) -> None:
+        """Set brightness of screen on port, see MCTRL300.set_brightness."""
+        await self._write_frame(port, self.REG_BRIGHTNESS_OVERALL, value, board)
+
+    async def get_brightness(self, port: int, board: Optional[int] = None) -> Union[int, None]:
+        response = await self._read_frame(port, self.REG_BRIGHTNESS_OVERALL, 1, board)
+        return response[0] if response else None
+
+    async def write_block(
+        self,
+        port: int,
+        reg_addr: int,
+        data: Union[bytes, bytearray, memoryview],
+        board: Optional[int] = None,
+    ) -> None:
+        """Write consecutive registers, see MCTRL300.write_block. Frames are pipelined."""
+        block = bytes(data)
+        self._check_block_len(len(block))
+        await asyncio.gather(
+            *(
+                self._write_frame(
+                    port,
+                    reg_addr + offset,
+                    block[offset : offset + self.MAX_FRAME_DATA_LEN],
+                    board,
+                )
+                for offset in range(0, len(block), self.MAX_FRAME_DATA_LEN)
+            ),
+        )
+
+    async def read_block(
+        self,
+        port: int,
+        reg_addr: int,
+        length: int,
+        board: Optional[int] = None,
+    ) -> bytes:
+        """Read consecutive registers, see MCTRL300.read_block. Frames are pipelined."""
+        self._check_block_len(length)
+        chunks: List[bytes] = await asyncio.gather(
+            *(
+                self._read_frame(
+                    port,
+                    reg_addr + offset,
+                    min(self.MAX_FRAME_DATA_LEN, length - offset),
+                    board,
+                )
+                for offset in range(0, length, self.MAX_FRAME_DATA_LEN)
+            ),
+        )
+        return b''.join(chunks)
+
+    def _check_block_len(self, length: int) -> None:
+        if not 0 < length <= self.MAX_BLOCK_LEN:
+            msg = f'Block length should be 1 to {self.MAX_BLOCK_LEN} bytes, not {length}.'
+            raise ValueError(msg)
+
+    async def _write_frame(
+        self,
+        port: int,
+        reg_addr: int,
+        data: Union[int, bytes],
+        board: Optional[int] = None,
+    ) -> None:
+        data_len = 1 if isinstance(data, int) else len(data)
+        await self._transact(port, reg_addr, data_len, data, is_write=True, board=board)
+
+    async def _read_frame(
+        self,
+        port: int,
+        reg_addr: int,
+        length: int,
+        board: Optional[int] = None,
+    ) -> bytes:
+        return await self._transact(port, reg_addr, length, None, is_write=False, board=board)
+
+    async def _transact(
+        self,
+        port: int,
+        reg_addr: int,
+        data_len: int,
+        data: Union[int, bytes, None],
+        is_write: bool,
+        board: Optional[int] = None,
+    ) -> bytes:
+        if self.transport.is_closing():
+            msg = 'Connection closed.'
+            raise MCTRL300Error(msg)
+        async with self._slots:
+            serno = self._next_msg_id()
+            cmd = self.creator.generate(
+                serno=serno,
+                port=port,
+                reg_addr=reg_addr,
+                data_len=data_len,
+                data=data,
+                is_write=is_write,
+                board=board,
+            )
+            future = self.protocol.expect(serno, 0 if is_write else data_len)
+            self.transport.write(cmd)
+            try:
+                return await asyncio.wait_for(future, self.timeout)
+            except asyncio.TimeoutError:
+                self.log.error('No reply to message %s.', serno)
+                raise MCTRL300NoReplyError(serno, self.timeout) from None
+            finally:
+                self.protocol.forget(serno)
+
+    def _next_msg_id(self) -> int:
+        while self.protocol.in_use(self._msg_id):
+            self._msg_id = (self._msg_id + 1) & 0xFF
+        serno = self._msg_id
+        self._msg_id = (self._msg_id + 1) & 0xFF
+        return serno
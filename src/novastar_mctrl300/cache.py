@@ -0,0 +1,93 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+
+__author__ = 'Dieter Vansteenwegen'
+__project__ = 'Novastar_MCTRL300_basic_controller'
+__project_link__ = 'https://github.com/dietervansteenwegen/Novastar_MCTRL300_basic_controller'
+
+import threading
+from time import monotonic
+from typing import Dict, Optional, Tuple
+
+BROADCAST = 0xFFFF  # board address of commands to all receiving cards on a port
+
+
+class MCTRL300RegisterCache:
+    def __init__(self, ttl: float = 1):
+        """Shadow copy of the controller registers, byte per (port, board, register).
+
+        A value is fresh for ttl seconds after it was read from or written to the controller.
+        Changes made by other software (i.e. NovaLCT) are only seen after the value expired.
+
+        Args:
+            ttl (float, optional): seconds a cached value is trusted. Defaults to 1.
+        """
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[int, int, int], Tuple[int, float]] = {}  # key: (value, stored)
+        self.hits = 0
+        self.misses = 0
+        self.skipped_writes = 0
+
+    def get(self, port: int, board: int, reg_addr: int, length: int) -> Optional[bytes]:
+        """Return the cached registers, None if any of them is missing or expired."""
+        oldest = monotonic() - self.ttl
+        data = bytearray()
+        with self._lock:
+            for addr in range(reg_addr, reg_addr + length):
+                cached = self._values.get((port, board, addr))
+                if cached is None or cached[1] < oldest:
+                    self.misses += 1
+                    return None
+                data.append(cached[0])
+            self.hits += 1
+        return bytes(data)
+
+    def put(self, port: int, board: int, reg_addr: int, data: bytes) -> None:
+        """Store registers read from or written to the controller."""
+        now = monotonic()
+        with self._lock:
+            for offset, value in enumerate(data):
+                self._values[(port, board, reg_addr + offset)] = (value, now)
+
+    def unchanged(self, port: int, board: int, reg_addr: int, data: bytes) -> bool:
+        """Check whether writing data would not change the (fresh) cached registers.
+
+        Counts the write as skipped if so.
+        """
+        if self.get(port, board, reg_addr, len(data)) != data:
+            return False
+        with self._lock:
+            self.skipped_writes += 1
+        return True
+
+    def invalidate(
+        self,
+        port: Optional[int] = None,
+        board: Optional[int] = None,
+        reg_addr: Optional[int] = None,
+        length: int = 1,
+    ) -> None:
+        """Forget cached registers, all of them if called without arguments.
+
+        Args:
+            port (Optional[int], optional): only forget registers of this port. Defaults to None.
+            board (Optional[int], optional): only forget registers of this board.
+                                    Defaults to None.
+            reg_addr (Optional[int], optional): only forget length registers starting here.
+                                    Defaults to None.
+            length (int, optional): number of registers from reg_addr. Defaults to 1.
+        """
+        with self._lock:
+            if port is None and board is None and reg_addr is None:
+                self._values.clear()
+                return
+            end = None if reg_addr is None else reg_addr + length
+            for key in [
+                k
+                for k in self._values
+                if (port is None or k[0] == port)
+                and (board is None or k[1] == board)
+                and (reg_addr is None or reg_addr <= k[2] < end)
+            ]:
+                del self._values[key]
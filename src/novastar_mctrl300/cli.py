@@ -0,0 +1,356 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+"""Command line interface for the MCTRL300, without GUI (and without importing Qt).
+
+    python -m novastar_mctrl300 ports
+    python -m novastar_mctrl300 discover
+    python -m novastar_mctrl300 -d /dev/ttyUSB0 pattern 1 red
+    python -m novastar_mctrl300 -d /dev/ttyUSB0 brightness 1 40
+    python -m novastar_mctrl300 -d /dev/ttyUSB0 brightness 1
+    python -m novastar_mctrl300 -d /dev/ttyUSB0 read 1 0x02000001 4
+    python -m novastar_mctrl300 -d /dev/ttyUSB0 scan
+    python -m novastar_mctrl300 -d /dev/ttyUSB0 snapshot setup.json -r 1:0x02000001:2
+    python -m novastar_mctrl300 -d /dev/ttyUSB0 restore setup.json
+    python -m novastar_mctrl300 -d /dev/ttyUSB0 batch commands.txt
+    python -m novastar_mctrl300 -d /dev/ttyUSB0 daemon --listen 127.0.0.1:9301
+    python -m novastar_mctrl300 -d /dev/ttyUSB0 --trace show.trace brightness 1 40
+
+A batch file (or stdin with '-') has one command per line, with the same syntax as the pattern,
+brightness and read commands above, plus 'sleep SECONDS'. Blank lines and lines starting with # are
+skipped. All commands of a batch use the same connection.
+"""
+
+__author__ = 'Dieter Vansteenwegen'
+__project__ = 'Novastar_MCTRL300_basic_controller'
+__project_link__ = 'https://github.com/dietervansteenwegen/Novastar_MCTRL300_basic_controller'
+
+import argparse
+import contextlib
+import logging
+import os
+import shlex
+import sys
+from time import sleep
+from typing import List, Optional, TextIO
+
+# the driver is imported when a command needs it, so `ports` and `--help` stay fast
+
+DEFAULT_DEVICE = '/dev/ttyUSB0'
+DEVICE_ENV = 'MCTRL300_PORT'
+
+
+class CLIError(Exception):
+    pass
+
+
+class _BatchArgumentParser(argparse.ArgumentParser):
+    def error(self, message: str) -> None:
+        """Raise instead of exiting, a bad line in a batch should not end the process."""
+        raise CLIError(message)
+
+
+def _int(value: str) -> int:
+    """Parse decimal or 0x prefixed hexadecimal numbers."""
+    return int(value, 0)
+
+
+def _range(value: str):
+    """Parse OUTPUT:REGISTER:LENGTH[:BOARD] into a snapshot.RegisterRange."""
+    from novastar_mctrl300.snapshot import RegisterRange
+
+    try:
+        fields = [int(f, 0) for f in value.split(':')]
+        if len(fields) not in (3, 4):
+            raise ValueError
+    except ValueError:
+        msg = f'{value!r} is not OUTPUT:REGISTER:LENGTH[:BOARD]'
+        raise argparse.ArgumentTypeError(msg) from None
+    return RegisterRange(*fields)
+
+
+def _pattern(value: str) -> int:
+    """Parse a pattern name (i.e. 'red', see MCTRL300.PATTERN_*) or number."""
+    from novastar_mctrl300.mctrl300 import MCTRL300
+
+    try:
+        return int(value, 0)
+    except ValueError:
+        pass
+    pattern = getattr(MCTRL300, f'PATTERN_{value.upper()}', None)
+    if pattern is None:
+        msg = f'unknown pattern {value!r}, use a number or one of {", ".join(pattern_names())}'
+        raise argparse.ArgumentTypeError(msg)
+    return pattern
+
+
+def pattern_names() -> List[str]:
+    from novastar_mctrl300.mctrl300 import MCTRL300
+
+    return [name[8:].lower() for name in vars(MCTRL300) if name.startswith('PATTERN_')]
+
+
+def _add_screen_commands(subparsers: argparse._SubParsersAction) -> None:
+    """Add the commands that can be used on the command line as well as in a batch."""
+    pattern = subparsers.add_parser('pattern', help='activate a test pattern')
+    pattern.add_argument('output', type=int, help='output of the controller, 1 or 2')
+    pattern.add_argument('pattern', type=_pattern, help='pattern name (i.e. red) or number')
+    pattern.set_defaults(func=cmd_pattern)
+
+    brightness = subparsers.add_parser('brightness', help='set or read the brightness')
+    brightness.add_argument('output', type=int, help='output of the controller, 1 or 2')
+    brightness.add_argument('value', type=_int, nargs='?', help='0 to 255, read if omitted')
+    brightness.set_defaults(func=cmd_brightness)
+
+    read = subparsers.add_parser('read', help='read registers, printed as hex')
+    read.add_argument('output', type=int, help='output of the controller, 1 or 2')
+    read.add_argument('reg_addr', type=_int, help='address of the first register')
+    read.add_argument('length', type=_int, nargs='?', default=1, help='number of bytes')
+    read.set_defaults(func=cmd_read)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog='python -m novastar_mctrl300',
+        description=__doc__.splitlines()[0],
+    )
+    parser.add_argument(
+        '-d',
+        '--device',
+        default=os.environ.get(DEVICE_ENV, DEFAULT_DEVICE),
+        help=f'serial port of the controller (default ${DEVICE_ENV} or {DEFAULT_DEVICE})',
+    )
+    parser.add_argument('--ack', action='store_true', help='wait for the ACK of every write')
+    parser.add_argument('--timeout', type=float, default=1, help='seconds to wait for replies')
+    parser.add_argument(
+        '--retries',
+        type=int,
+        default=2,
+        help='times to retry a command without (valid) reply, 0 to fail immediately',
+    )
+    parser.add_argument('--trace', metavar='FILE', help='record the serial traffic to FILE')
+    parser.add_argument('-v', '--verbose', action='count', default=0, help='more logging')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    ports = subparsers.add_parser('ports', help='list serial ports, * marks likely MCTRL300s')
+    ports.set_defaults(func=cmd_ports)
+
+    discover = subparsers.add_parser('discover', help='probe serial ports for MCTRL300s')
+    discover.add_argument('devices', nargs='*', help='ports to probe (default: CP2102 ports)')
+    discover.add_argument(
+        '--all',
+        action='store_true',
+        help='probe every port, also those of other devices',
+    )
+    discover.set_defaults(func=cmd_discover)
+
+    _add_screen_commands(subparsers)
+
+    scan = subparsers.add_parser('scan', help='list the receiving cards and their registers')
+    scan.add_argument('outputs', type=int, nargs='*', default=[1, 2], help='default: 1 2')
+    scan.add_argument('--max-boards', type=int, default=1024, help='max cards per output')
+    scan.add_argument('--window', type=int, default=16, help='max outstanding reads')
+    scan.set_defaults(func=cmd_scan)
+
+    snapshot = subparsers.add_parser('snapshot', help='save registers to a file')
+    snapshot.add_argument('file', help='.json for JSON, binary otherwise')
+    snapshot.add_argument(
+        '-r',
+        '--range',
+        type=_range,
+        action='append',
+        dest='ranges',
+        metavar='OUTPUT:REG:LEN[:BOARD]',
+        help='registers to save, can be repeated (default: pattern and brightness of 1 and 2)',
+    )
+    snapshot.set_defaults(func=cmd_snapshot)
+
+    restore = subparsers.add_parser('restore', help='write the registers that differ from a file')
+    restore.add_argument('file', help='file saved with snapshot')
+    restore.add_argument('-n', '--dry-run', action='store_true', help='only print the writes')
+    restore.set_defaults(func=cmd_restore)
+
+    batch = subparsers.add_parser('batch', help='run the commands in a file, - for stdin')
+    batch.add_argument('file', type=argparse.FileType('r'), help='file with one command per line')
+    batch.add_argument('-k', '--keep-going', action='store_true', help="don't stop on errors")
+    batch.set_defaults(func=cmd_batch)
+
+    daemon = subparsers.add_parser('daemon', help='share the controller with several clients')
+    daemon.add_argument('--listen', default='127.0.0.1:9301', help='TCP HOST:PORT to listen on')
+    daemon.add_argument('--unix', help='listen on this Unix socket instead of TCP')
+    daemon.add_argument('--cache-ttl', type=float, default=1, help='0 to disable the cache')
+    daemon.set_defaults(func=cmd_daemon)
+    return parser
+
+
+def build_batch_parser() -> argparse.ArgumentParser:
+    parser = _BatchArgumentParser(prog='batch', add_help=False)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    _add_screen_commands(subparsers)
+    sleep_cmd = subparsers.add_parser('sleep', help='wait a number of seconds')
+    sleep_cmd.add_argument('seconds', type=float)
+    sleep_cmd.set_defaults(func=cmd_sleep)
+    return parser
+
+
+def connect(args: argparse.Namespace):
+    """Open the controller on args.device, reusing the connection of a batch."""
+    if getattr(args, 'screen', None) is None:
+        from novastar_mctrl300.mctrl300 import MCTRL300, RetryPolicy
+        from novastar_mctrl300.serports import Mctrl300Serial
+        from novastar_mctrl300.trace import TraceRecorder
+
+        args.screen = MCTRL300(
+            Mctrl300Serial(args.device),
+            wait_for_ack=args.ack,
+            ack_timeout=args.timeout,
+            retry=RetryPolicy(retries=args.retries) if args.retries else None,
+            trace=TraceRecorder(args.trace) if args.trace else None,
+        )
+    return args.screen
+
+
+def cmd_ports(args: argparse.Namespace, out: TextIO) -> None:
+    from novastar_mctrl300.serports import get_available_ports, is_controller_port
+
+    for port in get_available_ports():
+        marker = '*' if is_controller_port(port) else ' '
+        out.write(f'{marker} {port[1]}\t{port[2] or ""}\t{port[3] or ""}\n')
+
+
+def cmd_discover(args: argparse.Namespace, out: TextIO) -> None:
+    from novastar_mctrl300.discovery import discover
+
+    for c in discover(args.devices or None, timeout=args.timeout, candidates_only=not args.all):
+        out.write(f'{c.device}\t{c.latency * 1000:.1f} ms\tbrightness {c.brightness}\n')
+
+
+def cmd_pattern(args: argparse.Namespace, out: TextIO) -> None:
+    connect(args).set_pattern(args.pattern, args.output)
+
+
+def cmd_brightness(args: argparse.Namespace, out: TextIO) -> None:
+    screen = connect(args)
+    if args.value is None:
+        out.write(f'{screen.get_brightness(args.output)}\n')
+    else:
+        screen.set_brightness(args.output, args.value)
+
+
+def cmd_read(args: argparse.Namespace, out: TextIO) -> None:
+    data = connect(args).read_block(args.output, args.reg_addr, args.length)
+    out.write(f'{data.hex(" ").upper()}\n')
+
+
+def cmd_scan(args: argparse.Namespace, out: TextIO) -> None:
+    from novastar_mctrl300.pipeline import MCTRL300Pipeline
+    from novastar_mctrl300.serports import Mctrl300Serial
+    from novastar_mctrl300.topology import scan
+
+    with Mctrl300Serial(args.device) as serport:
+        pipeline = MCTRL300Pipeline(serport, window=args.window, timeout=args.timeout)
+        try:
+            topology = scan(pipeline, ports=args.outputs, max_boards=args.max_boards)
+        finally:
+            pipeline.close()
+    for card in topology:
+        values = [f'0x{reg:08X}={data.hex().upper()}' for reg, data in card.registers.items()]
+        values += [f'0x{reg:08X}:{type(e).__name__}' for reg, e in card.errors.items()]
+        out.write(f'{card.port}\t{card.board}\t{" ".join(values)}\n')
+
+
+def cmd_snapshot(args: argparse.Namespace, out: TextIO) -> None:
+    from novastar_mctrl300.snapshot import DEFAULT_RANGES, MCTRL300Snapshot
+
+    snapshot = MCTRL300Snapshot.take(connect(args), args.ranges or DEFAULT_RANGES)
+    snapshot.save(args.file)
+    out.write(f'Saved {len(snapshot)} ranges to {args.file}\n')
+
+
+def cmd_restore(args: argparse.Namespace, out: TextIO) -> None:
+    from novastar_mctrl300.snapshot import MCTRL300Snapshot
+
+    writes = MCTRL300Snapshot.load(args.file).restore(connect(args), dry_run=args.dry_run)
+    for w in writes:
+        board = 'all' if w.board is None else w.board
+        out.write(f'{w.port}\t{board}\t0x{w.reg_addr:08X}\t{w.data.hex(" ").upper()}\n')
+
+
+def cmd_sleep(args: argparse.Namespace, out: TextIO) -> None:
+    sleep(args.seconds)
+
+
+def cmd_batch(args: argparse.Namespace, out: TextIO) -> None:
+    import serial
+
+    from novastar_mctrl300.mctrl300 import MCTRL300Error
+
+    parser = build_batch_parser()
+    errors = 0
+    with args.file:
+        for lineno, line in enumerate(args.file, start=1):
+            words = shlex.split(line, comments=True)
+            if not words:
+                continue
+            cmd = argparse.Namespace(**vars(args))
+            try:
+                parser.parse_args(words, namespace=cmd)
+                cmd.func(cmd, out)
+            except (CLIError, MCTRL300Error, serial.SerialException, ValueError) as e:
+                errors += 1
+                msg = f'line {lineno}: {line.strip()}: {e}'
+                if not args.keep_going:
+                    raise CLIError(msg) from e
+                sys.stderr.write(f'{msg}\n')
+            finally:
+                args.screen = cmd.screen  # keep the connection for the next line
+            out.flush()
+    if errors:
+        msg = f'{errors} command(s) failed'
+        raise CLIError(msg)
+
+
+def cmd_daemon(args: argparse.Namespace, out: TextIO) -> None:
+    import asyncio
+
+    from novastar_mctrl300.daemon import serve
+
+    host, _, port = args.listen.rpartition(':')
+    with contextlib.suppress(KeyboardInterrupt):
+        asyncio.run(
+            serve(
+                args.device,
+                host=host,
+                port=int(port),
+                unix_path=args.unix,
+                cache_ttl=args.cache_ttl or None,
+                timeout=args.timeout,
+            ),
+        )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(
+        level=max(logging.DEBUG, logging.WARNING - 10 * args.verbose),
+        format='%(levelname)s %(name)s: %(message)s',
+    )
+    import serial
+
+    from novastar_mctrl300.mctrl300 import MCTRL300Error
+
+    args.screen = None
+    try:
+        args.func(args, sys.stdout)
+    except (CLIError, MCTRL300Error, serial.SerialException, ValueError) as e:
+        sys.stderr.write(f'error: {e}\n')
+        return 1
+    finally:
+        if args.screen is not None:
+            args.screen.serport.close()
+            if args.screen.trace is not None:
+                args.screen.trace.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
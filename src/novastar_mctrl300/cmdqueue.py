@@ -0,0 +1,151 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+
+__author__ = 'Dieter Vansteenwegen'
+__project__ = 'Novastar_MCTRL300_basic_controller'
+__project_link__ = 'https://github.com/dietervansteenwegen/Novastar_MCTRL300_basic_controller'
+
+import collections
+import itertools
+import threading
+from time import monotonic
+from typing import Any, Deque, Dict, Hashable, NamedTuple, Optional, Tuple
+
+from novastar_mctrl300.mctrl300 import MCTRL300
+
+
+class QueuedCommand(NamedTuple):
+    name: str  # name of the MCTRL300 method to call
+    args: Tuple[Any, ...]
+
+
+class MCTRL300CommandQueue:
+    def __init__(self):
+        """Thread-safe command queue in front of an MCTRL300, latest value wins.
+
+        Pending writes to the same (port, register, board) are collapsed into the newest one,
+        keeping the position of the first unless a write to all boards (board None) of that
+        register was queued after it; a write to all boards also replaces pending writes to single
+        boards. Safety-critical commands (back to PATTERN_NORMAL, brightness 0) are put ahead of
+        all queued writes and replace pending writes to the same register of the same board, or of
+        any board if they are sent to all boards (board None). Other commands (i.e. reads) are
+        executed in order.
+        """
+        self._cond = threading.Condition()
+        self._priority: Deque[QueuedCommand] = collections.deque()
+        self._pending: Dict[Hashable, QueuedCommand] = collections.OrderedDict()
+        self._unique = itertools.count()
+        self._closed = False
+        self.coalesced = 0  # number of commands that were replaced by a newer one
+
+    def put(self, name: str, *args) -> None:
+        """Queue a call to MCTRL300.<name>(*args).
+
+        Args:
+            name (str): name of the MCTRL300 method, i.e. 'set_brightness'.
+            args: arguments for the method.
+        """
+        cmd = QueuedCommand(name, args)
+        key, priority = self._classify(cmd)
+        with self._cond:
+            if priority:
+                # supersedes queued writes to the same register
+                for queued_key in [k for k in self._pending if self._supersedes(key, k)]:
+                    del self._pending[queued_key]
+                    self.coalesced += 1
+                for queued in list(self._priority):
+                    if self._supersedes(key, self._classify(queued)[0]):
+                        self._priority.remove(queued)
+                        self.coalesced += 1
+                self._priority.append(cmd)
+            elif key is not None:
+                self._coalesce(key, cmd)
+            else:
+                self._pending[('unique', next(self._unique))] = cmd
+            self._cond.notify()
+
+    def get(self, timeout: Optional[float] = None) -> Optional[QueuedCommand]:
+        """Take the next command, blocking until one is available.
+
+        Args:
+            timeout (Optional[float], optional): max seconds to wait. Defaults to None (forever).
+
+        Returns:
+            Optional[QueuedCommand]: next command, None on timeout or when the queue is closed.
+        """
+        deadline = None if timeout is None else monotonic() + timeout
+        with self._cond:
+            while not (self._priority or self._pending or self._closed):
+                remaining = None if deadline is None else deadline - monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+            if self._priority:
+                return self._priority.popleft()
+            if self._pending:
+                return self._pending.popitem(last=False)[1]
+            return None
+
+    def clear(self) -> None:
+        """Drop all queued commands."""
+        with self._cond:
+            self._priority.clear()
+            self._pending.clear()
+
+    def close(self) -> None:
+        """Drop all queued commands and wake up all waiting consumers, get returns None."""
+        with self._cond:
+            self._closed = True
+            self._priority.clear()
+            self._pending.clear()
+            self._cond.notify_all()
+
+    def __len__(self) -> int:
+        with self._cond:
+            return len(self._priority) + len(self._pending)
+
+    @staticmethod
+    def _classify(cmd: QueuedCommand) -> Tuple[Optional[Hashable], bool]:
+        """Return the coalescing key (None if the command can't be coalesced) and priority.
+
+        The key is (port, register, board), board None for all boards.
+        """
+        if cmd.name == 'set_pattern':
+            pattern, port, board = (*cmd.args, None)[:3]
+            return (port, MCTRL300.REG_TEST_PATTERN, board), pattern == MCTRL300.PATTERN_NORMAL
+        if cmd.name == 'deactivate_pattern':
+            port, board = (*cmd.args, None)[:2]
+            return (port, MCTRL300.REG_TEST_PATTERN, board), True
+        if cmd.name == 'set_brightness':
+            port, value, board = (*cmd.args, None)[:3]
+            return (port, MCTRL300.REG_BRIGHTNESS_OVERALL, board), value == 0
+        return None, False
+
+    def _coalesce(self, key: Hashable, cmd: QueuedCommand) -> None:
+        """Queue a write that can be coalesced, with the lock held."""
+        overlapping = [k for k in self._pending if self._overlaps(key, k)]
+        for queued_key in overlapping:
+            if queued_key != key and self._supersedes(key, queued_key):
+                del self._pending[queued_key]
+                self.coalesced += 1
+        remaining = [k for k in overlapping if k in self._pending]
+        if remaining and remaining[-1] == key:  # no later write to the same register in between
+            self._pending[key] = cmd
+            self.coalesced += 1
+            return
+        if key in self._pending:
+            del self._pending[key]
+            self.coalesced += 1
+        self._pending[key] = cmd
+
+    @staticmethod
+    def _overlaps(key: Hashable, other: Optional[Hashable]) -> bool:
+        """Check whether the writes with keys key and other change the same register of a board."""
+        if key is None or other is None or other[0] == 'unique':
+            return False
+        return key[:2] == other[:2] and (None in (key[2], other[2]) or key[2] == other[2])
+
+    @classmethod
+    def _supersedes(cls, key: Hashable, other: Optional[Hashable]) -> bool:
+        """Check whether a write with key makes a queued write with key other obsolete."""
+        return cls._overlaps(key, other) and key[2] in (None, other[2])
@@ -0,0 +1,340 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+"""Daemon that owns the serial port of an MCTRL300 and shares it with several clients.
+
+Clients connect over TCP (default 127.0.0.1:9301) or a Unix socket and send one JSON request per
+line. Every reply is one JSON line with the id of its request:
+
+    {"id": 1, "op": "pattern", "port": 1, "pattern": 2}     -> {"id": 1, "ok": true}
+    {"id": 2, "op": "brightness", "port": 1, "value": 40}   -> {"id": 2, "ok": true}
+    {"id": 3, "op": "brightness", "port": 1}                -> {"id": 3, "ok": true, "value": 40}
+    {"id": 4, "op": "read", "port": 1, "reg": 33554433, "length": 2}
+                                                    -> {"id": 4, "ok": true, "data": "2800"}
+    {"id": 5, "op": "write", "port": 1, "reg": 33554433, "data": "28"}
+                                                    -> {"id": 5, "ok": true}
+    errors                      -> {"id": 5, "ok": false, "error": "MCTRL300NoReplyError", ...}
+
+Every request can have a "board" (receiving card, 0 based), without it all cards are addressed.
+
+Requests of all clients are sent in the order they arrive, pipelined over the one serial port, so
+replies can come back out of order. Reads are served from a shared register cache when fresh.
+"""
+
+__author__ = 'Dieter Vansteenwegen'
+__project__ = 'Novastar_MCTRL300_basic_controller'
+__project_link__ = 'https://github.com/dietervansteenwegen/Novastar_MCTRL300_basic_controller'
+
+import asyncio
+import itertools
+import json
+import logging
+import socket
+from typing import Any, Dict, Optional, Set, Tuple, Union
+
+from novastar_mctrl300.aio import AsyncMCTRL300
+from novastar_mctrl300.cache import BROADCAST, MCTRL300RegisterCache
+from novastar_mctrl300.mctrl300 import MCTRL300, MCTRL300Error
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 9301
+CACHE_TTL = 1
+MAX_LINE = 256 * 1024  # a block of MAX_BLOCK_LEN bytes is 128 kB of hex
+
+
+class MCTRL300RemoteError(MCTRL300Error):
+    """The daemon could not execute a request."""
+
+    def __init__(self, error: str, message: str):
+        super().__init__(f'{error}: {message}')
+        self.error = error  # name of the exception raised in the daemon
+
+
+class MCTRL300Daemon:
+    def __init__(self, screen: AsyncMCTRL300, cache_ttl: Optional[float] = CACHE_TTL):
+        """Execute the JSON requests of connected clients on one AsyncMCTRL300.
+
+        Args:
+            screen (AsyncMCTRL300): connected controller.
+            cache_ttl (Optional[float], optional): seconds a register value read or written by any
+                                    client is served from the cache, None to always ask the
+                                    controller. Defaults to CACHE_TTL.
+        """
+        self.log = logging.getLogger(__name__)
+        self.screen = screen
+        self.cache = None if cache_ttl is None else MCTRL300RegisterCache(cache_ttl)
+        self.clients = 0
+        # Requests are pipelined, so a write can be in flight while another request for the same
+        # registers starts or completes. Per (port, register): writes sent but not yet acknowledged,
+        # and the sequence number of the last write sent.
+        self._pending: Dict[Tuple[int, int], int] = {}
+        self._written: Dict[Tuple[int, int], int] = {}
+        self._write_seq = 0
+
+    async def handle_client(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        """Serve one client connection, for asyncio.start_server."""
+        peer = writer.get_extra_info('peername') or 'unix socket'
+        self.clients += 1
+        self.log.info('Client %s connected, %s clients.', peer, self.clients)
+        drain_lock = asyncio.Lock()
+        tasks: Set[asyncio.Future] = set()
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, ConnectionError):  # line too long or connection reset
+                    break
+                if not line:
+                    break
+                task = asyncio.ensure_future(self._serve(line, writer, drain_lock))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                await asyncio.sleep(0)  # let the task send its frame, keeps the requests in order
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            self.clients -= 1
+            self.log.info('Client %s disconnected.', peer)
+            writer.close()
+
+    async def _serve(
+        self,
+        line: bytes,
+        writer: asyncio.StreamWriter,
+        drain_lock: asyncio.Lock,
+    ) -> None:
+        reply: Dict[str, Any] = {'id': None}
+        try:
+            request = json.loads(line)
+            reply['id'] = request.get('id')
+            reply.update(await self.execute(request))
+            reply['ok'] = True
+        except (MCTRL300Error, KeyError, TypeError, ValueError, AttributeError) as e:
+            reply.update(ok=False, error=type(e).__name__, message=str(e))
+        if writer.is_closing():
+            return
+        writer.write(json.dumps(reply).encode() + b'\n')
+        async with drain_lock:
+            await writer.drain()
+
+    async def execute(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Execute one request.
+
+        Args:
+            request (Dict[str, Any]): decoded JSON request, see the module docstring.
+
+        Returns:
+            Dict[str, Any]: result fields of the reply.
+        """
+        op = request['op']
+        port = int(request['port'])
+        board = None if request.get('board') is None else int(request['board'])
+        if op == 'pattern':
+            await self.write(port, MCTRL300.REG_TEST_PATTERN, bytes([request['pattern']]), board)
+            return {}
+        if op == 'brightness':
+            reg_addr = MCTRL300.REG_BRIGHTNESS_OVERALL
+            if request.get('value') is not None:
+                await self.write(port, reg_addr, bytes([request['value']]), board)
+                return {}
+            return {'value': (await self.read(port, reg_addr, 1, board))[0]}
+        if op == 'read':
+            length = int(request.get('length', 1))
+            data = await self.read(port, int(request['reg']), length, board)
+            return {'data': data.hex()}
+        if op == 'write':
+            await self.write(port, int(request['reg']), bytes.fromhex(request['data']), board)
+            return {}
+        msg = f'Unknown op {op!r}.'
+        raise ValueError(msg)
+
+    async def read(
+        self,
+        port: int,
+        reg_addr: int,
+        length: int,
+        board: Optional[int] = None,
+    ) -> bytes:
+        key = BROADCAST if board is None else board
+        if self.cache is None:
+            return await self.screen.read_block(port, reg_addr, length, board)
+        cached = self.cache.get(port, key, reg_addr, length)
+        if cached is not None:
+            return cached
+        started = self._write_seq
+        data = await self.screen.read_block(port, reg_addr, length, board)
+        # a write sent meanwhile may have changed the registers after they were read
+        regs = [(port, addr) for addr in range(reg_addr, reg_addr + length)]
+        if not any(self._pending.get(r) or self._written.get(r, 0) > started for r in regs):
+            self.cache.put(port, key, reg_addr, data)
+        return data
+
+    async def write(
+        self,
+        port: int,
+        reg_addr: int,
+        data: bytes,
+        board: Optional[int] = None,
+    ) -> None:
+        if self.cache is None:
+            await self.screen.write_block(port, reg_addr, data, board)
+            return
+        key = BROADCAST if board is None else board
+        regs = [(port, addr) for addr in range(reg_addr, reg_addr + len(data))]
+        # the cache does not show the result of writes in flight, those may still fail
+        pending = any(self._pending.get(r) for r in regs)
+        if not pending and self.cache.unchanged(port, key, reg_addr, data):
+            return
+        self._write_seq += 1
+        seq = self._write_seq
+        for r in regs:
+            self._pending[r] = self._pending.get(r, 0) + 1
+            self._written[r] = seq
+        # see MCTRL300._write_frame, forget the registers before the frame is sent
+        self.cache.invalidate(port, reg_addr=reg_addr, length=len(data))
+        try:
+            await self.screen.write_block(port, reg_addr, data, board)
+        except BaseException:
+            self.cache.invalidate(port, reg_addr=reg_addr, length=len(data))
+            raise
+        finally:
+            for r in regs:
+                self._pending[r] -= 1
+                if not self._pending[r]:
+                    del self._pending[r]
+        if all(self._written[r] == seq for r in regs):  # no later write to these registers sent
+            self.cache.put(port, key, reg_addr, data)
+
+
+async def serve(
+    device: str,
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+    unix_path: Optional[str] = None,
+    cache_ttl: Optional[float] = CACHE_TTL,
+    **kwargs,
+) -> None:
+    """Open the controller on device and serve clients until cancelled.
+
+    Args:
+        device (str): serial port of the controller, i.e. '/dev/ttyUSB0'.
+        host (str, optional): address to listen on. Defaults to DEFAULT_HOST (local only).
+        port (int, optional): TCP port to listen on. Defaults to DEFAULT_PORT.
+        unix_path (Optional[str], optional): listen on this Unix socket instead of TCP.
+                                    Defaults to None.
+        cache_ttl (Optional[float], optional): see MCTRL300Daemon. Defaults to CACHE_TTL.
+        kwargs: passed to AsyncMCTRL300 (timeout, window).
+    """
+    log = logging.getLogger(__name__)
+    screen = await AsyncMCTRL300.open(device, **kwargs)
+    daemon = MCTRL300Daemon(screen, cache_ttl=cache_ttl)
+    try:
+        if unix_path:
+            server = await asyncio.start_unix_server(
+                daemon.handle_client,
+                unix_path,
+                limit=MAX_LINE,
+            )
+        else:
+            server = await asyncio.start_server(daemon.handle_client, host, port, limit=MAX_LINE)
+        log.info('Serving %s on %s.', device, unix_path or f'{host}:{port}')
+        async with server:
+            await server.serve_forever()
+    finally:
+        await screen.close()
+
+
+class MCTRL300Client:
+    def __init__(
+        self,
+        host: str = DEFAULT_HOST,
+        port: int = DEFAULT_PORT,
+        unix_path: Optional[str] = None,
+        timeout: float = 5,
+    ):
+        """Blocking client of MCTRL300Daemon, with the same methods as MCTRL300.
+
+        Args:
+            host (str, optional): address of the daemon. Defaults to DEFAULT_HOST.
+            port (int, optional): TCP port of the daemon. Defaults to DEFAULT_PORT.
+            unix_path (Optional[str], optional): Unix socket of the daemon, instead of TCP.
+                                    Defaults to None.
+            timeout (float, optional): seconds to wait for a reply. Defaults to 5.
+        """
+        if unix_path:
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._sock.settimeout(timeout)
+            self._sock.connect(unix_path)
+        else:
+            self._sock = socket.create_connection((host, port), timeout=timeout)
+        self._file = self._sock.makefile('rwb')
+        self._ids = itertools.count(1)
+
+    def close(self) -> None:
+        self._file.close()
+        self._sock.close()
+
+    def __enter__(self) -> 'MCTRL300Client':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def request(self, op: str, **params) -> Dict[str, Any]:
+        """Send one request and wait for its reply.
+
+        Raises:
+            MCTRL300RemoteError: the daemon could not execute the request.
+            MCTRL300Error: the connection to the daemon was closed.
+
+        Returns:
+            Dict[str, Any]: the reply.
+        """
+        request_id = next(self._ids)
+        self._file.write(json.dumps({'id': request_id, 'op': op, **params}).encode() + b'\n')
+        self._file.flush()
+        while True:
+            line = self._file.readline()
+            if not line:
+                msg = 'Connection to the daemon closed.'
+                raise MCTRL300Error(msg)
+            reply = json.loads(line)
+            if reply.get('id') == request_id:
+                break
+        if not reply['ok']:
+            raise MCTRL300RemoteError(reply['error'], reply['message'])
+        return reply
+
+    def set_pattern(self, pattern: int, port: int, board: Optional[int] = None) -> None:
+        self.request('pattern', port=port, pattern=pattern, board=board)
+
+    def deactivate_pattern(self, port: int, board: Optional[int] = None) -> None:
+        self.request('pattern', port=port, pattern=MCTRL300.PATTERN_NORMAL, board=board)
+
+    def set_brightness(self, port: int, value: int, board: Optional[int] = None) -> None:
+        self.request('brightness', port=port, value=value, board=board)
+
+    def get_brightness(self, port: int, board: Optional[int] = None) -> Union[int, None]:
+        return self.request('brightness', port=port, board=board)['value']
+
+    def write_block(
+        self,
+        port: int,
+        reg_addr: int,
+        data: Union[bytes, bytearray],
+        board: Optional[int] = None,
+    ) -> None:
+        self.request('write', port=port, reg=reg_addr, data=bytes(data).hex(), board=board)
+
+    def read_block(
+        self,
+        port: int,
+        reg_addr: int,
+        length: int,
+        board: Optional[int] = None,
+    ) -> bytes:
+        reply = self.request('read', port=port, reg=reg_addr, length=length, board=board)
+        return bytes.fromhex(reply['data'])
@@ -0,0 +1,148 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+
+__author__ = 'Dieter Vansteenwegen'
+__project__ = 'Novastar_MCTRL300_basic_controller'
+__project_link__ = 'https://github.com/dietervansteenwegen/Novastar_MCTRL300_basic_controller'
+
+from typing import List, NamedTuple, Union
+
+REPLY_HEADER = b'\xaa\x55'
+CMD_HEADER = b'\x55\xaa'
+PREFIX_LEN = 18  # header up to and including data length
+CHECKSUM_LEN = 2
+CHECKSUM_OFFSET = 0x5555
+
+_SYNC = 0
+_PREFIX = 1
+_BODY = 2
+
+
+class MCTRL300Reply(NamedTuple):
+    """A decoded frame, see assets/documentation/command_layout.md for the layout."""
+
+    ack: int
+    serno: int
+    src: int
+    dest: int
+    card_type: int
+    port: int
+    board: int
+    cmd_type: int
+    reg_addr: int
+    data_len: int
+    data: bytes
+
+
+class MCTRL300FrameDecoder:
+    def __init__(self, header: bytes = REPLY_HEADER, max_data_len: int = 0xFFFF):
+        """Incremental decoder for MCTRL300 frames.
+
+        Accepts arbitrary chunks of received bytes and returns every complete frame with a valid
+        checksum. Frames that fail the checksum are skipped one byte at a time, so a frame starting
+        inside the corrupted one is not lost.
+
+        Args:
+            header (bytes, optional): frame header to sync on. Defaults to REPLY_HEADER.
+            max_data_len (int, optional): frames announcing more data than this are treated as
+                                    noise. Defaults to 0xFFFF.
+        """
+        self.header = header
+        # replies carry data for reads (cmd type 0), commands carry data for writes (cmd type 1)
+        self._data_cmd_type = 0x00 if header == REPLY_HEADER else 0x01
+        self.max_data_len = max_data_len
+        self.checksum_errors = 0
+        self.discarded_bytes = 0
+        self.reset()
+
+    def reset(self) -> None:
+        """Drop all buffered bytes and start looking for a new header."""
+        self._buff = bytearray()
+        self._pos = 0
+        self._state = _SYNC
+        self._frame_len = 0
+
+    def feed(self, chunk: Union[bytes, bytearray, memoryview]) -> List[MCTRL300Reply]:
+        """Add received bytes to the decoder.
+
+        Args:
+            chunk (Union[bytes, bytearray, memoryview]): received bytes, any length.
+
+        Returns:
+            List[MCTRL300Reply]: frames completed by this chunk, in order of reception.
+        """
+        self._buff += chunk
+        frames = []
+        buff = self._buff
+        while True:
+            if self._state == _SYNC:
+                start = buff.find(self.header, self._pos)
+                if start < 0:
+                    # keep a trailing partial header byte
+                    keep = 1 if self._pos < len(buff) and buff[-1] == self.header[0] else 0
+                    self.discarded_bytes += len(buff) - self._pos - keep
+                    self._pos = len(buff) - keep
+                    break
+                self.discarded_bytes += start - self._pos
+                self._pos = start
+                self._state = _PREFIX
+            if self._state == _PREFIX:
+                if len(buff) - self._pos < PREFIX_LEN:
+                    break
+                data_len = buff[self._pos + 16] | buff[self._pos + 17] << 8
+                if data_len > self.max_data_len:
+                    self._resync()
+                    continue
+                has_data = buff[self._pos + 10] == self._data_cmd_type
+                self._frame_len = PREFIX_LEN + (data_len if has_data else 0) + CHECKSUM_LEN
+                self._state = _BODY
+            if len(buff) - self._pos < self._frame_len:
+                break
+            frame = self._check(self._pos, self._frame_len)
+            if frame is None:
+                self.checksum_errors += 1
+                self._resync()
+                continue
+            frames.append(frame)
+            self._pos += self._frame_len
+            self._state = _SYNC
+        if self._pos:
+            del buff[: self._pos]
+            self._pos = 0
+        return frames
+
+    def _resync(self) -> None:
+        """Skip the first header byte of the current frame and look for the next header."""
+        self._pos += 1
+        self.discarded_bytes += 1
+        self._state = _SYNC
+
+    def _check(self, pos: int, frame_len: int) -> Union[MCTRL300Reply, None]:
+        """Verify the checksum of a complete frame and parse it.
+
+        Args:
+            pos (int): position of the frame in the buffer.
+            frame_len (int): total length of the frame, including header and checksum.
+
+        Returns:
+            Union[MCTRL300Reply, None]: parsed frame, None if the checksum is incorrect.
+        """
+        end = pos + frame_len
+        with memoryview(self._buff) as view:
+            checksum = (sum(view[pos + 2 : end - 2]) + CHECKSUM_OFFSET) & 0xFFFF
+        b = self._buff
+        if checksum != b[end - 2] | b[end - 1] << 8:
+            return None
+        return MCTRL300Reply(
+            ack=b[pos + 2],
+            serno=b[pos + 3],
+            src=b[pos + 4],
+            dest=b[pos + 5],
+            card_type=b[pos + 6],
+            port=b[pos + 7],
+            board=b[pos + 8] | b[pos + 9] << 8,
+            cmd_type=b[pos + 10],
+            reg_addr=int.from_bytes(b[pos + 12 : pos + 16], 'little'),
+            data_len=b[pos + 16] | b[pos + 17] << 8,
+            data=bytes(b[pos + PREFIX_LEN : end - 2]),
+        )
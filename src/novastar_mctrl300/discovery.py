@@ -0,0 +1,119 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+
+__author__ = 'Dieter Vansteenwegen'
+__project__ = 'Novastar_MCTRL300_basic_controller'
+__project_link__ = 'https://github.com/dietervansteenwegen/Novastar_MCTRL300_basic_controller'
+
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait
+from time import monotonic
+from typing import List, NamedTuple, Optional, Sequence
+
+import serial
+
+from novastar_mctrl300 import serports
+from novastar_mctrl300.decoder import MCTRL300FrameDecoder
+from novastar_mctrl300.mctrl300 import MCTRL300, MCTRL300CreateCommand
+from novastar_mctrl300.serports import is_controller_port
+
+PROBE_TIMEOUT = 0.5  # seconds to wait for the reply of each port
+OPEN_GRACE = 1  # extra seconds for opening the ports, after which hanging ports are given up on
+PROBE_SERNO = 0xA5
+PROBE_OUTPUT = 1
+
+log = logging.getLogger(__name__)
+
+
+class DiscoveredController(NamedTuple):
+    device: str
+    manufacturer: Optional[str]
+    product: Optional[str]
+    latency: float  # seconds from sending the probe until the reply was received
+    brightness: Optional[int]  # of output 1, None if the controller replied with an error
+
+
+def probe(device: str, timeout: float = PROBE_TIMEOUT) -> Optional[DiscoveredController]:
+    """Check whether an MCTRL300 is connected to device by reading the brightness of output 1.
+
+    Any valid reply frame (AA 55 ..., correct checksum and serial number) counts, even with an
+    error ACK.
+
+    Args:
+        device (str): serial port, i.e. '/dev/ttyUSB0'.
+        timeout (float, optional): seconds to wait for the reply. Defaults to PROBE_TIMEOUT.
+
+    Returns:
+        Optional[DiscoveredController]: the controller, None if there was no valid reply.
+    """
+    cmd = MCTRL300CreateCommand().generate(
+        serno=PROBE_SERNO,
+        reg_addr=MCTRL300.REG_BRIGHTNESS_OVERALL,
+        data_len=1,
+        data=None,
+        port=PROBE_OUTPUT,
+        is_write=False,
+    )
+    decoder = MCTRL300FrameDecoder(max_data_len=MCTRL300.MAX_FRAME_DATA_LEN)
+    try:
+        with serports.Mctrl300Serial(device) as serport:
+            serport.reset_input_buffer()
+            serport.write(cmd)
+            sent = monotonic()
+            deadline = sent + timeout
+            while (remaining := deadline - monotonic()) > 0:
+                serport.timeout = remaining
+                chunk = serport.read(serport.in_waiting or 1)
+                for reply in decoder.feed(chunk):
+                    if reply.serno != PROBE_SERNO:
+                        continue
+                    brightness = reply.data[0] if reply.ack == 0 and reply.data else None
+                    return DiscoveredController(device, None, None, monotonic() - sent, brightness)
+    except (OSError, serial.SerialException) as e:
+        log.debug('Could not probe %s: %s', device, e)
+    return None
+
+
+def discover(
+    devices: Optional[Sequence[str]] = None,
+    timeout: float = PROBE_TIMEOUT,
+    candidates_only: bool = True,
+) -> List[DiscoveredController]:
+    """Probe serial ports in parallel and return those with an MCTRL300, fastest first.
+
+    Every port gets its own thread, so discovery takes about one timeout regardless of the number
+    of ports. Ports that hang while opening are given up on after timeout + OPEN_GRACE seconds.
+    By default only ports that look like an MCTRL300 are probed, the probe frame could upset
+    other devices.
+
+    Args:
+        devices (Optional[Sequence[str]], optional): ports to probe. Defaults to None (the ports
+                                    from serports.get_available_ports, see candidates_only).
+        timeout (float, optional): seconds to wait for the reply of each port.
+                                    Defaults to PROBE_TIMEOUT.
+        candidates_only (bool, optional): only probe ports with the USB to UART bridge of the
+                                    MCTRL300 (CP2102), False to probe every port.
+                                    Defaults to True.
+
+    Returns:
+        List[DiscoveredController]: controllers that replied, sorted by latency.
+    """
+    ports = {p[1]: p for p in serports.get_available_ports()}
+    if devices is None:
+        devices = [d for d, p in ports.items() if not candidates_only or is_controller_port(p)]
+    if not devices:
+        return []
+    executor = ThreadPoolExecutor(max_workers=len(devices), thread_name_prefix='mctrl300-probe')
+    futures = {executor.submit(probe, device, timeout): device for device in devices}
+    done, not_done = wait(futures, timeout=timeout + OPEN_GRACE)
+    executor.shutdown(wait=False)
+    for future in not_done:
+        log.warning('Gave up probing %s.', futures[future])
+    found = []
+    for future in done:
+        controller = future.result()
+        if controller is None:
+            continue
+        port = ports.get(controller.device, (None, None, None, None))
+        found.append(controller._replace(manufacturer=port[2], product=port[3]))
+    return sorted(found, key=lambda c: c.latency)
@@ -0,0 +1,198 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+"""Emulator of an MCTRL300 on a pseudo-terminal (Linux/POSIX only).
+
+Run `python -m novastar_mctrl300.emulator` and connect to the printed port, i.e.
+MCTRL300(Mctrl300Serial('/dev/pts/5')).
+"""
+
+__author__ = 'Dieter Vansteenwegen'
+__project__ = 'Novastar_MCTRL300_basic_controller'
+__project_link__ = 'https://github.com/dietervansteenwegen/Novastar_MCTRL300_basic_controller'
+
+import argparse
+import logging
+import os
+import random
+import select
+import threading
+import tty
+from time import sleep
+from typing import Dict, Optional, Tuple
+
+from novastar_mctrl300.decoder import CMD_HEADER, MCTRL300FrameDecoder, MCTRL300Reply
+from novastar_mctrl300.mctrl300 import MCTRL300, MCTRL300CreateCommand
+
+BROADCAST = 0xFFFF
+ACK_TIMEOUT = 0x01
+POLL_INTERVAL = 0.1
+
+
+class MCTRL300Emulator:
+    def __init__(
+        self,
+        latency: float = 0,
+        jitter: float = 0,
+        drop_rate: float = 0,
+        corrupt_rate: float = 0,
+        byte_drop_rate: float = 0,
+        boards_per_port: int = 1,
+        seed: Optional[int] = None,
+    ):
+        """Emulated MCTRL300 with receiving cards, reachable through a pseudo-terminal.
+
+        Keeps a byte-addressed register map per (port, board). Writes are acknowledged, reads are
+        answered with the register contents. Commands to a board that does not exist are answered
+        with ACK 01 (timeout). Broadcast writes (board 0xFFFF) go to all boards, broadcast reads are
+        answered by board 0.
+
+        Args:
+            latency (float, optional): seconds before every reply. Defaults to 0.
+            jitter (float, optional): random extra latency, 0 to jitter seconds. Defaults to 0.
+            drop_rate (float, optional): fraction of commands that are not answered. Defaults to 0.
+            corrupt_rate (float, optional): fraction of replies sent with a wrong checksum.
+                                    Defaults to 0.
+            byte_drop_rate (float, optional): fraction of reply bytes that are left out, so the
+                                    decoder has to resync on partial frames. Defaults to 0.
+            boards_per_port (int, optional): number of receiving cards on each output.
+                                    Defaults to 1.
+            seed (Optional[int], optional): seed for drops, corruption and jitter. Defaults to None.
+        """
+        self.log = logging.getLogger(__name__)
+        self.latency = latency
+        self.jitter = jitter
+        self.drop_rate = drop_rate
+        self.corrupt_rate = corrupt_rate
+        self.byte_drop_rate = byte_drop_rate
+        self.boards_per_port = boards_per_port
+        self.registers: Dict[Tuple[int, int], Dict[int, int]] = {}  # (port, board): {addr: byte}
+        self.random = random.Random(seed)  # noqa: S311
+        self.creator = MCTRL300CreateCommand()
+        self.received = 0
+        self.dropped = 0
+        self.corrupted = 0
+        self.bytes_dropped = 0
+        for port in (1, 2):
+            for board in range(boards_per_port):
+                self.write(port, board, MCTRL300.REG_TEST_PATTERN, bytes([MCTRL300.PATTERN_NORMAL]))
+                self.write(port, board, MCTRL300.REG_BRIGHTNESS_OVERALL, b'\xff')
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='mctrl300-emulator', daemon=True)
+        self._thread.start()
+        self.log.debug('Emulator listening on %s.', self.port)
+
+    def __enter__(self) -> 'MCTRL300Emulator':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._running = False
+        self._thread.join()
+        os.close(self._master)
+        os.close(self._slave)
+
+    def read(self, port: int, board: int, reg_addr: int, length: int) -> bytes:
+        """Read the emulated registers, unwritten registers read 0."""
+        regs = self.registers.get((port, board), {})
+        return bytes(regs.get(addr, 0) for addr in range(reg_addr, reg_addr + length))
+
+    def write(self, port: int, board: int, reg_addr: int, data: bytes) -> None:
+        """Write the emulated registers."""
+        regs = self.registers.setdefault((port, board), {})
+        for offset, value in enumerate(data):
+            regs[reg_addr + offset] = value
+
+    def _run(self) -> None:
+        decoder = MCTRL300FrameDecoder(header=CMD_HEADER)
+        while self._running:
+            ready, _, _ = select.select([self._master], [], [], POLL_INTERVAL)
+            if not ready:
+                continue
+            try:
+                chunk = os.read(self._master, 4096)
+            except OSError:
+                continue  # nobody has the slave side open
+            for cmd in decoder.feed(chunk):
+                self.received += 1
+                reply = self._handle(cmd)
+                if self.random.random() < self.drop_rate:
+                    self.dropped += 1
+                    continue
+                if self.latency or self.jitter:
+                    sleep(self.latency + self.random.uniform(0, self.jitter))
+                if self.random.random() < self.corrupt_rate:
+                    self.corrupted += 1
+                    reply[-1] ^= 0xFF
+                if self.byte_drop_rate:
+                    reply = self._drop_bytes(reply)
+                os.write(self._master, reply)
+
+    def _drop_bytes(self, reply: bytearray) -> bytearray:
+        kept = bytearray(b for b in reply if self.random.random() >= self.byte_drop_rate)
+        self.bytes_dropped += len(reply) - len(kept)
+        return kept
+
+    def _handle(self, cmd: MCTRL300Reply) -> bytearray:
+        """Execute a command on the register map and return the reply frame."""
+        port = cmd.port + 1
+        is_write = cmd.cmd_type == 0x01
+        if cmd.board != BROADCAST:
+            boards = [cmd.board] if cmd.board < self.boards_per_port else []
+        elif is_write:
+            boards = list(range(self.boards_per_port))
+        else:
+            boards = [0] if self.boards_per_port else []
+        data = None
+        data_len = cmd.data_len
+        ack = 0 if boards else ACK_TIMEOUT
+        if not boards:
+            data_len = 0  # error replies carry no data
+        elif is_write:
+            for board in boards:
+                self.write(port, board, cmd.reg_addr, cmd.data)
+        else:
+            data = self.read(port, boards[0], cmd.reg_addr, cmd.data_len)
+        return self.creator.generate(
+            serno=cmd.serno,
+            reg_addr=cmd.reg_addr,
+            data_len=data_len,
+            data=data,
+            port=port,
+            is_cmd=False,
+            is_write=is_write,
+            ack=ack,
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Emulated MCTRL300 on a pseudo-terminal.')
+    parser.add_argument('--latency', type=float, default=0.002, help='reply latency (s)')
+    parser.add_argument('--jitter', type=float, default=0, help='random extra latency (s)')
+    parser.add_argument('--drop-rate', type=float, default=0, help='fraction of dropped replies')
+    parser.add_argument('--corrupt-rate', type=float, default=0, help='fraction of bad checksums')
+    parser.add_argument('--byte-drop-rate', type=float, default=0, help='fraction of lost bytes')
+    parser.add_argument('--boards', type=int, default=1, help='receiving cards per output')
+    args = parser.parse_args()
+    emulator = MCTRL300Emulator(
+        latency=args.latency,
+        jitter=args.jitter,
+        drop_rate=args.drop_rate,
+        corrupt_rate=args.corrupt_rate,
+        byte_drop_rate=args.byte_drop_rate,
+        boards_per_port=args.boards,
+    )
+    print(f'Emulated MCTRL300 on {emulator.port}, Ctrl+C to stop.')
+    try:
+        while True:
+            sleep(1)
+    except KeyboardInterrupt:
+        emulator.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+
+__author__ = 'Dieter Vansteenwegen'
+__project__ = 'Novastar_MCTRL300_basic_controller'
+__project_link__ = 'https://github.com/dietervansteenwegen/Novastar_MCTRL300_basic_controller'
+
+import logging
+import threading
+from concurrent.futures import Future
+from time import monotonic
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence
+
+import serial
+
+from novastar_mctrl300 import serports
+from novastar_mctrl300.mctrl300 import MCTRL300, MCTRL300Error
+from novastar_mctrl300.pipeline import MCTRL300Pipeline
+from novastar_mctrl300.serports import is_controller_port
+
+
+class FleetResult(NamedTuple):
+    device: str
+    ok: bool
+    latency: float  # seconds from sending the first frame until the last reply
+    result: Any  # list with the reply data of every frame
+    error: Optional[Exception]
+
+
+class MCTRL300Fleet:
+    def __init__(self, devices: Sequence[str], window: int = 16, timeout: float = 1):
+        """Drive several MCTRL300 controllers, one per serial port, in parallel.
+
+        Every port gets its own MCTRL300Pipeline (with its own reader thread). Fleet commands are
+        sent to all controllers first and only then the replies are gathered, so a fleet command
+        takes about one round trip regardless of the number of controllers.
+
+        Args:
+            devices (Sequence[str]): serial ports, i.e. ['/dev/ttyUSB0', '/dev/ttyUSB1'].
+            window (int, optional): max outstanding requests per controller. Defaults to 16.
+            timeout (float, optional): seconds to wait for each reply. Defaults to 1.
+        """
+        self.log = logging.getLogger(__name__)
+        self.pipelines: Dict[str, MCTRL300Pipeline] = {}
+        try:
+            for device in devices:
+                self.pipelines[device] = MCTRL300Pipeline(
+                    serports.Mctrl300Serial(device),
+                    window=window,
+                    timeout=timeout,
+                )
+        except serial.SerialException:
+            self.close()
+            raise
+        self.log.debug('Created fleet of %s controllers.', len(self.pipelines))
+
+    @classmethod
+    def from_available_ports(cls, **kwargs) -> 'MCTRL300Fleet':
+        """Create a fleet with every available port that looks like an MCTRL300 (CP2102).
+
+        Args:
+            kwargs: passed to MCTRL300Fleet.
+        """
+        devices = [p[1] for p in serports.get_available_ports() if is_controller_port(p)]
+        return cls(devices, **kwargs)
+
+    @property
+    def devices(self) -> List[str]:
+        return list(self.pipelines)
+
+    def close(self) -> None:
+        for pipeline in self.pipelines.values():
+            pipeline.close()
+            pipeline.serport.close()
+        self.pipelines = {}
+
+    def __enter__(self) -> 'MCTRL300Fleet':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def set_pattern(self, pattern: int, port: int) -> Dict[str, FleetResult]:
+        """Activate a test pattern on port of every controller."""
+        return self.run(lambda p: [p.submit_write(port, MCTRL300.REG_TEST_PATTERN, pattern)])
+
+    def set_brightness(self, port: int, value: int) -> Dict[str, FleetResult]:
+        """Set the overall brightness on port of every controller."""
+        return self.run(lambda p: [p.submit_write(port, MCTRL300.REG_BRIGHTNESS_OVERALL, value)])
+
+    def get_brightness(self, port: int) -> Dict[str, FleetResult]:
+        """Read the overall brightness on port of every controller, result is a list of bytes."""
+        return self.run(lambda p: [p.submit_read(port, MCTRL300.REG_BRIGHTNESS_OVERALL)])
+
+    def apply(
+        self,
+        pattern: Optional[int] = None,
+        brightness: Optional[int] = None,
+        ports: Sequence[int] = (1, 2),
+    ) -> Dict[str, FleetResult]:
+        """Set pattern and/or brightness on the given ports of every controller.
+
+        I.e. apply(MCTRL300.PATTERN_WHITE, 40) sets all screens to white at brightness 40.
+        """
+
+        def submit(p: MCTRL300Pipeline) -> List[Future]:
+            futures = []
+            for port in ports:
+                if pattern is not None:
+                    futures.append(p.submit_write(port, MCTRL300.REG_TEST_PATTERN, pattern))
+                if brightness is not None:
+                    futures.append(
+                        p.submit_write(port, MCTRL300.REG_BRIGHTNESS_OVERALL, brightness),
+                    )
+            return futures
+
+        return self.run(submit)
+
+    def run(self, submit: Callable[[MCTRL300Pipeline], List[Future]]) -> Dict[str, FleetResult]:
+        """Submit requests to every controller, then wait for all replies.
+
+        Args:
+            submit (Callable[[MCTRL300Pipeline], List[Future]]): called once per controller,
+                                    submits the requests and returns their futures.
+
+        Returns:
+            Dict[str, FleetResult]: result per device.
+        """
+        started: Dict[str, float] = {}
+        finished: Dict[str, float] = {}
+        submitted: Dict[str, List[Future]] = {}
+        lock = threading.Lock()
+
+        def done(device: str) -> Callable[[Future], None]:
+            def callback(_: Future) -> None:
+                with lock:
+                    finished[device] = monotonic()
+
+            return callback
+
+        for device, pipeline in self.pipelines.items():
+            started[device] = monotonic()
+            futures = submit(pipeline)
+            for future in futures:
+                future.add_done_callback(done(device))
+            submitted[device] = futures
+
+        results = {}
+        for device, futures in submitted.items():
+            data = []
+            error = None
+            for future in futures:
+                try:
+                    data.append(future.result())
+                except MCTRL300Error as e:
+                    error = error or e
+            with lock:
+                latency = finished.get(device, started[device]) - started[device]
+            results[device] = FleetResult(device, error is None, latency, data, error)
+            if error:
+                self.log.error('%s: %r', device, error)
+        return results
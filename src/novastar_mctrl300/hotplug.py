@@ -0,0 +1,137 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+
+__author__ = 'Dieter Vansteenwegen'
+__project__ = 'Novastar_MCTRL300_basic_controller'
+__project_link__ = 'https://github.com/dietervansteenwegen/Novastar_MCTRL300_basic_controller'
+
+import logging
+import pathlib
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from novastar_mctrl300 import serports
+
+POLL_INTERVAL = 0.5  # seconds between checks
+DEV_DIR = '/dev'  # its mtime changes when a device node is added or removed (Linux, macOS)
+
+PortCallback = Callable[[tuple], None]
+PortsCallback = Callable[[List[tuple]], None]
+
+
+class PortWatcher:
+    def __init__(
+        self,
+        on_added: Optional[PortCallback] = None,
+        on_removed: Optional[PortCallback] = None,
+        on_listed: Optional[PortsCallback] = None,
+        interval: float = POLL_INTERVAL,
+        lister: Callable[[], list] = serports.get_available_ports,
+        watch_dir: Optional[str] = DEV_DIR,
+    ):
+        """Watch for serial ports being plugged in or removed.
+
+        Every interval, the mtime of watch_dir is checked and the ports are only listed again (which
+        scans sysfs on Linux) if it changed. Where watch_dir does not exist (Windows), the ports are
+        listed every interval. The new list is compared with the previous one by device name.
+
+        Callbacks are called on the watcher thread with the port tuple (see
+        serports.get_available_ports). The ports that are present when the watcher starts are
+        reported once, as a sorted list, to on_listed. Without on_listed they are reported as added
+        one by one.
+
+        Args:
+            on_added (Optional[PortCallback], optional): called for every new port.
+                                    Defaults to None.
+            on_removed (Optional[PortCallback], optional): called for every port that is gone.
+                                    Defaults to None.
+            on_listed (Optional[PortsCallback], optional): called with the ports found by the
+                                    first check. Defaults to None.
+            interval (float, optional): seconds between checks. Defaults to POLL_INTERVAL.
+            lister (Callable[[], list], optional): returns the available ports.
+                                    Defaults to serports.get_available_ports.
+            watch_dir (Optional[str], optional): directory of the device nodes, None to always
+                                    list the ports. Defaults to DEV_DIR.
+        """
+        self.log = logging.getLogger(__name__)
+        self.on_added = on_added
+        self.on_removed = on_removed
+        self.on_listed = on_listed
+        self.interval = interval
+        self.lister = lister
+        self.watch_dir = watch_dir
+        self._mtime: Optional[int] = None
+        self._listed = False
+        self._stop = threading.Event()
+        self.ports: Dict[str, tuple] = {}  # device: port, the ports seen by the last check
+        self._thread = threading.Thread(target=self._run, name='mctrl300-hotplug', daemon=True)
+
+    def start(self) -> 'PortWatcher':
+        self._thread.start()
+        return self
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def __enter__(self) -> 'PortWatcher':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def check(self) -> Tuple[Dict[str, tuple], Dict[str, tuple]]:
+        """List the ports again if the device directory changed and call the callbacks.
+
+        Returns:
+            Tuple[Dict[str, tuple], Dict[str, tuple]]: added and removed ports, by device name.
+        """
+        if not self._changed():
+            return {}, {}
+        ports = {port[1]: port for port in self.lister()}
+        if not self._listed and self.on_listed is not None:
+            self._listed = True
+            self.ports = ports
+            self.log.info('Found %s serial ports.', len(ports))
+            self._call(self.on_listed, sorted(ports.values()))
+            return ports, {}
+        self._listed = True
+        added = {d: p for d, p in ports.items() if d not in self.ports}
+        removed = {d: p for d, p in self.ports.items() if d not in ports}
+        self.ports = ports
+        for port in removed.values():
+            self.log.info('Serial port %s removed.', port[1])
+            self._call(self.on_removed, port)
+        for port in added.values():
+            self.log.info('Serial port %s added.', port[1])
+            self._call(self.on_added, port)
+        return added, removed
+
+    def _changed(self) -> bool:
+        if self.watch_dir is None:
+            return True
+        try:
+            mtime = pathlib.Path(self.watch_dir).stat().st_mtime_ns
+        except OSError:
+            return True
+        changed = mtime != self._mtime
+        self._mtime = mtime
+        return changed
+
+    def _call(self, callback: Optional[Callable[[Any], None]], arg: Any) -> None:
+        if callback is None:
+            return
+        try:
+            callback(arg)
+        except Exception:
+            self.log.exception('Hotplug callback %s failed.', callback)
+
+    def _run(self) -> None:
+        while True:
+            try:
+                self.check()
+            except Exception:
+                self.log.exception('Checking the serial ports failed.')
+            if self._stop.wait(self.interval):
+                break
@@ -6,15 +6,57 @@
 __project_link__ = 'https://github.com/dietervansteenwegen/Novastar_MCTRL300_basic_controller'
 
 import logging
-from time import sleep
-from typing import List, Union
+import struct
+import sys
+import threading
+from time import monotonic, perf_counter, sleep
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
 
 import serial
 
+from novastar_mctrl300.cache import BROADCAST, MCTRL300RegisterCache
+from novastar_mctrl300.decoder import (
+    CHECKSUM_LEN,
+    CHECKSUM_OFFSET,
+    CMD_HEADER,
+    PREFIX_LEN,
+    REPLY_HEADER,
+    MCTRL300FrameDecoder,
+    MCTRL300Reply,
+)
+from novastar_mctrl300.metrics import CommandMetrics, MCTRL300Metrics
 from novastar_mctrl300.serports import Mctrl300Serial
+from novastar_mctrl300.trace import RX, TX, TraceRecorder
+
+np = None  # NumPy, optional and only used to speed up MCTRL300CreateCommand.generate_batch
+
+_TEMPLATE = struct.Struct('<BBBBBBHBBIH')  # frame from ACK up to and including data length
+_REG_ADDR_DATA_LEN = struct.Struct('<IH')
+_CHECKSUM = struct.Struct('<H')
+_HEADER_SUM = sum(CMD_HEADER)
+
+
+def _numpy() -> bool:
+    """Import NumPy on first use, importing it takes longer than most CLI commands run.
+
+    Returns:
+        bool: True if NumPy is available (as np).
+    """
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            np = False
+        else:
+            np = numpy
+    return np is not False
+
 
 BAUDRATE = 115200
 TIMEOUT = 4
+BITS_PER_BYTE = 10  # 8N1, start and stop bit included
+MAX_BURST = 0xFF  # writes sent together, their serial numbers must be unique
 
 
 class MCTRL300Error(Exception):
@@ -25,6 +67,125 @@ class MCTRL300IncorrectReplyError(MCTRL300Error):
     pass
 
 
+class MCTRL300NoReplyError(MCTRL300IncorrectReplyError):
+    """No (complete) reply with the expected serial number was received in time."""
+
+    def __init__(self, serno: int, timeout: float):
+        super().__init__(f'No reply to message {serno} within {timeout:g} s')
+        self.serno = serno
+        self.timeout = timeout
+
+
+class MCTRL300AckError(MCTRL300Error):
+    """The controller replied with a non-zero ACK status code."""
+
+    def __init__(self, code: int, serno: int):
+        super().__init__(f'ACK status 0x{code:02X} for message {serno}')
+        self.code = code
+        self.serno = serno
+
+
+class MCTRL300AckTimeoutError(MCTRL300AckError):
+    """ACK 01: the controller timed out waiting for the receiving card."""
+
+
+class MCTRL300AckChecksumError(MCTRL300AckError):
+    """ACK 02/03: the controller detected a message check error."""
+
+
+class MCTRL300AckInvalidCommandError(MCTRL300AckError):
+    """ACK 04: the controller did not accept the command."""
+
+
+class BatchResult(NamedTuple):
+    """A write of an MCTRL300Batch and its outcome."""
+
+    port: int
+    reg_addr: int
+    data: bytes
+    board: Optional[int] = None
+    skipped: bool = False  # not (re)sent: the cache already held data or a later write replaced it
+    error: Optional[MCTRL300Error] = None
+
+    def overlaps(self, other: 'BatchResult') -> bool:
+        """Check whether both writes change the same register of a card."""
+        return (
+            self.port == other.port
+            and (self.board is None or other.board is None or self.board == other.board)
+            and self.reg_addr < other.reg_addr + len(other.data)
+            and other.reg_addr < self.reg_addr + len(self.data)
+        )
+
+    def covers(self, other: 'BatchResult') -> bool:
+        """Check whether this write changes all registers other changes, on all its cards."""
+        return (
+            self.port == other.port
+            and self.board in (None, other.board)
+            and self.reg_addr <= other.reg_addr
+            and other.reg_addr + len(other.data) <= self.reg_addr + len(self.data)
+        )
+
+
+class MCTRL300BatchError(MCTRL300Error):
+    """Some writes of a batch failed, results has the outcome of every write."""
+
+    def __init__(self, results: List[BatchResult]):
+        failed = [r for r in results if r.error is not None]
+        super().__init__(f'{len(failed)} of {len(results)} writes failed: {failed[0].error!r}')
+        self.results = results
+
+
+ACK_OK = 0x00
+ACK_ERRORS = {
+    0x01: MCTRL300AckTimeoutError,
+    0x02: MCTRL300AckChecksumError,
+    0x03: MCTRL300AckChecksumError,
+    0x04: MCTRL300AckInvalidCommandError,
+}
+
+
+def ack_error(code: int, serno: int) -> Optional[MCTRL300AckError]:
+    """Return the typed error for an ACK status code, or None if the command succeeded.
+
+    Args:
+        code (int): ACK byte (byte 3) of the reply.
+        serno (int): serial number of the reply.
+
+    Returns:
+        Optional[MCTRL300AckError]: exception to raise, None for ACK_OK.
+    """
+    if code == ACK_OK:
+        return None
+    return ACK_ERRORS.get(code, MCTRL300AckError)(code, serno)
+
+
+class RetryPolicy(NamedTuple):
+    """When and how often MCTRL300 sends a command again after a missing or bad reply.
+
+    Only errors that are likely transient are retried: no or an incorrect reply, ACK 01 (timeout)
+    and ACK 02/03 (checksum). ACK 04 (invalid command) will fail again and is raised immediately.
+    Retries only apply to reads and, with wait_for_ack, to writes (otherwise errors are not seen).
+    """
+
+    retries: int = 2  # attempts after the first one
+    backoff: float = 0.05  # seconds before the first retry
+    factor: float = 2  # the backoff is multiplied by factor for every next retry
+    max_backoff: float = 1
+    retry_on: Tuple[type, ...] = (
+        MCTRL300IncorrectReplyError,  # includes MCTRL300NoReplyError
+        MCTRL300AckTimeoutError,
+        MCTRL300AckChecksumError,
+    )
+
+    def should_retry(self, error: MCTRL300Error, attempt: int) -> bool:
+        """Check whether attempt (0 for the first retry) should be made after error."""
+        return attempt < self.retries and isinstance(error, self.retry_on)
+
+    def delay(self, attempt: int) -> float:
+        """Return the seconds to wait before attempt (0 for the first retry)."""
+        return min(self.max_backoff, self.backoff * self.factor**attempt)
+
+
 class MCTRL300:
     REG_TEST_PATTERN = 0x02000101
     REG_BRIGHTNESS_OVERALL = 0x02000001
@@ -39,23 +200,66 @@ class MCTRL300:
     PATTERN_SLASH = 8
     PATTERN_GRAYSCALE = 9
 
-    def __init__(self, serport: serial.Serial):
+    WRITE_DELAY = 0.1  # fixed delay after a write when not waiting for the ACK
+    MAX_FRAME_DATA_LEN = 256  # larger block transfers are split into several frames
+    MAX_BLOCK_LEN = 0xFFFF
+
+    def __init__(
+        self,
+        serport: serial.Serial,
+        wait_for_ack: bool = False,
+        ack_timeout: float = 1,
+        metrics: Optional[MCTRL300Metrics] = None,
+        cache_ttl: Optional[float] = None,
+        retry: Optional[RetryPolicy] = None,
+        trace: Optional[TraceRecorder] = None,
+    ):
         """Class for basic control of the Novastar MCTRL300 LED controller.
 
+        Commands are serialised with a lock, so one instance can be shared between threads (i.e.
+        a GUI worker and a PatternSequencer).
+
         Args:
             serport (serial.Serial): Serial port to which the MCTRL300 is connected.
                                     Initialized to 115200 baud, 8N1
+            wait_for_ack (bool, optional): wait for the ACK of every write instead of sleeping
+                                    WRITE_DELAY seconds. Defaults to False.
+            ack_timeout (float, optional): seconds to wait for an ACK or the reply to a read.
+                                    Defaults to 1.
+            metrics (Optional[MCTRL300Metrics], optional): records timing and size of every
+                                    command. Defaults to None.
+            cache_ttl (Optional[float], optional): keep a register cache: reads within cache_ttl
+                                    seconds of the last read or acknowledged write are served
+                                    from the cache and writes that do not change the cached value
+                                    are skipped. Writes are only cached with wait_for_ack.
+                                    Defaults to None (no cache).
+            retry (Optional[RetryPolicy], optional): retry commands without (valid) reply.
+                                    Defaults to None (no retries).
+            trace (Optional[TraceRecorder], optional): records all bytes sent and received.
+                                    Defaults to None.
         """
         self.log = logging.getLogger(__name__)
+        self._lock = threading.RLock()
+        self.cache = None if cache_ttl is None else MCTRL300RegisterCache(cache_ttl)
         self._init_serport(serport)
         self._msg_id: int = 0  # increasing number for each message sent
+        self.wait_for_ack = wait_for_ack
+        self.ack_timeout = ack_timeout
+        self.metrics = metrics
+        self.retry = retry
+        self.trace = trace
+        self._written_at = 0.0
+        self._rx_bytes = 0
         self.output = 0
         self.creator = MCTRL300CreateCommand()
+        self.decoder = MCTRL300FrameDecoder(max_data_len=self.MAX_FRAME_DATA_LEN)
         self.log.debug('Created MCTRL300 object.')
 
     def _init_serport(self, serport: serial.Serial) -> None:
         """Initialize the serial port.
 
+        The register cache is cleared, the controller may have been changed while disconnected.
+
         Args:
             serport (serial.Serial): Serial port to which the MCTRL300 is connected.
                                     Initialized to 115200 baud, 8N1
@@ -63,8 +267,10 @@ def _init_serport(self, serport: serial.Serial) -> None:
         self.serport = serport
         self.serport.close()
         self.serport.open()
+        if self.cache is not None:
+            self.cache.invalidate()
 
-    def set_pattern(self, pattern: int, port: int) -> None:
+    def set_pattern(self, pattern: int, port: int, board: Optional[int] = None) -> None:
         """Activate an internal test pattern.
 
         Pattern can be an int from 1 to 10 or one of the PATTERN constants.
@@ -72,33 +278,22 @@ def set_pattern(self, pattern: int, port: int) -> None:
         Args:
             pattern (int): one of the above test patterns, i.e. PATTERN_RED
             port (int): port to which screen is connected, 1 or 2.
+            board (Optional[int], optional): receiving card, 0 for the first card on port.
+                                    Defaults to None (all cards).
         """
-        cmd = self.creator.generate(
-            serno=self._msg_id,
-            port=port,
-            reg_addr=self.REG_TEST_PATTERN,
-            data_len=1,
-            data=pattern,
-        )
-        self.log.debug(f'Set output {port} to pattern no {pattern}')
-        self._send_cmd(cmd)
+        self.log.debug('Set output %s (board %s) to pattern no %s', port, board, pattern)
+        self._write_frame(port, self.REG_TEST_PATTERN, pattern, board)
 
-    def deactivate_pattern(self, port: int) -> None:
+    def deactivate_pattern(self, port: int, board: Optional[int] = None) -> None:
         """Deactivate test pattern on port.
 
         Display normal/live incoming video signal.
 
         Args:
             port (int): port to which screen is connected, 1 or 2.
+            board (Optional[int], optional): receiving card. Defaults to None (all cards).
         """
-        cmd = self.creator.generate(
-            serno=self._msg_id,
-            port=port,
-            reg_addr=self.REG_TEST_PATTERN,
-            data_len=1,
-            data=self.PATTERN_NORMAL,
-        )
-        self._send_cmd(cmd)
+        self._write_frame(port, self.REG_TEST_PATTERN, self.PATTERN_NORMAL, board)
 
     def _print_cmd(self, cmd):
         print('cmd: ', end='')
@@ -106,7 +301,7 @@ def _print_cmd(self, cmd):
             print(hex(i), end=' ')
         print()
 
-    def set_brightness(self, port: int, value: int) -> None:
+    def set_brightness(self, port: int, value: int, board: Optional[int] = None) -> None:
         """Set brightness of screen on port.
 
         Sets the overall brightness, leaving the individual color brightness values to default.
@@ -114,92 +309,633 @@ def set_brightness(self, port: int, value: int) -> None:
         Args:
             port (int): port to which screen is connected, 1 or 2.
             value (int): brightness value, 0 to 0xFF.
+            board (Optional[int], optional): receiving card. Defaults to None (all cards).
         """
-        cmd = self.creator.generate(
-            serno=self._msg_id,
-            port=port,
-            reg_addr=self.REG_BRIGHTNESS_OVERALL,
-            data_len=1,
-            data=value,
-        )
-        self._send_cmd(cmd)
+        self._write_frame(port, self.REG_BRIGHTNESS_OVERALL, value, board)
+
+    def write_block(
+        self,
+        port: int,
+        reg_addr: int,
+        data: Union[bytes, bytearray, memoryview],
+        board: Optional[int] = None,
+    ) -> None:
+        """Write consecutive registers, starting at reg_addr.
+
+        Transfers longer than MAX_FRAME_DATA_LEN are split into several frames.
+
+        Args:
+            port (int): port to which screen is connected, 1 or 2.
+            reg_addr (int): address of the first register to be written.
+            data (Union[bytes, bytearray, memoryview]): data to be written, up to MAX_BLOCK_LEN
+                                    bytes.
+            board (Optional[int], optional): receiving card. Defaults to None (all cards).
+        """
+        with memoryview(data) as view, view.cast('B') as block:
+            self._check_block_len(len(block))
+            for offset in range(0, len(block), self.MAX_FRAME_DATA_LEN):
+                chunk = block[offset : offset + self.MAX_FRAME_DATA_LEN]
+                self._write_frame(port, reg_addr + offset, chunk, board)
+
+    def read_block(
+        self,
+        port: int,
+        reg_addr: int,
+        length: int,
+        board: Optional[int] = None,
+    ) -> bytes:
+        """Read consecutive registers, starting at reg_addr.
+
+        Transfers longer than MAX_FRAME_DATA_LEN are split into several frames.
+
+        Args:
+            port (int): port to which screen is connected, 1 or 2.
+            reg_addr (int): address of the first register to be read.
+            length (int): number of bytes to read, up to MAX_BLOCK_LEN.
+            board (Optional[int], optional): receiving card. Defaults to None (broadcast, which
+                                    is answered by the first card).
+
+        Returns:
+            bytes: data read.
+        """
+        self._check_block_len(length)
+        block = bytearray()
+        for offset in range(0, length, self.MAX_FRAME_DATA_LEN):
+            chunk_len = min(self.MAX_FRAME_DATA_LEN, length - offset)
+            block += self._read_frame(port, reg_addr + offset, chunk_len, board)
+        return bytes(block)
+
+    def _check_block_len(self, length: int) -> None:
+        if not 0 < length <= self.MAX_BLOCK_LEN:
+            msg = f'Block length should be 1 to {self.MAX_BLOCK_LEN} bytes, not {length}.'
+            raise ValueError(msg)
+
+    def _write_frame(
+        self,
+        port: int,
+        reg_addr: int,
+        data: Union[int, bytes, bytearray, memoryview],
+        board: Optional[int] = None,
+    ) -> None:
+        """Write a single frame (at most MAX_FRAME_DATA_LEN bytes) to the controller."""
+        with self._lock:
+            self._write_frame_locked(port, reg_addr, data, board)
+
+    def _write_frame_locked(
+        self,
+        port: int,
+        reg_addr: int,
+        data: Union[int, bytes, bytearray, memoryview],
+        board: Optional[int],
+    ) -> None:
+        data_len = 1 if isinstance(data, int) else len(data)
+        if self.cache is None:
+            self._transact(port, reg_addr, data_len, data, is_write=True, board=board)
+            return
+        value = bytes([data]) if isinstance(data, int) else bytes(data)
+        key = BROADCAST if board is None else board
+        if self.cache.unchanged(port, key, reg_addr, value):
+            return
+        try:
+            self._transact(port, reg_addr, data_len, data, is_write=True, board=board)
+        finally:
+            # a broadcast write changes every card, a write to one card what a broadcast reads
+            self.cache.invalidate(port, reg_addr=reg_addr, length=data_len)
+        if self.wait_for_ack:  # without the ACK the write may have been lost
+            self.cache.put(port, key, reg_addr, value)
+
+    def _read_frame(
+        self,
+        port: int,
+        reg_addr: int,
+        length: int,
+        board: Optional[int] = None,
+    ) -> bytes:
+        """Read a single frame (at most MAX_FRAME_DATA_LEN bytes) from the controller."""
+        with self._lock:
+            return self._read_frame_locked(port, reg_addr, length, board)
+
+    def _read_frame_locked(
+        self,
+        port: int,
+        reg_addr: int,
+        length: int,
+        board: Optional[int],
+    ) -> bytes:
+        if self.cache is None:
+            return self._transact(port, reg_addr, length, None, is_write=False, board=board)
+        key = BROADCAST if board is None else board
+        cached = self.cache.get(port, key, reg_addr, length)
+        if cached is not None:
+            return cached
+        data = self._transact(port, reg_addr, length, None, is_write=False, board=board)
+        self.cache.put(port, key, reg_addr, data)
+        return data
+
+    def _transact(
+        self,
+        port: int,
+        reg_addr: int,
+        data_len: int,
+        data: Union[int, bytes, bytearray, memoryview, None],
+        is_write: bool,
+        board: Optional[int] = None,
+    ) -> bytes:
+        """Send one frame, wait for the reply (reads) or ACK/WRITE_DELAY (writes).
+
+        Returns:
+            bytes: data of the reply, empty for writes.
+        """
+        encode_time = write_time = 0.0
+        tx_bytes = 0
+        attempt = 0
+        reply = b''
+        error = None
+        try:
+            while True:
+                start = perf_counter()
+                cmd = self.creator.generate(
+                    serno=self._msg_id,  # a new serial number for every attempt
+                    port=port,
+                    reg_addr=reg_addr,
+                    data_len=data_len,
+                    data=data,
+                    is_write=is_write,
+                    board=board,
+                )
+                encoded = perf_counter()
+                encode_time += encoded - start
+                tx_bytes += len(cmd)
+                used_msg_id = self._msg_id
+                self._written_at = encoded  # in case the write fails
+                try:
+                    self._send_cmd(cmd, is_write=is_write)
+                    if not is_write:
+                        reply = self._get_response(
+                            used_msg_id,
+                            reply_data_length=data_len,
+                            timeout=self.ack_timeout,
+                        )
+                    error = None
+                    break
+                except MCTRL300Error as e:
+                    error = e
+                    if self.retry is None or not self.retry.should_retry(e, attempt):
+                        raise
+                finally:
+                    write_time += self._written_at - encoded
+                delay = self.retry.delay(attempt)
+                attempt += 1
+                self.log.warning(
+                    'Retrying message %s in %.3f s (%d/%d): %r',
+                    used_msg_id,
+                    delay,
+                    attempt,
+                    self.retry.retries,
+                    error,
+                )
+                self._drain(delay)
+        finally:
+            if self.metrics is not None:
+                done = perf_counter()
+                waited = not is_write or self.wait_for_ack
+                self.metrics.record(
+                    CommandMetrics(
+                        port=port,
+                        reg_addr=reg_addr,
+                        is_write=is_write,
+                        encode_time=encode_time,
+                        write_time=write_time,
+                        reply_time=done - self._written_at if waited else None,
+                        tx_bytes=tx_bytes,
+                        rx_bytes=self._rx_bytes,
+                        retries=attempt,
+                        error=type(error).__name__ if error else None,
+                    ),
+                )
+        return reply
+
+    def _drain(self, duration: float) -> None:
+        """Read and drop everything received for duration seconds, then resync the decoder.
+
+        Late or garbled replies to the failed attempt are removed before the retry is sent.
+        """
+        deadline = monotonic() + duration
+        dropped = 0
+        while True:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                break
+            self.serport.timeout = remaining
+            chunk = self.serport.read(self.serport.in_waiting or 1)
+            if self.trace is not None and chunk:
+                self.trace.record(RX, chunk)
+            dropped += len(chunk)
+        self.serport.reset_input_buffer()
+        self.decoder.reset()
+        if dropped:
+            self.log.debug('Dropped %s bytes before retrying.', dropped)
 
-    def _send_cmd(self, cmd: bytearray) -> None:
+    def _send_cmd(self, cmd: bytearray, is_write: bool = True) -> None:
         """Send command and increase message id.
 
+        For writes, either wait for the matching ACK (if wait_for_ack) or WRITE_DELAY seconds.
+        Reads return immediately, the reply is collected with _get_response.
+
         Args:
             cmd (bytearray): command to be sent to port/processor.
+            is_write (bool, optional): cmd is a write command. Defaults to True.
+
+        Raises:
+            MCTRL300NoReplyError: no ACK received within ack_timeout.
+            MCTRL300AckError: the ACK reports an error.
         """
+        used_msg_id = self._msg_id
         self.serport.reset_input_buffer()
+        self.decoder.reset()
+        self._rx_bytes = 0
         self.serport.write(cmd)
+        self._written_at = perf_counter()
+        if self.trace is not None:
+            self.trace.record(TX, cmd)
         self._msg_id += 1
         if self._msg_id > 0xFF:
             self._msg_id = 0
-        sleep(0.1)
-
-    def get_brightness(self, port: int) -> Union[int, None]:
-        cmd = self.creator.generate(
-            serno=self._msg_id,
-            port=port,
-            reg_addr=self.REG_BRIGHTNESS_OVERALL,
-            data_len=1,
-            data=None,
-            is_write=False,
-        )
-        used_msg_id = self._msg_id
-        self._send_cmd(cmd)
-        response = self._get_response(used_msg_id, reply_data_length=1)
+        if not is_write:
+            return
+        if self.wait_for_ack:
+            self._get_response(used_msg_id, reply_data_length=0, timeout=self.ack_timeout)
+        else:
+            sleep(self.WRITE_DELAY)
+
+    def batch(self) -> 'MCTRL300Batch':
+        """Collect writes to send in one burst, see MCTRL300Batch.
+
+        with screen.batch() as batch:
+            batch.set_pattern(MCTRL300.PATTERN_RED, 1)
+            batch.set_brightness(2, 40)
+        """
+        return MCTRL300Batch(self)
+
+    def _commit_batch(self, writes: Sequence[BatchResult]) -> List[BatchResult]:
+        """Send writes in bursts, retry the failed ones and return the outcome of each."""
+        with self._lock:
+            results = list(writes)
+            todo = self._skip_unchanged(results)
+            sent = list(todo)
+            completed = False
+            try:
+                attempt = 0
+                while todo:
+                    todo = self._resend(results, sent, self._send_bursts(results, todo, attempt))
+                    if not todo:
+                        break
+                    delay = self.retry.delay(attempt)
+                    attempt += 1
+                    self.log.warning(
+                        'Retrying %s writes of batch in %.3f s (%d/%d).',
+                        len(todo),
+                        delay,
+                        attempt,
+                        self.retry.retries,
+                    )
+                    self._drain(delay)
+                completed = True
+            finally:
+                self._cache_batch(results, sent, completed)
+        return results
+
+    def _skip_unchanged(self, results: List[BatchResult]) -> List[int]:
+        """Mark the writes that do not change the cached registers as skipped.
+
+        A write to registers that an earlier write of the batch changes is always sent.
+
+        Returns:
+            List[int]: indexes of the writes to send.
+        """
+        if self.cache is None:
+            return list(range(len(results)))
+        todo = []
+        for index, w in enumerate(results):
+            key = BROADCAST if w.board is None else w.board
+            if self.cache.unchanged(w.port, key, w.reg_addr, w.data) and not any(
+                results[i].overlaps(w) for i in todo
+            ):
+                results[index] = w._replace(skipped=True)
+                continue
+            todo.append(index)
+        return todo
+
+    def _resend(self, results: List[BatchResult], sent: List[int], retry: List[int]) -> List[int]:
+        """Return the indexes of the writes to send again, in order, so the last write wins.
+
+        A failed write that a later, acknowledged write of the batch covers is not needed anymore
+        and marked as skipped. The others are sent again together with every later acknowledged
+        write to the same registers (and the writes after those), which would otherwise be undone.
+        """
+        acked = [i for i in sent if results[i].error is None and not results[i].skipped]
+        todo = []
+        for index in retry:
+            w = results[index]
+            if any(i > index and results[i].covers(w) for i in acked):
+                results[index] = w._replace(skipped=True, error=None)
+            else:
+                todo.append(index)
+        if not todo:
+            return todo
+        resend = set(todo)
+        for index in acked:
+            if index > todo[0] and any(
+                i < index and results[i].overlaps(results[index]) for i in resend
+            ):
+                resend.add(index)
+        return sorted(resend)
+
+    def _cache_batch(self, results: List[BatchResult], sent: List[int], completed: bool) -> None:
+        """Store the data of the acknowledged writes in the cache, in order of the batch.
+
+        The registers of every other write that was sent are removed from the cache, as are those
+        of all writes if the batch did not complete (an exception).
+        """
+        if self.cache is None:
+            return
+        for index in sent:
+            w = results[index]
+            # a broadcast write changes every card, a write to one card what a broadcast reads
+            self.cache.invalidate(w.port, reg_addr=w.reg_addr, length=len(w.data))
+            if completed and w.error is None and not w.skipped:
+                key = BROADCAST if w.board is None else w.board
+                self.cache.put(w.port, key, w.reg_addr, w.data)
+
+    def _send_bursts(self, results: List[BatchResult], todo: List[int], attempt: int) -> List[int]:
+        """Send the writes at the indexes in todo, store their errors in results.
+
+        Returns:
+            List[int]: indexes of the writes to retry.
+        """
+        retry = []
+        for offset in range(0, len(todo), MAX_BURST):
+            burst = todo[offset : offset + MAX_BURST]
+            errors = self._send_burst([results[i] for i in burst], attempt)
+            for index, error in zip(burst, errors):  # noqa: B905
+                results[index] = results[index]._replace(error=error)
+                if self._should_retry(error, attempt):
+                    retry.append(index)
+        return retry
+
+    def _should_retry(self, error: Optional[MCTRL300Error], attempt: int) -> bool:
+        if error is None or self.retry is None:
+            return False
+        return self.retry.should_retry(error, attempt)
+
+    def _send_burst(
+        self,
+        writes: Sequence[BatchResult],
+        attempt: int,
+    ) -> List[Optional[MCTRL300Error]]:
+        """Send up to MAX_BURST writes with one serial write and wait for all ACKs.
+
+        Returns:
+            List[Optional[MCTRL300Error]]: error of every write, None if acknowledged.
+        """
+        start = perf_counter()
+        commands = []
+        for w in writes:
+            serno = self._msg_id
+            self._msg_id = (self._msg_id + 1) & 0xFF
+            commands.append(
+                MCTRL300Command(serno, w.port, w.reg_addr, len(w.data), w.data, True, w.board),
+            )
+        buff = self.creator.generate_batch(commands)
+        encoded = perf_counter()
+        self.serport.reset_input_buffer()
+        self.decoder.reset()
+        self.serport.write(buff)
+        written = perf_counter()
+        if self.trace is not None:
+            self.trace.record(TX, buff)
+        # no ACK can arrive before its frame is transmitted, which takes a while for a long burst
+        tx_time = len(buff) * BITS_PER_BYTE / self.serport.baudrate
+        errors, acked = self._get_acks([cmd.serno for cmd in commands], self.ack_timeout + tx_time)
+        if self.metrics is not None:
+            done = perf_counter()
+            for cmd, error, ack_time in zip(commands, errors, acked):  # noqa: B905
+                if self._should_retry(error, attempt):
+                    continue  # recorded after the last attempt
+                self.metrics.record(
+                    CommandMetrics(
+                        port=cmd.port,
+                        reg_addr=cmd.reg_addr,
+                        is_write=True,
+                        encode_time=(encoded - start) / len(commands),
+                        write_time=(written - encoded) / len(commands),
+                        reply_time=(ack_time or done) - written,
+                        tx_bytes=PREFIX_LEN + cmd.data_len + CHECKSUM_LEN,
+                        rx_bytes=PREFIX_LEN + CHECKSUM_LEN if ack_time else 0,
+                        retries=attempt,
+                        error=type(error).__name__ if error else None,
+                    ),
+                )
+        return errors
+
+    def _get_acks(
+        self,
+        sernos: List[int],
+        timeout: float,
+    ) -> Tuple[List[Optional[MCTRL300Error]], List[Optional[float]]]:
+        """Wait for the ACKs of several writes, see _get_response.
+
+        Returns:
+            Tuple[List[Optional[MCTRL300Error]], List[Optional[float]]]: error and perf_counter()
+                                    time of the ACK of every write, None if it was not received.
+        """
+        pending = {serno: index for index, serno in enumerate(sernos)}
+        errors: List[Optional[MCTRL300Error]] = [None] * len(sernos)
+        acked: List[Optional[float]] = [None] * len(sernos)
+        deadline = monotonic() + timeout
+        while pending and (remaining := deadline - monotonic()) > 0:
+            self.serport.timeout = remaining
+            chunk = self.serport.read(self.serport.in_waiting or 1)
+            if self.trace is not None and chunk:
+                self.trace.record(RX, chunk)
+            for reply in self.decoder.feed(chunk):
+                index = pending.pop(reply.serno, None)
+                if index is None:
+                    self.log.warning('Dropped reply to message %s: %s', reply.serno, reply)
+                    continue
+                acked[index] = perf_counter()
+                try:
+                    self._check_reply(reply, 0)
+                except MCTRL300Error as e:
+                    errors[index] = e
+        for serno, index in pending.items():
+            self.log.error('No reply to message %s.', serno)
+            errors[index] = MCTRL300NoReplyError(serno, timeout)
+        return errors, acked
+
+    def get_brightness(self, port: int, board: Optional[int] = None) -> Union[int, None]:
+        response = self._read_frame(port, self.REG_BRIGHTNESS_OVERALL, 1, board)
         return response[0] if response else None
 
     def _get_response(
         self,
-        used_msg_id,
+        used_msg_id: int,
         reply_data_length: int,
-        timeout: int = 1,
-    ) -> Union[bytearray, None]:
-        timeout_cntr: float = 0
-        rx_buff: bytearray = bytearray()
-        msg_without_data_length = 20
-        complete = False
-
-        while timeout_cntr < timeout:
-            while self.serport.in_waiting > 0:
-                rx_buff.extend(self.serport.read())
-            rx_buff = self._cleanup_rx_buff(rx_buff)
-            if len(rx_buff) >= msg_without_data_length + reply_data_length:
-                complete = True
-                rx_buff = rx_buff[:-2]  # strip checksum
+        timeout: float = 1,
+    ) -> bytes:
+        """Wait for the reply to a command.
+
+        Reads block until data arrives (or the timeout expires), every chunk is passed to the
+        frame decoder. Replies to other messages are logged and dropped.
+
+        Args:
+            used_msg_id (int): serial number of the command.
+            reply_data_length (int): expected number of data bytes (0 for an ACK).
+            timeout (float, optional): seconds to wait for the reply. Defaults to 1.
+
+        Raises:
+            MCTRL300NoReplyError: no reply received within timeout.
+            MCTRL300IncorrectReplyError: reply does not contain the expected amount of data.
+            MCTRL300AckError: the reply reports an error.
+
+        Returns:
+            bytes: data of the reply.
+        """
+        deadline = monotonic() + timeout
+        while True:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
                 break
-            sleep(0.05)
-            timeout_cntr += 0.05
-        correct_reply = complete and rx_buff[3] == used_msg_id and rx_buff[2] == 00
-        if not correct_reply:
-            self.log.error(f'Got an incorrect reply: {rx_buff}')
-            raise MCTRL300IncorrectReplyError(rx_buff)
+            self.serport.timeout = remaining
+            chunk = self.serport.read(self.serport.in_waiting or 1)
+            if self.trace is not None and chunk:
+                self.trace.record(RX, chunk)
+            for reply in self.decoder.feed(chunk):
+                if reply.serno == used_msg_id:
+                    self._rx_bytes = PREFIX_LEN + len(reply.data) + CHECKSUM_LEN
+                    return self._check_reply(reply, reply_data_length)
+                self.log.warning('Dropped reply to message %s: %s', reply.serno, reply)
+        self.log.error('No reply to message %s.', used_msg_id)
+        raise MCTRL300NoReplyError(used_msg_id, timeout)
 
-        return rx_buff[-reply_data_length:] if correct_reply else None
+    def _check_reply(self, reply: MCTRL300Reply, reply_data_length: int) -> bytes:
+        error = ack_error(reply.ack, reply.serno)
+        if error:
+            self.log.error('Controller returned an error: %s', error)
+            raise error
+        if len(reply.data) != reply_data_length:
+            self.log.error('Got an incorrect reply: %s', reply)
+            raise MCTRL300IncorrectReplyError(reply)
+        return reply.data
 
-    def _cleanup_rx_buff(self, rx_buff: bytearray) -> bytearray:
-        if len(rx_buff) < 2:
-            return rx_buff
-        start = rx_buff.find(0xAA)
-        return rx_buff[start:] if rx_buff[start + 1] == 0x55 else bytearray()
+
+class MCTRL300Command(NamedTuple):
+    """Arguments of MCTRL300CreateCommand.generate, used for batch encoding."""
+
+    serno: int
+    port: int
+    reg_addr: int
+    data_len: int
+    data: Union[int, List[int], bytes, None] = None
+    is_write: bool = True
+    board: Optional[int] = None  # receiving card, None for all
+
+
+class MCTRL300Batch:
+    def __init__(self, screen: MCTRL300):
+        """Writes to be sent to the controller in one burst, see MCTRL300.batch.
+
+        The methods mirror those of MCTRL300 but only collect the write. When the with block ends
+        without exception (or on commit), all writes are encoded into one buffer, sent with a
+        single serial write and their ACKs are collected together, up to MAX_BURST writes per
+        burst. ACKs are always waited for, regardless of wait_for_ack. Writes that the register
+        cache shows to be unchanged are skipped, failed ones are retried according to the
+        RetryPolicy of screen. A retry is sent again together with the later writes to the same
+        registers, so the last write of the batch always wins, and is left out if a later write
+        replaced it. The cache only holds data once its write is acknowledged.
+
+        Args:
+            screen (MCTRL300): controller to send the writes to.
+        """
+        self.screen = screen
+        self.writes: List[BatchResult] = []  # not committed yet
+        self.results: List[BatchResult] = []  # of all commits
+
+    def __enter__(self) -> 'MCTRL300Batch':
+        return self
+
+    def __exit__(self, exc_type, *exc) -> None:
+        if exc_type is None:
+            self.commit()
+
+    def __len__(self) -> int:
+        return len(self.writes)
+
+    def set_pattern(self, pattern: int, port: int, board: Optional[int] = None) -> None:
+        self.write_block(port, MCTRL300.REG_TEST_PATTERN, bytes([pattern]), board)
+
+    def deactivate_pattern(self, port: int, board: Optional[int] = None) -> None:
+        self.write_block(port, MCTRL300.REG_TEST_PATTERN, bytes([MCTRL300.PATTERN_NORMAL]), board)
+
+    def set_brightness(self, port: int, value: int, board: Optional[int] = None) -> None:
+        self.write_block(port, MCTRL300.REG_BRIGHTNESS_OVERALL, bytes([value]), board)
+
+    def write_block(
+        self,
+        port: int,
+        reg_addr: int,
+        data: Union[bytes, bytearray, memoryview],
+        board: Optional[int] = None,
+    ) -> None:
+        """Add a write of consecutive registers, split into frames, see MCTRL300.write_block."""
+        block = bytes(data)
+        self.screen._check_block_len(len(block))
+        for offset in range(0, len(block), MCTRL300.MAX_FRAME_DATA_LEN):
+            chunk = block[offset : offset + MCTRL300.MAX_FRAME_DATA_LEN]
+            self.writes.append(BatchResult(port, reg_addr + offset, chunk, board))
+
+    def commit(self) -> List[BatchResult]:
+        """Send the writes collected so far.
+
+        Raises:
+            MCTRL300BatchError: some writes failed.
+
+        Returns:
+            List[BatchResult]: outcome of every write, in order.
+        """
+        writes, self.writes = self.writes, []
+        results = self.screen._commit_batch(writes)
+        self.results += results
+        if any(r.error is not None for r in results):
+            raise MCTRL300BatchError(results)
+        return results
 
 
 class MCTRL300CreateCommand:
+    SRC_ADDR = 0xFE  # computer
+    DEST_ADDR = 0x00
+    CARD_TYPE = 0x01  # 00 for sender, 01 for receiver, 02 for function
+    NUMPY_MIN_BATCH = 64  # below this, calculating checksums in Python is faster
+
     def __init__(self):
-        self.msg = bytearray()
+        """Encoder for commands to the processor.
+
+        The encoder does not keep any state besides a cache of preformatted headers, one per
+        (ack, is_cmd, port, is_write, board) combination, so it can be shared between threads.
+        """
+        self._templates: Dict[Tuple[int, bool, int, bool, Optional[int]], bytes] = {}
 
     def generate(
         self,
         serno: int,
         reg_addr: int,
         data_len: int,
-        data: Union[int, List[int], None],
+        data: Union[int, List[int], bytes, None],
         port: int,
         is_cmd: bool = True,
         is_write: bool = True,
         ack=0,
+        board: Optional[int] = None,
     ) -> bytearray:
         """Generate a command to be sent to processor.
 
@@ -207,107 +943,124 @@ def generate(
             serno (int): message id, used to reference commands and responses. Can be any value.
             reg_addr (int): address of the register to be written/read.
             data_len (int): number of bytes to be sent/read to/from device.
-            data (Union[int, List[int]]): data to be sent.
+            data (Union[int, List[int], bytes]): data to be sent.
             port (int): port to which screen is connected, 1 or 2.
             is_cmd (bool, optional): cmd is a command, not request. Defaults to True.
             is_write (bool, optional): indicates a write command. Defaults to True.
             ack (int, optional): is an acknowledge command. Defaults to 0.
+            board (Optional[int], optional): address of the receiving card, 0 for the first card
+                                    on port. Defaults to None (0xFFFF, all cards, for commands
+                                    and 0 for replies).
 
         Returns:
             bytearray: complete command
         """
-        self.msg = bytearray()
-        self._append_header(is_cmd)
-        self._append_ack(ack)
-        self.msg.append(serno)
-        self._append_src()
-        self._append_dest()
-        self._append_card_type()
-        self._append_port_addr(port)
-        self._append_board_addr(is_cmd)
-        self._append_cmd_type(is_write)
-        self._append_reserved()
-        self._append_reg_addr(reg_addr)
-        self._append_data_len(data_len)
-        self._append_data(data)
-        self._append_checksum()
-        return self.msg
-
-    def _append_ack(self, ack) -> None:
-        self.msg.append(ack)
-
-    def _append_checksum(self) -> None:
-        """Add checksum at the end of message.
-
-        Checksum is calculated by taking the sum of all bytes starting with message id/number, then
-        adding 0xFFFF. The resulting two bytes are then added LSB, MSB
-        """
-        c = sum(self.msg[3:])
-        c += 0x5555
-        self.msg.append(c & 0xFF)
-        self.msg.append(c >> 8)
+        payload = self._payload(data)
+        msg = bytearray(self._template(ack, is_cmd, port, is_write, board))
+        msg[3] = serno
+        _REG_ADDR_DATA_LEN.pack_into(msg, 12, reg_addr, data_len)
+        msg += payload
+        # header bytes are not part of the checksum, both headers sum to the same value
+        msg += _CHECKSUM.pack((sum(msg) - _HEADER_SUM + CHECKSUM_OFFSET) & 0xFFFF)
+        return msg
 
-    def _append_data(self, data: Union[int, list, None]) -> None:
-        """Append the data payload to the message.
+    def generate_batch(self, commands: Sequence[MCTRL300Command]) -> bytearray:
+        """Encode several commands into one contiguous buffer.
 
-        Message might be a list of bytes, a single value (int), or None (ie for a request).
+        Checksums are calculated with NumPy for large batches if it is installed.
 
         Args:
-            data (Union[int, list, None]): data payload (None if no data to be sent)
-        """
-        if data and isinstance(data, list):
-            self.msg.append(*data)
-        elif data is not None:
-            self.msg.append(data)
+            commands (Sequence[MCTRL300Command]): commands to encode, in order.
 
-    def _append_data_len(self, data_len) -> None:
-        """Add the data length.
+        Returns:
+            bytearray: all frames, back to back.
+        """
+        use_numpy = len(commands) >= self.NUMPY_MIN_BATCH and _numpy()
+        frames = []
+        ends = []
+        end = 0
+        for cmd in commands:
+            frame = bytearray(self._template(0, True, cmd.port, cmd.is_write, cmd.board))
+            frame[3] = cmd.serno
+            _REG_ADDR_DATA_LEN.pack_into(frame, 12, cmd.reg_addr, cmd.data_len)
+            frame += self._payload(cmd.data)
+            if use_numpy:
+                frame += bytes(CHECKSUM_LEN)  # filled in by _batch_checksums
+            else:
+                frame += _CHECKSUM.pack((sum(frame) - _HEADER_SUM + CHECKSUM_OFFSET) & 0xFFFF)
+            frames.append(frame)
+            end += len(frame)
+            ends.append(end)
+        buff = bytearray().join(frames)
+        if use_numpy:
+            self._batch_checksums(buff, ends)
+        return buff
 
-        2 bytes, first LSB then MSB.
+    def _batch_checksums(self, buff: bytearray, ends: List[int]) -> None:
+        """Fill in the checksums of all frames in buff using NumPy.
 
         Args:
-            data_len (int): Length of data to read/write. Range 0 - 0xFFFF
+            buff (bytearray): frames with the checksum bytes still set to 0.
+            ends (List[int]): end offset of each frame in buff.
         """
-        self.msg.append(data_len & 0xFF)
-        self.msg.append((data_len & 0xFF) >> 8)
-
-    def _append_reg_addr(self, reg_addr) -> None:
-        self.msg.append(reg_addr & 0xFF)
-        self.msg.append((reg_addr & 0x0000FF00) >> 8)
-        self.msg.append((reg_addr & 0x00FF0000) >> 16)
-        self.msg.append((reg_addr & 0xFF000000) >> 24)
-
-    def _append_header(self, is_cmd) -> None:
-        header = [0x55, 0xAA] if is_cmd else [0xAA, 0x55]
-        for i in header:
-            self.msg.append(i)  # header
-
-    def _append_src(self) -> None:
-        self.msg.append(0xFE)
-
-    def _append_dest(self) -> None:
-        self.msg.append(0x00)
+        arr = np.frombuffer(buff, dtype=np.uint8)  # writable view, buff is a bytearray
+        cumsum = np.concatenate(([0], np.cumsum(arr, dtype=np.int64)))
+        end = np.asarray(ends, dtype=np.int64)
+        start = np.concatenate(([0], end[:-1]))
+        checksum = cumsum[end - CHECKSUM_LEN] - cumsum[start + 2] + CHECKSUM_OFFSET
+        arr[end - 2] = checksum & 0xFF
+        arr[end - 1] = (checksum >> 8) & 0xFF
 
-    def _append_card_type(self) -> None:
-        # 00 for sender, 01 for receiver, 02 for function
-        self.msg.append(0x01)
-
-    def _append_port_addr(self, port) -> None:
-        self.msg.append(port - 1)
-
-    def _append_board_addr(self, is_cmd: bool) -> None:
-        for i in [0xFF, 0xFF] if is_cmd else [0x0, 0x0]:
-            self.msg.append(i)
+    def _template(
+        self,
+        ack: int,
+        is_cmd: bool,
+        port: int,
+        is_write: bool,
+        board: Optional[int] = None,
+    ) -> bytes:
+        """Return the preformatted header, serial number, register and data length left 0."""
+        key = (ack, is_cmd, port, is_write, board)
+        template = self._templates.get(key)
+        if template is None:
+            if board is None:
+                board = BROADCAST if is_cmd else 0x0000
+            elif not 0 <= board < BROADCAST:
+                msg = f'Board address should be 0 to {BROADCAST - 1}, not {board}.'
+                raise ValueError(msg)
+            template = (CMD_HEADER if is_cmd else REPLY_HEADER) + _TEMPLATE.pack(
+                ack,
+                0,  # serial number
+                self.SRC_ADDR,
+                self.DEST_ADDR,
+                self.CARD_TYPE,
+                port - 1,
+                board,
+                0x01 if is_write else 0x00,
+                0x00,  # reserved
+                0,  # register address
+                0,  # data length
+            )
+            self._templates[key] = template
+        return template
 
-    def _append_cmd_type(self, is_write) -> None:
-        self.msg.append(0x01 if is_write else 0x00)
+    @staticmethod
+    def _payload(data: Union[int, List[int], bytes, None]) -> bytes:
+        """Convert the data payload to bytes.
 
-    def _append_reserved(self) -> None:
-        self.msg.append(0x00)
+        Data might be a list of bytes, a bytes-like object, a single value (int), or None (ie for
+        a request).
+        """
+        if data is None:
+            return b''
+        if isinstance(data, int):
+            return bytes((data,))
+        return bytes(data)
 
 
 if __name__ == '__main__':
-    p = Mctrl300Serial('/dev/ttyUSB0')
+    # port as first argument, i.e. the port printed by `python -m novastar_mctrl300.emulator`
+    p = Mctrl300Serial(sys.argv[1] if len(sys.argv) > 1 else '/dev/ttyUSB0')
     s = MCTRL300(p)
     # s.get_brightness(1)
     # s.set_pattern(MCTRL300.PATTERN_RED, 1)
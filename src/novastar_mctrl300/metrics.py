@@ -0,0 +1,179 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+
+__author__ = 'Dieter Vansteenwegen'
+__project__ = 'Novastar_MCTRL300_basic_controller'
+__project_link__ = 'https://github.com/dietervansteenwegen/Novastar_MCTRL300_basic_controller'
+
+import collections
+import logging
+import threading
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+PROMETHEUS_PORT = 9300
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class CommandMetrics(NamedTuple):
+    """Timing and size of one command, all times in seconds."""
+
+    port: int
+    reg_addr: int
+    is_write: bool
+    encode_time: float
+    write_time: float
+    reply_time: Optional[float]  # write done until ACK/reply received, None if not waited for
+    tx_bytes: int
+    rx_bytes: int
+    retries: int
+    error: Optional[str]  # name of the exception class, None if successful
+
+
+class _Totals:
+    __slots__ = (
+        'commands',
+        'retries',
+        'tx_bytes',
+        'rx_bytes',
+        'encode_time',
+        'write_time',
+        'reply_time',
+        'replies',
+        'max_reply_time',
+        'errors',
+    )
+
+    def __init__(self):
+        self.commands = 0
+        self.retries = 0
+        self.tx_bytes = 0
+        self.rx_bytes = 0
+        self.encode_time = 0.0
+        self.write_time = 0.0
+        self.reply_time = 0.0
+        self.replies = 0
+        self.max_reply_time = 0.0
+        self.errors: Dict[str, int] = collections.Counter()
+
+
+class MCTRL300Metrics:
+    def __init__(self):
+        """Collects CommandMetrics per (port, register) and passes them on to hooks.
+
+        Hooks are called synchronously on the thread sending the command, so they should be cheap.
+        """
+        self.log = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._totals: Dict[Tuple[int, int], _Totals] = collections.defaultdict(_Totals)
+        self._hooks: List[Callable[[CommandMetrics], None]] = []
+
+    def add_hook(self, hook: Callable[[CommandMetrics], None]) -> None:
+        """Call hook with the CommandMetrics of every command."""
+        self._hooks.append(hook)
+
+    def remove_hook(self, hook: Callable[[CommandMetrics], None]) -> None:
+        self._hooks.remove(hook)
+
+    def record(self, m: CommandMetrics) -> None:
+        with self._lock:
+            t = self._totals[(m.port, m.reg_addr)]
+            t.commands += 1
+            t.retries += m.retries
+            t.tx_bytes += m.tx_bytes
+            t.rx_bytes += m.rx_bytes
+            t.encode_time += m.encode_time
+            t.write_time += m.write_time
+            if m.reply_time is not None:
+                t.replies += 1
+                t.reply_time += m.reply_time
+                t.max_reply_time = max(t.max_reply_time, m.reply_time)
+            if m.error:
+                t.errors[m.error] += 1
+        for hook in self._hooks:
+            try:
+                hook(m)
+            except Exception:
+                self.log.exception('Metrics hook %s failed.', hook)
+
+    def snapshot(self) -> Dict[Tuple[int, int], Dict[str, object]]:
+        """Return the totals per (port, register) as plain dicts."""
+        with self._lock:
+            snapshot = {}
+            for key, t in self._totals.items():
+                snapshot[key] = {name: getattr(t, name) for name in _Totals.__slots__}
+                snapshot[key]['errors'] = dict(t.errors)
+            return snapshot
+
+    def prometheus_text(self) -> str:
+        """Return the totals in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        lines = []
+        for name, field, kind, help_text in (
+            ('commands_total', 'commands', 'counter', 'Commands sent.'),
+            ('retries_total', 'retries', 'counter', 'Commands sent again after an error.'),
+            ('tx_bytes_total', 'tx_bytes', 'counter', 'Bytes written to the serial port.'),
+            ('rx_bytes_total', 'rx_bytes', 'counter', 'Bytes of valid replies received.'),
+            ('encode_seconds_total', 'encode_time', 'counter', 'Time spent encoding frames.'),
+            ('write_seconds_total', 'write_time', 'counter', 'Time spent writing frames.'),
+            ('reply_seconds_total', 'reply_time', 'counter', 'Time spent waiting for replies.'),
+            ('replies_total', 'replies', 'counter', 'Replies waited for.'),
+            ('reply_seconds_max', 'max_reply_time', 'gauge', 'Longest wait for a reply.'),
+        ):
+            lines.append(f'# HELP mctrl300_{name} {help_text}')
+            lines.append(f'# TYPE mctrl300_{name} {kind}')
+            for (port, reg_addr), totals in sorted(snapshot.items()):
+                labels = f'port="{port}",register="0x{reg_addr:08X}"'
+                lines.append(f'mctrl300_{name}{{{labels}}} {totals[field]}')
+        lines.append('# HELP mctrl300_errors_total Commands that failed, by exception.')
+        lines.append('# TYPE mctrl300_errors_total counter')
+        for (port, reg_addr), totals in sorted(snapshot.items()):
+            for error, count in sorted(totals['errors'].items()):
+                labels = f'port="{port}",register="0x{reg_addr:08X}",error="{error}"'
+                lines.append(f'mctrl300_errors_total{{{labels}}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+class PrometheusExporter:
+    def __init__(
+        self,
+        metrics: MCTRL300Metrics,
+        host: str = '127.0.0.1',
+        port: int = PROMETHEUS_PORT,
+    ):
+        """Serve the metrics in Prometheus text format on http://host:port/metrics.
+
+        Args:
+            metrics (MCTRL300Metrics): metrics to export.
+            host (str, optional): address to listen on. Defaults to '127.0.0.1' (local only).
+            port (int, optional): TCP port to listen on, 0 for any free port.
+                                    Defaults to PROMETHEUS_PORT.
+        """
+        import http.server  # only needed when exporting, slow to import
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self) -> None:  # noqa: N802
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus_text().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', PROMETHEUS_CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args) -> None:
+                pass
+
+        self.server = http.server.ThreadingHTTPServer((host, port), Handler)
+        self.port = self.server.server_address[1]
+        self._thread = threading.Thread(
+            target=self.server.serve_forever,
+            name='mctrl300-prometheus',
+            daemon=True,
+        )
+        self._thread.start()
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,215 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+
+__author__ = 'Dieter Vansteenwegen'
+__project__ = 'Novastar_MCTRL300_basic_controller'
+__project_link__ = 'https://github.com/dietervansteenwegen/Novastar_MCTRL300_basic_controller'
+
+import logging
+import threading
+from concurrent.futures import Future
+from time import monotonic
+from typing import Dict, List, NamedTuple, Optional, Union
+
+import serial
+
+from novastar_mctrl300.decoder import MCTRL300FrameDecoder, MCTRL300Reply
+from novastar_mctrl300.mctrl300 import (
+    MCTRL300,
+    MCTRL300CreateCommand,
+    MCTRL300Error,
+    MCTRL300IncorrectReplyError,
+    MCTRL300NoReplyError,
+    ack_error,
+)
+
+POLL_INTERVAL = 0.05  # max time the reader blocks, determines timeout resolution
+MAX_WINDOW = 0xFF  # one serial number must stay free to tell replies apart
+
+
+class _Pending(NamedTuple):
+    future: Future
+    deadline: float
+    reply_data_length: int
+
+
+class MCTRL300Pipeline:
+    def __init__(self, serport: serial.Serial, window: int = 16, timeout: float = 1):
+        """Pipelined request/response engine for the MCTRL300.
+
+        Up to `window` requests can be outstanding at the same time. Replies are matched to their
+        request by serial number in a background reader thread. Every submit returns a
+        concurrent.futures.Future that resolves to the reply data (empty for writes) or to one of
+        the MCTRL300Error exceptions.
+
+        Args:
+            serport (serial.Serial): open serial port to which the MCTRL300 is connected.
+            window (int, optional): max number of outstanding requests, 1 to 255. Defaults to 16.
+            timeout (float, optional): seconds to wait for each reply. Defaults to 1.
+        """
+        if not 1 <= window <= MAX_WINDOW:
+            msg = f'window should be 1 to {MAX_WINDOW}, not {window}'
+            raise ValueError(msg)
+        self.log = logging.getLogger(__name__)
+        self.serport = serport
+        self.window = window
+        self.timeout = timeout
+        self.creator = MCTRL300CreateCommand()
+        self._decoder = MCTRL300FrameDecoder(max_data_len=MCTRL300.MAX_FRAME_DATA_LEN)
+        self._slots = threading.BoundedSemaphore(window)
+        self._lock = threading.Lock()
+        self._pending: Dict[int, _Pending] = {}
+        self._msg_id = 0
+        self._running = True
+        self.serport.timeout = POLL_INTERVAL
+        self.serport.reset_input_buffer()
+        self._reader = threading.Thread(target=self._read_loop, name='mctrl300-reader', daemon=True)
+        self._reader.start()
+        self.log.debug('Created pipeline with window %s.', window)
+
+    def __enter__(self) -> 'MCTRL300Pipeline':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def submit_write(
+        self,
+        port: int,
+        reg_addr: int,
+        data: Union[int, List[int], bytes],
+        board: Optional[int] = None,
+    ) -> Future:
+        """Queue a register write.
+
+        Blocks while `window` requests are outstanding.
+
+        Args:
+            port (int): port to which screen is connected, 1 or 2.
+            reg_addr (int): address of the register to be written.
+            data (Union[int, List[int], bytes]): data to be written, one frame.
+            board (Optional[int], optional): receiving card. Defaults to None (all cards).
+
+        Returns:
+            Future: resolves to empty bytes once the write is acknowledged.
+        """
+        data_len = 1 if isinstance(data, int) else len(data)
+        return self._submit(port, reg_addr, data_len, data, is_write=True, board=board)
+
+    def submit_read(
+        self,
+        port: int,
+        reg_addr: int,
+        length: int = 1,
+        board: Optional[int] = None,
+    ) -> Future:
+        """Queue a register read.
+
+        Blocks while `window` requests are outstanding.
+
+        Args:
+            port (int): port to which screen is connected, 1 or 2.
+            reg_addr (int): address of the register to be read.
+            length (int, optional): number of bytes to read. Defaults to 1.
+            board (Optional[int], optional): receiving card. Defaults to None (broadcast, which
+                                    is answered by the first card).
+
+        Returns:
+            Future: resolves to the data read.
+        """
+        return self._submit(port, reg_addr, length, None, is_write=False, board=board)
+
+    def close(self) -> None:
+        """Stop the reader thread and fail all outstanding requests."""
+        self._running = False
+        if self._reader.is_alive() and self._reader is not threading.current_thread():
+            self._reader.join()
+        self._fail_all(MCTRL300Error('Pipeline closed.'))
+
+    def _submit(
+        self,
+        port: int,
+        reg_addr: int,
+        data_len: int,
+        data: Union[int, List[int], bytes, None],
+        is_write: bool,
+        board: Optional[int] = None,
+    ) -> Future:
+        if not self._running:
+            msg = 'Pipeline closed.'
+            raise MCTRL300Error(msg)
+        self._slots.acquire()
+        future: Future = Future()
+        with self._lock:
+            if not self._running:  # reader stopped while waiting for a slot, nobody would reply
+                self._slots.release()
+                future.set_exception(MCTRL300Error('Pipeline closed.'))
+                return future
+            serno = self._next_msg_id()
+            cmd = self.creator.generate(
+                serno=serno,
+                port=port,
+                reg_addr=reg_addr,
+                data_len=data_len,
+                data=data,
+                is_write=is_write,
+                board=board,
+            )
+            reply_data_length = 0 if is_write else data_len
+            self._pending[serno] = _Pending(future, monotonic() + self.timeout, reply_data_length)
+            self.serport.write(cmd)
+        return future
+
+    def _next_msg_id(self) -> int:
+        """Return the next serial number that is not in use by an outstanding request."""
+        while self._msg_id in self._pending:
+            self._msg_id = (self._msg_id + 1) & 0xFF
+        serno = self._msg_id
+        self._msg_id = (self._msg_id + 1) & 0xFF
+        return serno
+
+    def _read_loop(self) -> None:
+        while self._running:
+            try:
+                chunk = self.serport.read(self.serport.in_waiting or 1)
+            except serial.SerialException as e:
+                self.log.exception('Reading from serial port failed.')
+                self._fail_all(MCTRL300Error(e))
+                return
+            if chunk:
+                for reply in self._decoder.feed(chunk):
+                    self._resolve(reply)
+            self._expire()
+
+    def _resolve(self, reply: MCTRL300Reply) -> None:
+        with self._lock:
+            pending = self._pending.pop(reply.serno, None)
+        if pending is None:
+            self.log.warning('Dropped reply to unknown message %s.', reply.serno)
+            return
+        self._slots.release()
+        error = ack_error(reply.ack, reply.serno)
+        if error is None and len(reply.data) != pending.reply_data_length:
+            error = MCTRL300IncorrectReplyError(reply)
+        if error:
+            pending.future.set_exception(error)
+        else:
+            pending.future.set_result(reply.data)
+
+    def _expire(self) -> None:
+        now = monotonic()
+        with self._lock:
+            expired = [serno for serno, p in self._pending.items() if p.deadline <= now]
+            expired_pending = {serno: self._pending.pop(serno) for serno in expired}
+        for serno, p in expired_pending.items():
+            self._slots.release()
+            self.log.error('No reply to message %s.', serno)
+            p.future.set_exception(MCTRL300NoReplyError(serno, self.timeout))
+
+    def _fail_all(self, error: Exception) -> None:
+        self._running = False
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for p in pending.values():
+            self._slots.release()
+            p.future.set_exception(error)
@@ -0,0 +1,200 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+
+__author__ = 'Dieter Vansteenwegen'
+__project__ = 'Novastar_MCTRL300_basic_controller'
+__project_link__ = 'https://github.com/dietervansteenwegen/Novastar_MCTRL300_basic_controller'
+
+import itertools
+import logging
+import threading
+from time import monotonic
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+import serial
+
+from novastar_mctrl300.mctrl300 import MCTRL300, MCTRL300Error
+
+START_DELAY = 0.05  # seconds between start() and the first step, so all threads are waiting
+LEAD_WEIGHT = 0.25  # weight of the latest latency in the moving average that sets the lead
+
+
+class SequenceStep(NamedTuple):
+    pattern: Optional[int] = None  # None leaves the pattern unchanged
+    brightness: Optional[int] = None  # None leaves the brightness unchanged
+    dwell: float = 1  # seconds until the next step
+
+
+class StepReport(NamedTuple):
+    screen: int  # index of the controller, in the order of the targets
+    cycle: int  # number of times the sequence was completed before this step
+    step: int  # index in the sequence
+    scheduled: float  # monotonic() time at which the step should be shown
+    sent: float  # monotonic() time the first command was sent, scheduled - lead ideally
+    done: float  # monotonic() time the last command completed
+    lead: float  # seconds the commands were started early, mean latency of the step so far
+    error: Optional[Exception]
+
+    @property
+    def late(self) -> float:
+        """Seconds the step completed after it was scheduled, negative if early."""
+        return self.done - self.scheduled
+
+
+Target = Tuple[MCTRL300, int]  # controller, port
+
+
+def color_cycle(
+    dwell: float,
+    patterns: Iterable[int] = (MCTRL300.PATTERN_RED, MCTRL300.PATTERN_GREEN, MCTRL300.PATTERN_BLUE),
+) -> List[SequenceStep]:
+    """Return the steps of a red, green and blue (or other patterns) cycle."""
+    return [SequenceStep(pattern=p, dwell=dwell) for p in patterns]
+
+
+class PatternSequencer:
+    def __init__(
+        self,
+        targets: Sequence[Target],
+        steps: Sequence[SequenceStep],
+        repeat: Optional[int] = None,
+        on_step: Optional[Callable[[StepReport], None]] = None,
+    ):
+        """Step through a sequence of patterns and brightness values with accurate dwell times.
+
+        Every step is scheduled at start + the dwell times of the steps before it, against
+        time.monotonic(), so delays do not add up over cycles. The commands of a step are sent
+        `lead` seconds early, the moving average of the latency of that step in earlier cycles
+        (steps can have a different number of commands), so they have completed at the scheduled
+        time. Until that is known, the latency of the step before is used. With
+        wait_for_ack=False, MCTRL300.WRITE_DELAY counts as latency; wait_for_ack=True gives the
+        actual latency. A step that is still not sent when the next one is due is skipped (and
+        counted in `skipped`), so later steps stay on time.
+
+        Every controller gets its own thread; all ports of a controller are set one after the other
+        within a step. All threads use the same start time, pass the same start_at to the start of
+        several sequencers to synchronise them as well.
+
+        Args:
+            targets (Sequence[Target]): (controller, port) to run the sequence on. A controller is
+                                    anything with the set_pattern and set_brightness methods of
+                                    MCTRL300 (i.e. MCTRL300Client).
+            steps (Sequence[SequenceStep]): the sequence.
+            repeat (Optional[int], optional): number of times to run the sequence.
+                                    Defaults to None (until stopped).
+            on_step (Optional[Callable[[StepReport], None]], optional): called on the thread of
+                                    the controller after every step. Defaults to None.
+        """
+        if not steps or any(step.dwell <= 0 for step in steps):
+            msg = 'A sequence needs at least one step, every step a dwell time above 0.'
+            raise ValueError(msg)
+        self.log = logging.getLogger(__name__)
+        self.steps = list(steps)
+        self.repeat = repeat
+        self.on_step = on_step
+        self.period = sum(step.dwell for step in self.steps)
+        self._offsets = list(itertools.accumulate([0.0] + [s.dwell for s in self.steps[:-1]]))
+        self.screens: Dict[int, Tuple[MCTRL300, List[int]]] = {}  # id(controller): ports
+        for screen, port in targets:
+            self.screens.setdefault(id(screen), (screen, []))[1].append(port)
+        self.start_at: Optional[float] = None
+        self.skipped = 0
+        self._skipped_lock = threading.Lock()  # skipped is counted by the threads of all screens
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self, start_at: Optional[float] = None) -> float:
+        """Start the threads, the first step is shown at start_at.
+
+        Args:
+            start_at (Optional[float], optional): time.monotonic() of the first step.
+                                    Defaults to None (START_DELAY from now).
+
+        Returns:
+            float: start_at.
+        """
+        if self._threads:
+            msg = 'Sequencer already started.'
+            raise RuntimeError(msg)
+        self.start_at = monotonic() + START_DELAY if start_at is None else start_at
+        for index, (screen, ports) in enumerate(self.screens.values()):
+            thread = threading.Thread(
+                target=self._run,
+                args=(index, screen, ports),
+                name=f'mctrl300-sequencer-{index}',
+                daemon=True,
+            )
+            self._threads.append(thread)
+            thread.start()
+        return self.start_at
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop after the commands being sent, wait for the threads to end."""
+        self._stop.set()
+        self.wait(timeout)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Wait for the sequence to end.
+
+        Returns:
+            bool: True if all threads ended.
+        """
+        deadline = None if timeout is None else monotonic() + timeout
+        for thread in self._threads:
+            if thread is threading.current_thread():
+                continue
+            thread.join(None if deadline is None else max(0, deadline - monotonic()))
+        return not self.running
+
+    @property
+    def running(self) -> bool:
+        return any(thread.is_alive() for thread in self._threads)
+
+    def __enter__(self) -> 'PatternSequencer':
+        self.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def _run(self, index: int, screen: MCTRL300, ports: List[int]) -> None:
+        leads: Dict[int, float] = {}  # step index: moving average of the latency
+        latency = 0.0
+        cycles = itertools.count() if self.repeat is None else range(self.repeat)
+        for cycle in cycles:
+            for step_index, (step, offset) in enumerate(zip(self.steps, self._offsets)):  # noqa: B905
+                scheduled = self.start_at + cycle * self.period + offset
+                early = leads.get(step_index, latency)
+                if self._stop.wait(max(0, scheduled - early - monotonic())):
+                    return
+                if monotonic() >= scheduled + step.dwell - early:
+                    with self._skipped_lock:
+                        self.skipped += 1
+                    self.log.warning('Skipped step %s of cycle %s, too late.', step_index, cycle)
+                    continue
+                sent = monotonic()
+                error = self._send(screen, ports, step)
+                done = monotonic()
+                latency = done - sent
+                if step_index in leads:
+                    leads[step_index] += LEAD_WEIGHT * (latency - leads[step_index])
+                else:
+                    leads[step_index] = latency
+                report = StepReport(index, cycle, step_index, scheduled, sent, done, early, error)
+                self.log.debug('Step %s: %.1f ms late.', step_index, report.late * 1000)
+                if self.on_step is not None:
+                    self.on_step(report)
+
+    def _send(self, screen: MCTRL300, ports: List[int], step: SequenceStep) -> Optional[Exception]:
+        """Send the commands of a step to all ports of screen, return the first error."""
+        error = None
+        for port in ports:
+            try:
+                if step.pattern is not None:
+                    screen.set_pattern(step.pattern, port)
+                if step.brightness is not None:
+                    screen.set_brightness(port, step.brightness)
+            except (MCTRL300Error, serial.SerialException) as e:
+                self.log.error('Step on output %s failed: %s', port, e)
+                error = error or e
+        return error
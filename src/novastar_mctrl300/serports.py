@@ -6,17 +6,25 @@
 __project_link__ = 'https://github.com/dietervansteenwegen/Novastar_MCTRL300_basic_controller'
 
 import serial
-from serial.tools import list_ports
 
 BAUDRATE = 115200
 TIMEOUT = 4
+CONTROLLER_PRODUCT = 'CP2102'  # USB to UART bridge in the MCTRL300
 
 
 def get_available_ports() -> list:
+    from serial.tools import list_ports  # slow to import, only needed once the ports are listed
+
     ports = list_ports.comports(include_links=False)
     return [(i, port.device, port.manufacturer, port.product) for i, port in enumerate(ports)]
 
 
+def is_controller_port(port: tuple) -> bool:
+    """Check whether a port returned by get_available_ports can be an MCTRL300."""
+    product = port[3] or ''
+    return product.startswith(CONTROLLER_PRODUCT)
+
+
 class Mctrl300Serial(serial.Serial):
     def __init__(self, port: str):
         super().__init__(
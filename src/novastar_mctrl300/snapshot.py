@@ -0,0 +1,215 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+"""Snapshots of controller registers, saved to and restored from a file.
+
+A snapshot file is either JSON (when the name ends in .json):
+    {"format": "mctrl300-snapshot", "version": 1, "ranges": [
+        {"port": 1, "board": null, "reg": "0x02000001", "data": "ff"}, ...]}
+or binary (little endian): the 8 byte MAGIC, followed by records of
+    port (1 byte), board (2 bytes, 0xFFFF for all), register (4 bytes), length (2 bytes), data.
+"""
+
+__author__ = 'Dieter Vansteenwegen'
+__project__ = 'Novastar_MCTRL300_basic_controller'
+__project_link__ = 'https://github.com/dietervansteenwegen/Novastar_MCTRL300_basic_controller'
+
+import json
+import logging
+import pathlib
+import struct
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from novastar_mctrl300.cache import BROADCAST
+from novastar_mctrl300.mctrl300 import MCTRL300
+
+MAGIC = b'MCSNAP01'
+JSON_FORMAT = 'mctrl300-snapshot'
+JSON_VERSION = 1
+MAX_GAP = 16  # unchanged bytes rewritten to join two writes, cheaper than a frame header
+
+_RECORD = struct.Struct('<BHIH')
+
+log = logging.getLogger(__name__)
+
+
+class RegisterRange(NamedTuple):
+    port: int
+    reg_addr: int
+    length: int
+    board: Optional[int] = None  # receiving card, None for all (read from the first card)
+
+
+DEFAULT_RANGES = tuple(
+    RegisterRange(port, reg_addr, 1)
+    for port in (1, 2)
+    for reg_addr in (MCTRL300.REG_BRIGHTNESS_OVERALL, MCTRL300.REG_TEST_PATTERN)
+)
+
+
+class RegisterWrite(NamedTuple):
+    port: int
+    reg_addr: int
+    data: bytes
+    board: Optional[int] = None
+
+
+def _changed(current: bytes, wanted: bytes, max_gap: int) -> List[Tuple[int, int]]:
+    """Return the (start, end) offsets of the runs of bytes that differ, joined over short gaps."""
+    runs: List[Tuple[int, int]] = []
+    for i, (old, new) in enumerate(zip(current, wanted)):  # noqa: B905
+        if old == new:
+            continue
+        if runs and i - runs[-1][1] <= max_gap:
+            runs[-1] = (runs[-1][0], i + 1)
+        else:
+            runs.append((i, i + 1))
+    return runs
+
+
+class MCTRL300Snapshot:
+    def __init__(self, registers: Optional[Dict[RegisterRange, bytes]] = None):
+        """Contents of register ranges of a controller, see take, load and restore.
+
+        Args:
+            registers (Optional[Dict[RegisterRange, bytes]], optional): data of every range.
+                                    Defaults to None (empty).
+        """
+        self.registers: Dict[RegisterRange, bytes] = dict(registers or {})
+        for rng, data in self.registers.items():
+            if len(data) != rng.length:
+                msg = f'{rng} has {len(data)} bytes of data.'
+                raise ValueError(msg)
+
+    @classmethod
+    def take(
+        cls,
+        screen: MCTRL300,
+        ranges: Sequence[RegisterRange] = DEFAULT_RANGES,
+    ) -> 'MCTRL300Snapshot':
+        """Read the register ranges from the controller.
+
+        Args:
+            screen (MCTRL300): connected controller (or anything with its read_block, i.e.
+                                    MCTRL300Client).
+            ranges (Sequence[RegisterRange], optional): ranges to read, up to MAX_BLOCK_LEN bytes
+                                    each. Defaults to DEFAULT_RANGES.
+        """
+        return cls(
+            {
+                rng: screen.read_block(rng.port, rng.reg_addr, rng.length, rng.board)
+                for rng in ranges
+            },
+        )
+
+    def __iter__(self) -> Iterator[Tuple[RegisterRange, bytes]]:
+        return iter(self.registers.items())
+
+    def __len__(self) -> int:
+        return len(self.registers)
+
+    def save(self, path: str) -> None:
+        """Write the snapshot to path, as JSON if it ends in .json, binary otherwise."""
+        file = pathlib.Path(path)
+        if file.suffix.lower() == '.json':
+            ranges = [
+                {'port': r.port, 'board': r.board, 'reg': f'0x{r.reg_addr:08X}', 'data': d.hex()}
+                for r, d in self
+            ]
+            doc = {'format': JSON_FORMAT, 'version': JSON_VERSION, 'ranges': ranges}
+            file.write_text(json.dumps(doc, indent=1))
+            return
+        buff = bytearray(MAGIC)
+        for rng, data in self:
+            board = BROADCAST if rng.board is None else rng.board
+            buff += _RECORD.pack(rng.port, board, rng.reg_addr, rng.length)
+            buff += data
+        file.write_bytes(buff)
+
+    @classmethod
+    def load(cls, path: str) -> 'MCTRL300Snapshot':
+        """Read a snapshot written by save, in either format.
+
+        Raises:
+            ValueError: path is not a (complete) snapshot.
+        """
+        raw = pathlib.Path(path).read_bytes()
+        if raw.startswith(MAGIC):
+            return cls(dict(cls._records(raw, path)))
+        try:
+            doc = json.loads(raw)
+        except ValueError:
+            doc = None
+        if not isinstance(doc, dict) or doc.get('format') != JSON_FORMAT:
+            msg = f'{path} is not an MCTRL300 snapshot.'
+            raise ValueError(msg)
+        registers = {}
+        for r in doc['ranges']:
+            data = bytes.fromhex(r['data'])
+            registers[RegisterRange(r['port'], int(r['reg'], 0), len(data), r['board'])] = data
+        return cls(registers)
+
+    @staticmethod
+    def _records(raw: bytes, path: str) -> Iterator[Tuple[RegisterRange, bytes]]:
+        pos = len(MAGIC)
+        while pos < len(raw):
+            if pos + _RECORD.size > len(raw):
+                msg = f'{path} is truncated.'
+                raise ValueError(msg)
+            port, board, reg_addr, length = _RECORD.unpack_from(raw, pos)
+            pos += _RECORD.size
+            data = raw[pos : pos + length]
+            if len(data) != length:
+                msg = f'{path} is truncated.'
+                raise ValueError(msg)
+            pos += length
+            yield RegisterRange(port, reg_addr, length, None if board == BROADCAST else board), data
+
+    def diff(self, live: 'MCTRL300Snapshot', max_gap: int = MAX_GAP) -> List[RegisterWrite]:
+        """Return the writes that change live into this snapshot.
+
+        Bytes that differ are coalesced into contiguous writes; unchanged runs of up to max_gap
+        bytes between them are written as well, so they do not cost a frame of their own.
+
+        Args:
+            live (MCTRL300Snapshot): current state of (at least) the ranges of this snapshot.
+            max_gap (int, optional): longest run of unchanged bytes to rewrite.
+                                    Defaults to MAX_GAP.
+
+        Returns:
+            List[RegisterWrite]: writes, in the order of the ranges.
+        """
+        writes = []
+        for rng, wanted in self:
+            current = live.registers.get(rng)
+            runs = [(0, rng.length)] if current is None else _changed(current, wanted, max_gap)
+            writes += [
+                RegisterWrite(rng.port, rng.reg_addr + start, wanted[start:end], rng.board)
+                for start, end in runs
+            ]
+        return writes
+
+    def restore(
+        self,
+        screen: MCTRL300,
+        max_gap: int = MAX_GAP,
+        dry_run: bool = False,
+    ) -> List[RegisterWrite]:
+        """Write the registers that differ between the controller and this snapshot.
+
+        The ranges are read from the controller first (see take), the differences are written with
+        write_block, see diff.
+
+        Args:
+            screen (MCTRL300): connected controller (or MCTRL300Client).
+            max_gap (int, optional): see diff. Defaults to MAX_GAP.
+            dry_run (bool, optional): only return the writes. Defaults to False.
+
+        Returns:
+            List[RegisterWrite]: writes (to be) done.
+        """
+        writes = self.diff(self.take(screen, list(self.registers)), max_gap=max_gap)
+        log.info('Restoring %s ranges with %s writes.', len(self), len(writes))
+        if not dry_run:
+            for w in writes:
+                screen.write_block(w.port, w.reg_addr, w.data, w.board)
+        return writes
@@ -0,0 +1,206 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+
+__author__ = 'Dieter Vansteenwegen'
+__project__ = 'Novastar_MCTRL300_basic_controller'
+__project_link__ = 'https://github.com/dietervansteenwegen/Novastar_MCTRL300_basic_controller'
+
+import logging
+from concurrent.futures import Future
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+from novastar_mctrl300.mctrl300 import (
+    MCTRL300,
+    MCTRL300AckChecksumError,
+    MCTRL300AckTimeoutError,
+    MCTRL300Error,
+    MCTRL300IncorrectReplyError,
+)
+from novastar_mctrl300.pipeline import MCTRL300Pipeline
+
+MAX_BOARDS = 1024  # per output, scanning stops at the first missing card anyway
+SNAPSHOT_REGISTERS = (  # (register address, length) read from every card
+    (MCTRL300.REG_BRIGHTNESS_OVERALL, 1),
+    (MCTRL300.REG_TEST_PATTERN, 1),
+)
+RETRY_ON = (MCTRL300IncorrectReplyError, MCTRL300AckChecksumError)  # ACK 01 means no card
+
+log = logging.getLogger(__name__)
+
+_Read = Tuple[int, int, int, int]  # port, board, register address, length
+
+
+class ReceiverCard(NamedTuple):
+    port: int
+    board: int
+    registers: Dict[int, bytes]  # register address: data, registers that could not be read missing
+    errors: Dict[int, MCTRL300Error]  # register address: error of the registers that are missing
+
+
+class MCTRL300Topology:
+    def __init__(self, cards: Sequence[ReceiverCard] = ()):
+        """Receiving cards found on the outputs of a controller, see scan.
+
+        Args:
+            cards (Sequence[ReceiverCard], optional): cards to start with. Defaults to ().
+        """
+        self.ports: Dict[int, Dict[int, ReceiverCard]] = {}  # port: {board: card}
+        for card in cards:
+            self.add(card)
+
+    def add(self, card: ReceiverCard) -> None:
+        self.ports.setdefault(card.port, {})[card.board] = card
+
+    def card(self, port: int, board: int) -> Optional[ReceiverCard]:
+        return self.ports.get(port, {}).get(board)
+
+    def boards(self, port: int) -> List[int]:
+        return sorted(self.ports.get(port, {}))
+
+    def register(self, reg_addr: int) -> Dict[Tuple[int, int], Optional[bytes]]:
+        """Return the value of a register on every card, by (port, board)."""
+        return {(card.port, card.board): card.registers.get(reg_addr) for card in self}
+
+    def failed(self) -> List[ReceiverCard]:
+        """Return the cards of which some registers could not be read."""
+        return [card for card in self if card.errors]
+
+    def __iter__(self) -> Iterator[ReceiverCard]:
+        for port in sorted(self.ports):
+            for board in sorted(self.ports[port]):
+                yield self.ports[port][board]
+
+    def __len__(self) -> int:
+        return sum(len(boards) for boards in self.ports.values())
+
+    def __repr__(self) -> str:
+        cards = ', '.join(f'output {p}: {len(b)}' for p, b in sorted(self.ports.items()))
+        return f'MCTRL300Topology({cards})'
+
+
+def _read_all(
+    pipeline: MCTRL300Pipeline,
+    reads: Sequence[_Read],
+    retries: int,
+) -> Dict[_Read, Union[bytes, MCTRL300Error]]:
+    """Submit all reads, then gather the replies. Reads without (valid) reply are retried.
+
+    Returns:
+        Dict[_Read, Union[bytes, MCTRL300Error]]: data or error of every read.
+    """
+    results: Dict[_Read, Union[bytes, MCTRL300Error]] = {}
+    todo = list(reads)
+    for attempt in range(retries + 1):
+        futures: Dict[_Read, Future] = {
+            read: pipeline.submit_read(read[0], read[2], read[3], board=read[1]) for read in todo
+        }
+        todo = []
+        for read, future in futures.items():
+            try:
+                results[read] = future.result()
+            except MCTRL300Error as e:
+                results[read] = e
+                if attempt < retries and isinstance(e, RETRY_ON):
+                    todo.append(read)
+        if not todo:
+            break
+        log.debug('Retrying %s reads.', len(todo))
+    return results
+
+
+def _probed_cards(
+    results: Dict[_Read, Union[bytes, MCTRL300Error]],
+    port: int,
+    boards: range,
+    probe: Tuple[int, int],
+) -> Optional[Tuple[List[ReceiverCard], Optional[int]]]:
+    """Return the cards that exist according to the probe reads, up to the first missing one.
+
+    Returns:
+        Optional[Tuple[List[ReceiverCard], Optional[int]]]: cards and the first missing board
+                                    (None if all exist), None if no board answered at all.
+    """
+    cards = []
+    answered = False
+    for board in boards:
+        result = results[(port, board, *probe)]
+        if isinstance(result, MCTRL300AckTimeoutError):
+            return cards, board
+        if isinstance(result, MCTRL300Error):
+            cards.append(ReceiverCard(port, board, {}, {probe[0]: result}))
+        else:
+            answered = True
+            cards.append(ReceiverCard(port, board, {probe[0]: result}, {}))
+    return (cards, None) if answered else None
+
+
+def scan(
+    pipeline: MCTRL300Pipeline,
+    ports: Sequence[int] = (1, 2),
+    registers: Sequence[Tuple[int, int]] = SNAPSHOT_REGISTERS,
+    max_boards: int = MAX_BOARDS,
+    retries: int = 1,
+) -> MCTRL300Topology:
+    """Find the receiving cards on the outputs of a controller and read registers of each.
+
+    Cards are numbered from 0 along the cable of every output. They are detected by reading the
+    first register of registers from `pipeline.window` boards of every port at once, so the reads
+    are pipelined. The controller answers ACK 01 (timeout) for boards that do not exist; the scan
+    of a port ends at the first such board or when none of the boards of a round answered at all
+    (no controller). The other registers are then read from all cards found, pipelined as well.
+
+    Args:
+        pipeline (MCTRL300Pipeline): pipeline to the controller.
+        ports (Sequence[int], optional): outputs to scan. Defaults to (1, 2).
+        registers (Sequence[Tuple[int, int]], optional): (register address, length) to read
+                                    from every card, each at most MAX_FRAME_DATA_LEN bytes.
+                                    Defaults to SNAPSHOT_REGISTERS.
+        max_boards (int, optional): max number of cards per output. Defaults to MAX_BOARDS.
+        retries (int, optional): times to read again after no or an incorrect reply.
+                                    Defaults to 1.
+
+    Returns:
+        MCTRL300Topology: the cards found with their registers.
+    """
+    if not registers:
+        msg = 'At least one register is needed to detect the cards.'
+        raise ValueError(msg)
+    probe = tuple(registers[0])
+    found: Dict[Tuple[int, int], ReceiverCard] = {}
+    next_board = {port: 0 for port in ports}
+    while next_board:
+        reads = [
+            (port, board, *probe)
+            for port, first in next_board.items()
+            for board in range(first, min(first + pipeline.window, max_boards))
+        ]
+        results = _read_all(pipeline, reads, retries)
+        for port, first in list(next_board.items()):
+            end = min(first + pipeline.window, max_boards)
+            probed = _probed_cards(results, port, range(first, end), probe)
+            if probed is None:
+                log.warning('No card on output %s answered, stopped at board %s.', port, first)
+                del next_board[port]
+                continue
+            cards, missing = probed
+            found.update(((card.port, card.board), card) for card in cards)
+            if missing is not None or end >= max_boards:
+                log.debug('Found %s cards on output %s.', first + len(cards), port)
+                del next_board[port]
+            else:
+                next_board[port] = end
+
+    reads = [
+        (port, board, reg_addr, length)
+        for port, board in found
+        for reg_addr, length in registers[1:]
+    ]
+    for (port, board, reg_addr, _), result in _read_all(pipeline, reads, retries).items():
+        card = found[(port, board)]
+        if isinstance(result, MCTRL300Error):
+            card.errors[reg_addr] = result
+        else:
+            card.registers[reg_addr] = result
+    topology = MCTRL300Topology(list(found.values()))
+    log.info('Scanned %r.', topology)
+    return topology
@@ -0,0 +1,232 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+"""Capture of the serial traffic of an MCTRL300, with tools to replay and analyse it.
+
+Capture file format (little endian): the 8 byte MAGIC, followed by records of
+    direction (1 byte, TX or RX), time.monotonic_ns() (8 bytes), length (4 bytes), data.
+TX records are frames as written, RX records are the chunks as read from the serial port (so
+garbage and partial frames are captured as well).
+
+    python -m novastar_mctrl300.trace show.trace --frames
+    python -m novastar_mctrl300.trace show.trace --histogram
+    python -m novastar_mctrl300.trace show.trace --replay /dev/pts/5 --speed 1
+"""
+
+__author__ = 'Dieter Vansteenwegen'
+__project__ = 'Novastar_MCTRL300_basic_controller'
+__project_link__ = 'https://github.com/dietervansteenwegen/Novastar_MCTRL300_basic_controller'
+
+import collections
+import mmap
+import os
+import pathlib
+import struct
+import threading
+from time import monotonic_ns, sleep
+from typing import BinaryIO, Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+from novastar_mctrl300.decoder import CMD_HEADER, MCTRL300FrameDecoder, MCTRL300Reply
+
+MAGIC = b'MCTRACE1'
+TX = 1
+RX = 2
+BUFFER_SIZE = 1 << 16  # bytes buffered before writing to the file
+HISTOGRAM_EDGES_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+_RECORD = struct.Struct('<BqI')
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+
+class TraceRecord(NamedTuple):
+    direction: int  # TX or RX
+    timestamp: int  # time.monotonic_ns()
+    data: bytes
+
+
+class TraceFrame(NamedTuple):
+    direction: int
+    timestamp: int  # of the record that completed the frame
+    frame: MCTRL300Reply  # commands are decoded into the same fields as replies
+
+
+class TraceRecorder:
+    def __init__(self, path: str):
+        """Append-only writer of a capture file, pass it to MCTRL300(trace=...).
+
+        Records are buffered (BUFFER_SIZE) and only written to disk when the buffer is full or on
+        flush/close, so recording costs little more than a struct.pack per frame.
+
+        Args:
+            path (str): capture file, overwritten if it exists.
+        """
+        self.path = path
+        self._file: BinaryIO = pathlib.Path(path).open('wb', buffering=BUFFER_SIZE)  # noqa: SIM115
+        self._file.write(MAGIC)
+        self._lock = threading.Lock()
+
+    def record(self, direction: int, data: Buffer) -> None:
+        """Append data sent (TX) or received (RX) now."""
+        with self._lock:
+            self._file.write(_RECORD.pack(direction, monotonic_ns(), len(data)))
+            self._file.write(data)
+
+    def flush(self) -> None:
+        with self._lock:
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self) -> 'TraceRecorder':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class TraceReader:
+    def __init__(self, path: str):
+        """Memory mapped reader of a capture file.
+
+        A truncated last record (i.e. the recording process was killed) is ignored.
+
+        Args:
+            path (str): capture file.
+        """
+        msg = f'{path} is not an MCTRL300 capture.'
+        with pathlib.Path(path).open('rb') as f:
+            if os.fstat(f.fileno()).st_size < len(MAGIC):  # mmap refuses empty files
+                raise ValueError(msg)
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[: len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(msg)
+
+    def close(self) -> None:
+        self._mmap.close()
+
+    def __enter__(self) -> 'TraceReader':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def __iter__(self) -> Iterator[TraceRecord]:
+        data = self._mmap
+        pos = len(MAGIC)
+        end = len(data)
+        while pos + _RECORD.size <= end:
+            direction, timestamp, length = _RECORD.unpack_from(data, pos)
+            pos += _RECORD.size
+            if pos + length > end:
+                break
+            # a copy, a view on the mmap would keep close() from unmapping it
+            yield TraceRecord(direction, timestamp, data[pos : pos + length])
+            pos += length
+
+    def frames(self) -> Iterator[TraceFrame]:
+        """Decode the commands (TX) and replies (RX) in the capture."""
+        decoders = {TX: MCTRL300FrameDecoder(header=CMD_HEADER), RX: MCTRL300FrameDecoder()}
+        for record in self:
+            for frame in decoders[record.direction].feed(record.data):
+                yield TraceFrame(record.direction, record.timestamp, frame)
+
+    def latencies(self) -> Dict[Tuple[int, int, bool], List[float]]:
+        """Return the seconds from each command until its reply, by (port, register, is write).
+
+        Commands without reply are left out.
+        """
+        pending: Dict[int, TraceFrame] = {}
+        latencies: Dict[Tuple[int, int, bool], List[float]] = collections.defaultdict(list)
+        for f in self.frames():
+            if f.direction == TX:
+                pending[f.frame.serno] = f
+                continue
+            cmd = pending.pop(f.frame.serno, None)
+            if cmd is None:
+                continue
+            key = (cmd.frame.port + 1, cmd.frame.reg_addr, cmd.frame.cmd_type == 0x01)
+            latencies[key].append((f.timestamp - cmd.timestamp) / 1e9)
+        return dict(latencies)
+
+    def replay(self, serport, speed: Optional[float] = 1) -> int:
+        """Write the commands (TX) of the capture to serport, i.e. an MCTRL300Emulator.
+
+        Args:
+            serport (serial.Serial): open port to write to.
+            speed (Optional[float], optional): 1 for the original timing, 2 for twice as fast,
+                                    None for as fast as possible. Defaults to 1.
+
+        Returns:
+            int: number of records written.
+        """
+        written = 0
+        start = first = None
+        for record in self:
+            if record.direction != TX:
+                continue
+            if speed:
+                if first is None:
+                    first, start = record.timestamp, monotonic_ns()
+                wait = (record.timestamp - first) / speed - (monotonic_ns() - start)
+                if wait > 0:
+                    sleep(wait / 1e9)
+            serport.write(record.data)
+            written += 1
+        serport.flush()
+        return written
+
+
+def histogram(samples: List[float], edges_ms: Tuple[float, ...] = HISTOGRAM_EDGES_MS) -> str:
+    """Return a text histogram of latencies in seconds, with bucket edges in ms."""
+    counts = [0] * (len(edges_ms) + 1)
+    for sample in samples:
+        ms = sample * 1000
+        counts[next((i for i, edge in enumerate(edges_ms) if ms < edge), len(edges_ms))] += 1
+    most = max(counts) or 1
+    labels = [f'< {edge:g} ms' for edge in edges_ms] + [f'>= {edges_ms[-1]:g} ms']
+    return '\n'.join(
+        f'{label:>12} {count:7} {"#" * round(40 * count / most)}'
+        for label, count in zip(labels, counts)  # noqa: B905
+    )
+
+
+def main() -> None:
+    import argparse  # only for the command line tool, MCTRL300 imports this module
+
+    parser = argparse.ArgumentParser(description='Analyse or replay an MCTRL300 capture.')
+    parser.add_argument('capture', help='file recorded with TraceRecorder')
+    parser.add_argument('--frames', action='store_true', help='print the decoded frames')
+    parser.add_argument('--histogram', action='store_true', help='latency per command')
+    parser.add_argument('--replay', metavar='PORT', help='send the commands to this serial port')
+    parser.add_argument('--speed', type=float, default=0, help='1 for original timing, 0 for ASAP')
+    args = parser.parse_args()
+    with TraceReader(args.capture) as reader:
+        if args.frames:
+            first = None
+            for f in reader.frames():
+                first = first or f.timestamp
+                arrow = '>' if f.direction == TX else '<'
+                print(f'{(f.timestamp - first) / 1e6:12.3f} ms {arrow} {f.frame}')
+        if args.histogram:
+            for (port, reg_addr, is_write), samples in sorted(reader.latencies().items()):
+                ordered = sorted(samples)
+                p50 = ordered[len(ordered) // 2] * 1000
+                p99 = ordered[min(len(ordered) - 1, len(ordered) * 99 // 100)] * 1000
+                kind = 'write' if is_write else 'read'
+                print(
+                    f'output {port} register 0x{reg_addr:08X} {kind}: {len(samples)} replies, '
+                    f'p50 {p50:.2f} ms, p99 {p99:.2f} ms',
+                )
+                print(histogram(samples))
+        if args.replay:
+            from novastar_mctrl300.serports import Mctrl300Serial
+
+            with Mctrl300Serial(args.replay) as serport:
+                print(f'Replayed {reader.replay(serport, speed=args.speed or None)} commands.')
+
+
+if __name__ == '__main__':
+    main()
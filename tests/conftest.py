@@ -0,0 +1,35 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+"""Emulated controllers for the tests, override emulator_options to configure them."""
+
+__author__ = 'Dieter Vansteenwegen'
+__project__ = 'Novastar_MCTRL300_basic_controller'
+__project_link__ = 'https://github.com/dietervansteenwegen/Novastar_MCTRL300_basic_controller'
+
+import contextlib
+import os
+from typing import Any, Callable, Dict, Iterator
+
+import pytest
+
+
+@pytest.fixture()
+def make_emulator() -> Iterator[Callable[..., Any]]:
+    """Start an MCTRL300Emulator with the given options, all are closed after the test."""
+    if os.name != 'posix':
+        pytest.skip('the emulator needs a pseudo-terminal')
+    from novastar_mctrl300.emulator import MCTRL300Emulator
+
+    with contextlib.ExitStack() as stack:
+        yield lambda **options: stack.enter_context(MCTRL300Emulator(**options))
+
+
+@pytest.fixture()
+def emulator_options() -> Dict[str, Any]:
+    """Options of the emulator fixture, see MCTRL300Emulator."""
+    return {}
+
+
+@pytest.fixture()
+def emulator(make_emulator, emulator_options):
+    return make_emulator(**emulator_options)
@@ -0,0 +1,85 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+"""AsyncMCTRL300 and its serial transport against the emulator."""
+
+__author__ = 'Dieter Vansteenwegen'
+__project__ = 'Novastar_MCTRL300_basic_controller'
+__project_link__ = 'https://github.com/dietervansteenwegen/Novastar_MCTRL300_basic_controller'
+
+import asyncio
+
+import pytest
+from novastar_mctrl300.mctrl300 import MCTRL300, MCTRL300Error, MCTRL300NoReplyError
+
+BLOCK_ADDR = 0x02000100
+
+
+@pytest.fixture()
+def emulator_options() -> dict:
+    return {'latency': 0.005}
+
+
+def test_read_and_write(emulator):
+    from novastar_mctrl300.aio import AsyncMCTRL300
+
+    async def main() -> None:
+        async with await AsyncMCTRL300.open(emulator.port) as screen:
+            assert await screen.get_brightness(1) == 255
+            await screen.set_brightness(1, 40)
+            await screen.set_pattern(MCTRL300.PATTERN_RED, 2)
+            assert await screen.get_brightness(1) == 40
+            data = bytes(range(256)) * 3  # several frames
+            await screen.write_block(1, BLOCK_ADDR, data)
+            assert await screen.read_block(1, BLOCK_ADDR, len(data)) == data
+
+    asyncio.run(main())
+    assert emulator.read(2, 0, MCTRL300.REG_TEST_PATTERN, 1) == bytes([MCTRL300.PATTERN_RED])
+
+
+def test_concurrent_writes(emulator):
+    from novastar_mctrl300.aio import AsyncMCTRL300
+
+    async def main() -> None:
+        async with await AsyncMCTRL300.open(emulator.port, window=4) as screen:
+            await asyncio.gather(
+                *(
+                    screen.write_block(port, BLOCK_ADDR + i, bytes([i]))
+                    for i in range(40)
+                    for port in (1, 2)
+                ),
+            )
+
+    asyncio.run(main())
+    assert emulator.received == 80
+    for port in (1, 2):
+        assert emulator.read(port, 0, BLOCK_ADDR, 40) == bytes(range(40))
+
+
+def test_no_reply(emulator):
+    from novastar_mctrl300.aio import AsyncMCTRL300
+
+    async def main() -> None:
+        async with await AsyncMCTRL300.open(emulator.port, timeout=0.2) as screen:
+            emulator.drop_rate = 1
+            with pytest.raises(MCTRL300NoReplyError):
+                await screen.set_brightness(1, 40)
+            with pytest.raises(MCTRL300NoReplyError):
+                await screen.get_brightness(1)
+            emulator.drop_rate = 0
+            assert await screen.get_brightness(1) == 40  # the write was done, its reply dropped
+            assert not screen.protocol._pending
+
+    asyncio.run(main())
+    assert emulator.dropped == 2
+
+
+def test_closed(emulator):
+    from novastar_mctrl300.aio import AsyncMCTRL300
+
+    async def main() -> None:
+        screen = await AsyncMCTRL300.open(emulator.port)
+        await screen.close()
+        with pytest.raises(MCTRL300Error):
+            await screen.get_brightness(1)
+
+    asyncio.run(main())
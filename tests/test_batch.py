@@ -0,0 +1,53 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+"""Batches of writes against the emulator, with ACKs that get lost."""
+
+__author__ = 'Dieter Vansteenwegen'
+__project__ = 'Novastar_MCTRL300_basic_controller'
+__project_link__ = 'https://github.com/dietervansteenwegen/Novastar_MCTRL300_basic_controller'
+
+from typing import Iterator
+
+import pytest
+from novastar_mctrl300.mctrl300 import MCTRL300, RetryPolicy
+
+SEEDS = range(6)
+BLOCK_ADDR = 0x02000100
+
+
+@pytest.fixture(params=SEEDS)
+def emulator_options(request) -> dict:
+    """Drop 20% of the replies, the writes are done."""
+    return {'drop_rate': 0.2, 'seed': request.param}
+
+
+@pytest.fixture()
+def lossy(emulator) -> Iterator:
+    """The emulator and a cached MCTRL300."""
+    from novastar_mctrl300.serports import Mctrl300Serial
+
+    serport = Mctrl300Serial(emulator.port)
+    screen = MCTRL300(serport, ack_timeout=0.2, cache_ttl=60, retry=RetryPolicy(retries=5))
+    yield emulator, screen
+    serport.close()
+
+
+def test_last_write_wins(lossy):
+    emulator, screen = lossy
+    with screen.batch() as batch:
+        for value in range(1, 41):
+            batch.set_brightness(1, value)
+    assert emulator.read(1, 0, MCTRL300.REG_BRIGHTNESS_OVERALL, 1) == bytes([40])
+    assert screen.get_brightness(1) == 40
+
+
+def test_partly_overlapping_writes(lossy):
+    emulator, screen = lossy
+    with screen.batch() as batch:
+        batch.write_block(1, BLOCK_ADDR, bytes([1, 1, 1, 1]))
+        batch.write_block(1, BLOCK_ADDR + 1, bytes([2, 2]))
+        batch.write_block(1, BLOCK_ADDR + 2, bytes([3, 3, 3]))
+        batch.write_block(1, BLOCK_ADDR, bytes([4]))
+    expected = bytes([4, 2, 3, 3, 3])
+    assert emulator.read(1, 0, BLOCK_ADDR, len(expected)) == expected
+    assert screen.read_block(1, BLOCK_ADDR, len(expected)) == expected
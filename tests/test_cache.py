@@ -0,0 +1,103 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+"""Register cache on its own and in MCTRL300 against the emulator."""
+
+__author__ = 'Dieter Vansteenwegen'
+__project__ = 'Novastar_MCTRL300_basic_controller'
+__project_link__ = 'https://github.com/dietervansteenwegen/Novastar_MCTRL300_basic_controller'
+
+from typing import Iterator
+
+import pytest
+from novastar_mctrl300 import cache
+from novastar_mctrl300.cache import BROADCAST, MCTRL300RegisterCache
+from novastar_mctrl300.mctrl300 import MCTRL300
+
+REG = MCTRL300.REG_BRIGHTNESS_OVERALL
+
+
+@pytest.fixture()
+def clock(monkeypatch) -> Iterator[list]:
+    """Replace the clock of the cache, set now[0] to move it."""
+    now = [100.0]
+    monkeypatch.setattr(cache, 'monotonic', lambda: now[0])
+    yield now
+
+
+def test_hit_and_miss():
+    registers = MCTRL300RegisterCache(ttl=10)
+    registers.put(1, BROADCAST, 0x100, b'\x01\x02\x03')
+    assert registers.get(1, BROADCAST, 0x100, 3) == b'\x01\x02\x03'
+    assert registers.get(1, BROADCAST, 0x101, 2) == b'\x02\x03'
+    assert registers.get(1, BROADCAST, 0x101, 3) is None  # 0x103 was never stored
+    assert registers.get(2, BROADCAST, 0x100, 1) is None
+    assert registers.get(1, 0, 0x100, 1) is None
+    assert (registers.hits, registers.misses) == (2, 3)
+
+
+def test_ttl(clock):
+    registers = MCTRL300RegisterCache(ttl=1)
+    registers.put(1, BROADCAST, 0x100, b'\x01')
+    clock[0] += 0.5
+    registers.put(1, BROADCAST, 0x101, b'\x02')
+    assert registers.get(1, BROADCAST, 0x100, 2) == b'\x01\x02'
+    clock[0] += 0.75
+    assert registers.get(1, BROADCAST, 0x101, 1) == b'\x02'
+    assert registers.get(1, BROADCAST, 0x100, 2) is None
+    assert not registers.unchanged(1, BROADCAST, 0x100, b'\x01')
+
+
+def test_unchanged_counts_skipped_writes():
+    registers = MCTRL300RegisterCache(ttl=10)
+    registers.put(1, BROADCAST, 0x100, b'\x01\x02')
+    assert registers.unchanged(1, BROADCAST, 0x100, b'\x01\x02')
+    assert not registers.unchanged(1, BROADCAST, 0x100, b'\x01\x03')
+    assert registers.skipped_writes == 1
+
+
+def test_invalidate():
+    registers = MCTRL300RegisterCache(ttl=10)
+    for port in (1, 2):
+        for board in (0, 1, BROADCAST):
+            registers.put(port, board, 0x100, b'\x01\x02\x03\x04')
+    registers.invalidate(1, reg_addr=0x101, length=2)
+    assert registers.get(1, 0, 0x100, 1) == b'\x01'
+    assert registers.get(1, BROADCAST, 0x101, 1) is None
+    assert registers.get(1, 1, 0x102, 1) is None
+    assert registers.get(1, 1, 0x103, 1) == b'\x04'
+    assert registers.get(2, 0, 0x100, 4) == b'\x01\x02\x03\x04'
+    registers.invalidate(2, board=1)
+    assert registers.get(2, 1, 0x100, 1) is None
+    assert registers.get(2, 0, 0x100, 4) == b'\x01\x02\x03\x04'
+    registers.invalidate()
+    assert registers.get(2, 0, 0x100, 1) is None
+
+
+@pytest.fixture(params=[True, False], ids=['ack', 'no-ack'])
+def screen(request, emulator) -> Iterator[MCTRL300]:
+    from novastar_mctrl300.serports import Mctrl300Serial
+
+    serport = Mctrl300Serial(emulator.port)
+    yield MCTRL300(serport, wait_for_ack=request.param, cache_ttl=60)
+    serport.close()
+
+
+def test_reads_are_served_from_cache(emulator, screen):
+    assert screen.get_brightness(1) == 255
+    emulator.write(1, 0, REG, b'\x10')  # i.e. changed with NovaLCT
+    assert screen.get_brightness(1) == 255
+    screen.cache.invalidate(1)
+    assert screen.get_brightness(1) == 0x10
+    assert (screen.cache.hits, screen.cache.misses) == (1, 2)
+
+
+def test_only_acknowledged_writes_are_cached(emulator, screen):
+    screen.set_brightness(1, 40)
+    emulator.write(1, 0, REG, b'\xff')  # as if the write was lost
+    screen.set_brightness(1, 40)
+    if screen.wait_for_ack:
+        assert screen.cache.skipped_writes == 1
+        assert emulator.read(1, 0, REG, 1) == b'\xff'
+    else:
+        assert screen.cache.skipped_writes == 0
+        assert emulator.read(1, 0, REG, 1) == bytes([40])
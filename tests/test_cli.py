@@ -0,0 +1,39 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+"""The command line interface against the emulator."""
+
+__author__ = 'Dieter Vansteenwegen'
+__project__ = 'Novastar_MCTRL300_basic_controller'
+__project_link__ = 'https://github.com/dietervansteenwegen/Novastar_MCTRL300_basic_controller'
+
+from time import monotonic
+
+from novastar_mctrl300.cli import main
+from novastar_mctrl300.mctrl300 import MCTRL300
+
+
+def test_brightness(emulator, capsys):
+    assert main(['-d', emulator.port, '--ack', 'brightness', '1', '40']) == 0
+    assert emulator.read(1, 0, MCTRL300.REG_BRIGHTNESS_OVERALL, 1) == bytes([40])
+    assert main(['-d', emulator.port, 'brightness', '1']) == 0
+    assert capsys.readouterr().out == '40\n'
+
+
+def test_timeout_applies_to_reads(emulator, capsys):
+    emulator.drop_rate = 1
+    start = monotonic()
+    assert main(['-d', emulator.port, '--timeout', '0.1', '--retries', '0', 'brightness', '1']) == 1
+    assert monotonic() - start < 0.5
+    assert capsys.readouterr().err == 'error: No reply to message 0 within 0.1 s\n'
+
+
+def test_batch_keep_going(tmp_path, capsys):
+    commands = tmp_path / 'commands.txt'
+    commands.write_text('# no controller\nbrightness 1 40\n\npattern 1 red\n')
+    device = str(tmp_path / 'missing')
+    assert main(['-d', device, 'batch', str(commands)]) == 1
+    assert capsys.readouterr().err.startswith('error: line 2: brightness 1 40: ')
+    assert main(['-d', device, 'batch', '--keep-going', str(commands)]) == 1
+    errors = capsys.readouterr().err.splitlines()
+    assert [e.split(':')[0] for e in errors] == ['line 2', 'line 4', 'error']
+    assert errors[-1] == 'error: 2 command(s) failed'
@@ -0,0 +1,108 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+"""Latest-value-wins command queue."""
+
+__author__ = 'Dieter Vansteenwegen'
+__project__ = 'Novastar_MCTRL300_basic_controller'
+__project_link__ = 'https://github.com/dietervansteenwegen/Novastar_MCTRL300_basic_controller'
+
+import threading
+from typing import List, Tuple
+
+from novastar_mctrl300.cmdqueue import MCTRL300CommandQueue
+from novastar_mctrl300.mctrl300 import MCTRL300
+
+
+def drain(queue: MCTRL300CommandQueue) -> List[Tuple]:
+    commands = []
+    while len(queue):
+        cmd = queue.get()
+        commands.append((cmd.name, *cmd.args))
+    return commands
+
+
+def test_latest_value_wins():
+    queue = MCTRL300CommandQueue()
+    for value in range(10, 50, 10):
+        queue.put('set_brightness', 1, value)
+    queue.put('set_brightness', 2, 5)
+    assert drain(queue) == [('set_brightness', 1, 40), ('set_brightness', 2, 5)]
+    assert queue.coalesced == 3
+
+
+def test_reads_keep_their_order():
+    queue = MCTRL300CommandQueue()
+    queue.put('get_brightness', 1)
+    queue.put('set_pattern', 3, 1)
+    queue.put('get_brightness', 1)
+    queue.put('set_pattern', 4, 1)
+    assert drain(queue) == [
+        ('get_brightness', 1),
+        ('set_pattern', 4, 1),
+        ('get_brightness', 1),
+    ]
+
+
+def test_boards_are_coalesced_separately():
+    queue = MCTRL300CommandQueue()
+    queue.put('set_brightness', 1, 10, 0)
+    queue.put('set_brightness', 1, 20, 1)
+    queue.put('set_brightness', 1, 30, 0)
+    assert drain(queue) == [('set_brightness', 1, 30, 0), ('set_brightness', 1, 20, 1)]
+
+
+def test_write_to_all_boards_replaces_single_boards():
+    queue = MCTRL300CommandQueue()
+    queue.put('set_brightness', 1, 10, 0)
+    queue.put('set_brightness', 1, 20, 1)
+    queue.put('set_brightness', 1, 30)
+    queue.put('set_brightness', 1, 40, 0)  # after the write to all boards, so sent after it
+    assert drain(queue) == [('set_brightness', 1, 30), ('set_brightness', 1, 40, 0)]
+
+
+def test_single_board_keeps_write_to_all_boards():
+    queue = MCTRL300CommandQueue()
+    queue.put('set_brightness', 1, 30)
+    queue.put('set_brightness', 1, 40, 0)
+    queue.put('set_brightness', 1, 50, 0)
+    queue.put('set_brightness', 1, 60)
+    assert drain(queue) == [('set_brightness', 1, 60)]
+
+
+def test_safety_commands_go_first():
+    queue = MCTRL300CommandQueue()
+    queue.put('get_brightness', 1)
+    queue.put('set_pattern', 3, 1)
+    queue.put('set_brightness', 1, 50)
+    queue.put('set_brightness', 2, 50)
+    queue.put('set_brightness', 1, 0)
+    queue.put('set_pattern', MCTRL300.PATTERN_NORMAL, 1)
+    assert drain(queue) == [
+        ('set_brightness', 1, 0),
+        ('set_pattern', MCTRL300.PATTERN_NORMAL, 1),
+        ('get_brightness', 1),
+        ('set_brightness', 2, 50),
+    ]
+
+
+def test_safety_command_to_one_board():
+    queue = MCTRL300CommandQueue()
+    queue.put('set_pattern', 3, 1)
+    queue.put('set_pattern', 4, 1, 1)
+    queue.put('deactivate_pattern', 1, 1)
+    queue.put('deactivate_pattern', 1, 1)
+    assert drain(queue) == [('deactivate_pattern', 1, 1), ('set_pattern', 3, 1)]
+    queue.put('set_pattern', 4, 1, 1)
+    queue.put('deactivate_pattern', 1)
+    assert drain(queue) == [('deactivate_pattern', 1)]
+
+
+def test_get_timeout_and_close():
+    queue = MCTRL300CommandQueue()
+    assert queue.get(timeout=0.01) is None
+    results = []
+    consumer = threading.Thread(target=lambda: results.append(queue.get()))
+    consumer.start()
+    queue.close()
+    consumer.join(timeout=1)
+    assert results == [None]
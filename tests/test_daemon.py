@@ -0,0 +1,73 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+"""Pipelined requests of daemon clients against the emulator."""
+
+__author__ = 'Dieter Vansteenwegen'
+__project__ = 'Novastar_MCTRL300_basic_controller'
+__project_link__ = 'https://github.com/dietervansteenwegen/Novastar_MCTRL300_basic_controller'
+
+import asyncio
+import json
+from typing import Any, Dict, List
+
+import pytest
+from novastar_mctrl300.mctrl300 import MCTRL300
+
+REG = MCTRL300.REG_BRIGHTNESS_OVERALL
+
+
+@pytest.fixture()
+def emulator_options() -> dict:
+    return {'latency': 0.01}
+
+
+async def _pipelined(port: str, requests: List[Dict[str, Any]]) -> Dict[int, Dict[str, Any]]:
+    """Read the brightness into the cache of a daemon, then send all requests without waiting for
+    the replies. Returns the replies by id."""
+    from novastar_mctrl300.aio import AsyncMCTRL300
+    from novastar_mctrl300.daemon import MCTRL300Daemon
+
+    screen = await AsyncMCTRL300.open(port)
+    daemon = MCTRL300Daemon(screen, cache_ttl=60)
+    server = await asyncio.start_server(daemon.handle_client, '127.0.0.1', 0)
+    try:
+        reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+        writer.write(json.dumps({'id': -1, 'op': 'brightness', 'port': 1}).encode() + b'\n')
+        assert json.loads(await reader.readline())['value'] == 255
+        for request_id, request in enumerate(requests):
+            writer.write(json.dumps({'id': request_id, **request}).encode() + b'\n')
+        await writer.drain()
+        replies = {}
+        for _ in requests:
+            reply = json.loads(await reader.readline())
+            replies[reply['id']] = reply
+        writer.close()
+        return replies
+    finally:
+        server.close()
+        await screen.close()
+
+
+def test_pipelined_writes_are_not_skipped(emulator):
+    requests = [
+        {'op': 'brightness', 'port': 1, 'value': 10},
+        {'op': 'brightness', 'port': 1, 'value': 255},
+        {'op': 'brightness', 'port': 1},
+    ]
+    replies = asyncio.run(_pipelined(emulator.port, requests))
+    assert all(reply['ok'] for reply in replies.values())
+    assert emulator.read(1, 0, REG, 1) == bytes([255])
+    assert replies[2]['value'] == 255
+
+
+def test_read_during_write_is_not_cached(emulator):
+    requests = [
+        {'op': 'brightness', 'port': 1, 'value': 10},
+        {'op': 'brightness', 'port': 1},
+        {'op': 'brightness', 'port': 1, 'value': 20},
+        {'op': 'brightness', 'port': 1},
+    ]
+    replies = asyncio.run(_pipelined(emulator.port, requests))
+    assert all(reply['ok'] for reply in replies.values())
+    assert replies[3]['value'] == 20
+    assert emulator.read(1, 0, REG, 1) == bytes([20])
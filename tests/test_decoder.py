@@ -0,0 +1,97 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+"""Incremental frame decoder on chunked and noisy input."""
+
+__author__ = 'Dieter Vansteenwegen'
+__project__ = 'Novastar_MCTRL300_basic_controller'
+__project_link__ = 'https://github.com/dietervansteenwegen/Novastar_MCTRL300_basic_controller'
+
+import random
+import struct
+from typing import List
+
+import pytest
+from novastar_mctrl300.decoder import CHECKSUM_OFFSET, REPLY_HEADER, MCTRL300FrameDecoder
+
+REG_ADDR = 0x02000100
+MAX_DATA_LEN = 256  # longest frame MCTRL300 reads or writes
+
+
+def reply(serno: int, data: bytes = b'', is_read: bool = True) -> bytearray:
+    """Build a reply frame, see assets/documentation/command_layout.md."""
+    frame = bytearray(REPLY_HEADER)
+    # ack, serno, src, dest, card type, port, board, cmd type (0 read, 1 write), reserved
+    frame += struct.pack('<BBBBBBHBB', 0, serno, 0, 0xFE, 1, 0, 0, 0 if is_read else 1, 0)
+    frame += struct.pack('<IH', REG_ADDR, len(data) if is_read else 1)
+    frame += data
+    frame += struct.pack('<H', (sum(frame[2:]) + CHECKSUM_OFFSET) & 0xFFFF)
+    return frame
+
+
+def feed_chunked(decoder: MCTRL300FrameDecoder, stream: bytes, seed: int) -> List:
+    rnd = random.Random(seed)
+    frames = []
+    pos = 0
+    while pos < len(stream):
+        size = rnd.randint(1, 40)
+        frames += decoder.feed(stream[pos : pos + size])
+        pos += size
+    return frames
+
+
+def test_single_frame():
+    frames = MCTRL300FrameDecoder().feed(reply(7, b'\x01\x02\x03'))
+    assert len(frames) == 1
+    assert (frames[0].serno, frames[0].reg_addr, frames[0].data) == (7, REG_ADDR, b'\x01\x02\x03')
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_chunked_stream(seed):
+    stream = b''.join(
+        reply(serno, is_read=False) if serno % 2 else reply(serno, bytes([serno] * serno))
+        for serno in range(20)
+    )
+    frames = feed_chunked(MCTRL300FrameDecoder(), stream, seed)
+    assert [f.serno for f in frames] == list(range(20))
+    assert all(f.data == b'' for f in frames if f.serno % 2)
+    assert all(f.data == bytes([f.serno] * f.serno) for f in frames if not f.serno % 2)
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_resync_on_noise(seed):
+    rnd = random.Random(seed)
+    decoder = MCTRL300FrameDecoder(max_data_len=MAX_DATA_LEN)
+    stream = bytearray()
+    for serno in range(20):
+        # noise that contains partial and complete headers
+        stream += bytes(rnd.choice([0x00, 0xAA, 0x55, 0xFF]) for _ in range(rnd.randint(0, 25)))
+        stream += reply(serno, bytes([serno, 0xAA, 0x55]))
+    frames = feed_chunked(decoder, bytes(stream), seed)
+    assert [f.serno for f in frames] == list(range(20))
+    assert decoder.discarded_bytes > 0
+
+
+def test_frame_inside_corrupted_frame_is_kept():
+    broken = reply(1, bytes(10))
+    broken[-1] ^= 0xFF
+    good = reply(2, b'\x01')
+    # the good frame starts inside the data of the broken one
+    stream = broken[:22] + good + broken[22:]
+    decoder = MCTRL300FrameDecoder()
+    frames = decoder.feed(stream)
+    assert [f.serno for f in frames] == [2]
+    assert decoder.checksum_errors == 1
+
+
+def test_too_long_frames_are_noise():
+    decoder = MCTRL300FrameDecoder(max_data_len=4)
+    frames = decoder.feed(reply(1, bytes(5)) + reply(2, bytes(4)))
+    assert [f.serno for f in frames] == [2]
+
+
+def test_reset_drops_partial_frame():
+    decoder = MCTRL300FrameDecoder()
+    frame = reply(1, b'\x01')
+    assert decoder.feed(frame[:10]) == []
+    decoder.reset()
+    assert [f.serno for f in decoder.feed(frame)] == [1]
@@ -0,0 +1,49 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+"""Discovery of controllers among emulators and other serial ports."""
+
+__author__ = 'Dieter Vansteenwegen'
+__project__ = 'Novastar_MCTRL300_basic_controller'
+__project_link__ = 'https://github.com/dietervansteenwegen/Novastar_MCTRL300_basic_controller'
+
+import pytest
+from novastar_mctrl300 import serports
+from novastar_mctrl300.discovery import discover, probe
+
+TIMEOUT = 0.2
+
+
+@pytest.fixture()
+def ports(make_emulator, monkeypatch) -> list:
+    """A controller, an emulator on a port that does not look like one and a silent CP2102."""
+    controller = make_emulator()
+    other = make_emulator(latency=0.05)
+    silent = make_emulator(drop_rate=1)
+    ports = [
+        (0, controller.port, 'Silicon Labs', 'CP2102 USB to UART Bridge Controller'),
+        (1, other.port, 'FTDI', 'FT232R USB UART'),
+        (2, silent.port, 'Silicon Labs', 'CP2102 USB to UART Bridge Controller'),
+    ]
+    monkeypatch.setattr(serports, 'get_available_ports', lambda: ports)
+    return ports
+
+
+def test_only_controller_ports_by_default(ports):
+    found = discover(timeout=TIMEOUT)
+    assert [c.device for c in found] == [ports[0][1]]
+    assert found[0].manufacturer == 'Silicon Labs'
+    assert found[0].brightness == 255
+    assert 0 < found[0].latency < TIMEOUT
+
+
+def test_all_ports(ports):
+    found = discover(timeout=TIMEOUT, candidates_only=False)
+    assert [c.device for c in found] == [ports[0][1], ports[1][1]]  # fastest first
+    assert found[1].product == 'FT232R USB UART'
+    assert [c.device for c in discover([ports[1][1]], timeout=TIMEOUT)] == [ports[1][1]]
+
+
+def test_probe(ports, tmp_path):
+    assert probe(ports[0][1], timeout=TIMEOUT).brightness == 255
+    assert probe(ports[2][1], timeout=TIMEOUT) is None  # no reply
+    assert probe(str(tmp_path / 'missing'), timeout=TIMEOUT) is None
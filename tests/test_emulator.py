@@ -0,0 +1,72 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+"""The emulator as seen through MCTRL300: registers, boards and faults."""
+
+__author__ = 'Dieter Vansteenwegen'
+__project__ = 'Novastar_MCTRL300_basic_controller'
+__project_link__ = 'https://github.com/dietervansteenwegen/Novastar_MCTRL300_basic_controller'
+
+from typing import Iterator
+
+import pytest
+from novastar_mctrl300.mctrl300 import (
+    MCTRL300,
+    MCTRL300AckTimeoutError,
+    MCTRL300NoReplyError,
+    RetryPolicy,
+)
+
+BLOCK_ADDR = 0x02000100
+
+
+@pytest.fixture()
+def emulator_options() -> dict:
+    return {'boards_per_port': 2, 'seed': 1}
+
+
+@pytest.fixture()
+def screen(emulator) -> Iterator[MCTRL300]:
+    from novastar_mctrl300.serports import Mctrl300Serial
+
+    serport = Mctrl300Serial(emulator.port)
+    yield MCTRL300(serport, wait_for_ack=True, ack_timeout=0.2)
+    serport.close()
+
+
+def test_registers(emulator, screen):
+    assert screen.get_brightness(1) == 255
+    screen.set_pattern(MCTRL300.PATTERN_RED, 2)
+    assert emulator.read(2, 0, MCTRL300.REG_TEST_PATTERN, 1) == bytes([MCTRL300.PATTERN_RED])
+    data = bytes(range(256)) * 3  # several frames
+    screen.write_block(1, BLOCK_ADDR, data)
+    assert screen.read_block(1, BLOCK_ADDR, len(data)) == data
+
+
+def test_boards(emulator, screen):
+    screen.set_brightness(1, 40)  # all boards
+    assert emulator.read(1, 1, MCTRL300.REG_BRIGHTNESS_OVERALL, 1) == bytes([40])
+    screen.set_brightness(1, 20, board=1)
+    assert screen.get_brightness(1, board=0) == 40
+    assert screen.get_brightness(1, board=1) == 20
+    with pytest.raises(MCTRL300AckTimeoutError):
+        screen.get_brightness(1, board=2)
+
+
+def test_dropped_and_corrupted_replies(emulator, screen):
+    emulator.drop_rate = 1
+    with pytest.raises(MCTRL300NoReplyError):
+        screen.get_brightness(1)
+    emulator.drop_rate = 0
+    emulator.corrupt_rate = 1
+    with pytest.raises(MCTRL300NoReplyError):
+        screen.get_brightness(1)
+    assert (emulator.dropped, emulator.corrupted) == (1, 1)
+
+
+def test_partial_replies_are_retried(emulator, screen):
+    emulator.byte_drop_rate = 0.02
+    screen.retry = RetryPolicy(retries=20, backoff=0)
+    for value in range(1, 21):
+        screen.set_brightness(1, value)  # waits for the ACK
+        assert emulator.read(1, 0, MCTRL300.REG_BRIGHTNESS_OVERALL, 1) == bytes([value])
+    assert emulator.bytes_dropped > 0
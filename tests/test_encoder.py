@@ -0,0 +1,68 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+"""Command encoder against frames captured from NovaLCT."""
+
+__author__ = 'Dieter Vansteenwegen'
+__project__ = 'Novastar_MCTRL300_basic_controller'
+__project_link__ = 'https://github.com/dietervansteenwegen/Novastar_MCTRL300_basic_controller'
+
+import random
+from typing import List
+
+import pytest
+from novastar_mctrl300.decoder import CMD_HEADER, MCTRL300FrameDecoder
+from novastar_mctrl300.mctrl300 import MCTRL300, MCTRL300Command, MCTRL300CreateCommand
+
+# (serno, port, pattern, frame), see assets/documentation/captured command strings.txt
+CAPTURED = [
+    (0x4F, 1, MCTRL300.PATTERN_SLASH, '55aa004ffe000100ffff010001010002010008af58'),
+    (0x2E, 1, MCTRL300.PATTERN_RED, '55aa002efe000100ffff0100010100020100028858'),
+    (0x23, 1, MCTRL300.PATTERN_NORMAL, '55aa0023fe000100ffff0100010100020100017c58'),
+    (0x74, 2, MCTRL300.PATTERN_GREEN, '55aa0074fe000101ffff010001010002010003d058'),
+    (0x8F, 2, MCTRL300.PATTERN_SLASH, '55aa008ffe000101ffff010001010002010008f058'),
+]
+
+
+@pytest.mark.parametrize(('serno', 'port', 'pattern', 'frame'), CAPTURED)
+def test_captured_frames(serno, port, pattern, frame):
+    cmd = MCTRL300CreateCommand().generate(
+        serno=serno,
+        reg_addr=MCTRL300.REG_TEST_PATTERN,
+        data_len=1,
+        data=pattern,
+        port=port,
+    )
+    assert cmd == bytes.fromhex(frame)
+
+
+def random_commands(count: int, seed: int) -> List[MCTRL300Command]:
+    rnd = random.Random(seed)
+    commands = []
+    for serno in range(count):
+        is_write = rnd.random() < 0.7
+        length = rnd.randint(1, 20)
+        commands.append(
+            MCTRL300Command(
+                serno=serno & 0xFF,
+                port=rnd.choice([1, 2]),
+                reg_addr=rnd.randrange(0x02000000, 0x02001000),
+                data_len=length,
+                data=bytes(rnd.randrange(256) for _ in range(length)) if is_write else None,
+                is_write=is_write,
+                board=rnd.choice([None, 0, 3]),
+            ),
+        )
+    return commands
+
+
+@pytest.mark.parametrize('count', [1, 10, MCTRL300CreateCommand.NUMPY_MIN_BATCH + 10])
+def test_batch_matches_single_frames(count):
+    creator = MCTRL300CreateCommand()
+    commands = random_commands(count, seed=count)
+    expected = b''.join(creator.generate(**cmd._asdict()) for cmd in commands)
+    buff = creator.generate_batch(commands)
+    assert buff == expected
+    frames = MCTRL300FrameDecoder(header=CMD_HEADER).feed(buff)
+    assert [(f.serno, f.port + 1, f.reg_addr) for f in frames] == [
+        (c.serno, c.port, c.reg_addr) for c in commands
+    ]
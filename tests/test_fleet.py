@@ -0,0 +1,57 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+"""MCTRL300Fleet against two emulators, one of which does not reply."""
+
+__author__ = 'Dieter Vansteenwegen'
+__project__ = 'Novastar_MCTRL300_basic_controller'
+__project_link__ = 'https://github.com/dietervansteenwegen/Novastar_MCTRL300_basic_controller'
+
+from typing import Iterator
+
+import pytest
+from novastar_mctrl300.mctrl300 import MCTRL300, MCTRL300NoReplyError
+
+TIMEOUT = 0.2
+
+
+@pytest.fixture()
+def emulators(make_emulator) -> list:
+    return [make_emulator(latency=0.01), make_emulator(drop_rate=1)]
+
+
+@pytest.fixture()
+def fleet(emulators) -> Iterator:
+    from novastar_mctrl300.fleet import MCTRL300Fleet
+
+    with MCTRL300Fleet([e.port for e in emulators], timeout=TIMEOUT) as fleet:
+        yield fleet
+
+
+def test_results_per_device(emulators, fleet):
+    working, silent = emulators
+    results = fleet.apply(MCTRL300.PATTERN_WHITE, 40)
+    assert list(results) == [working.port, silent.port]
+
+    ok = results[working.port]
+    assert ok.ok
+    assert ok.error is None
+    assert ok.result == [b''] * 4
+    assert 0.04 <= ok.latency < TIMEOUT  # 4 replies of 10 ms each
+    assert working.read(2, 0, MCTRL300.REG_BRIGHTNESS_OVERALL, 1) == bytes([40])
+
+    failed = results[silent.port]
+    assert not failed.ok
+    assert isinstance(failed.error, MCTRL300NoReplyError)
+    assert failed.result == []
+    assert failed.latency >= TIMEOUT
+    assert silent.read(2, 0, MCTRL300.REG_TEST_PATTERN, 1) == bytes([MCTRL300.PATTERN_WHITE])
+
+
+def test_reads(emulators, fleet):
+    working, silent = emulators
+    working.write(1, 0, MCTRL300.REG_BRIGHTNESS_OVERALL, b'\x10')
+    results = fleet.get_brightness(1)
+    assert results[working.port].result == [b'\x10']
+    assert not results[silent.port].ok
+    fleet.close()
+    assert fleet.devices == []
@@ -0,0 +1,85 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+"""PortWatcher with a fake list of serial ports."""
+
+__author__ = 'Dieter Vansteenwegen'
+__project__ = 'Novastar_MCTRL300_basic_controller'
+__project_link__ = 'https://github.com/dietervansteenwegen/Novastar_MCTRL300_basic_controller'
+
+import os
+import threading
+import time
+from typing import List
+
+from novastar_mctrl300.hotplug import PortWatcher
+
+USB0 = (0, '/dev/ttyUSB0', 'Silicon Labs', 'CP2102 USB to UART Bridge Controller')
+USB1 = (1, '/dev/ttyUSB1', 'FTDI', 'FT232R USB UART')
+ACM0 = (0, '/dev/ttyACM0', None, None)
+
+
+class FakeLister:
+    def __init__(self, ports: List[tuple]):
+        self.ports = ports
+        self.calls = 0
+
+    def __call__(self) -> List[tuple]:
+        self.calls += 1
+        return list(self.ports)
+
+
+def test_initial_ports_are_listed_once():
+    lister = FakeLister([USB0, USB1])
+    events = []
+    watcher = PortWatcher(
+        on_added=lambda p: events.append(('added', p)),
+        on_removed=lambda p: events.append(('removed', p)),
+        on_listed=lambda ports: events.append(('listed', ports)),
+        lister=lister,
+        watch_dir=None,
+    )
+    assert watcher.check() == ({USB0[1]: USB0, USB1[1]: USB1}, {})
+    assert events == [('listed', [USB0, USB1])]
+    assert watcher.check() == ({}, {})
+
+    lister.ports = [USB1, ACM0]  # USB0 unplugged, ACM0 plugged in
+    assert watcher.check() == ({ACM0[1]: ACM0}, {USB0[1]: USB0})
+    assert events[1:] == [('removed', USB0), ('added', ACM0)]
+    assert watcher.ports == {USB1[1]: USB1, ACM0[1]: ACM0}
+
+
+def test_initial_ports_are_added_without_on_listed():
+    added = []
+    watcher = PortWatcher(on_added=added.append, lister=FakeLister([USB0, USB1]), watch_dir=None)
+    watcher.check()
+    assert added == [USB0, USB1]
+
+
+def test_ports_are_only_listed_when_the_directory_changes(tmp_path):
+    lister = FakeLister([USB0])
+    watcher = PortWatcher(lister=lister, watch_dir=str(tmp_path))
+    watcher.check()
+    watcher.check()
+    assert lister.calls == 1
+    lister.ports = [USB0, USB1]
+    os.utime(tmp_path, ns=(0, 1))  # a device node was added
+    assert watcher.check() == ({USB1[1]: USB1}, {})
+    assert lister.calls == 2
+
+
+def test_thread_and_failing_callback():
+    lister = FakeLister([USB0])
+    listed = threading.Event()
+
+    def on_listed(ports: List[tuple]) -> None:
+        listed.set()
+        raise RuntimeError  # logged, the watcher keeps running
+
+    with PortWatcher(on_listed=on_listed, interval=0.01, lister=lister, watch_dir=None) as watcher:
+        assert listed.wait(1)
+        lister.ports = []
+        for _ in range(100):
+            if not watcher.ports:
+                break
+            time.sleep(0.01)
+    assert watcher.ports == {}
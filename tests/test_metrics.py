@@ -0,0 +1,95 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+"""Metrics of MCTRL300 commands against the emulator, and their Prometheus export."""
+
+__author__ = 'Dieter Vansteenwegen'
+__project__ = 'Novastar_MCTRL300_basic_controller'
+__project_link__ = 'https://github.com/dietervansteenwegen/Novastar_MCTRL300_basic_controller'
+
+import urllib.error
+import urllib.request
+from typing import List
+
+import pytest
+from novastar_mctrl300.mctrl300 import MCTRL300, MCTRL300NoReplyError
+from novastar_mctrl300.metrics import (
+    PROMETHEUS_CONTENT_TYPE,
+    CommandMetrics,
+    MCTRL300Metrics,
+    PrometheusExporter,
+)
+
+REG = MCTRL300.REG_BRIGHTNESS_OVERALL
+WRITE_LEN = 21  # frame with 1 data byte
+READ_LEN = ACK_LEN = 20  # frame without data
+
+
+@pytest.fixture()
+def metrics(emulator) -> MCTRL300Metrics:
+    """Metrics of 2 writes and a read on output 1 and a write without reply on output 2."""
+    from novastar_mctrl300.serports import Mctrl300Serial
+
+    metrics = MCTRL300Metrics()
+    serport = Mctrl300Serial(emulator.port)
+    screen = MCTRL300(serport, wait_for_ack=True, ack_timeout=0.2, metrics=metrics)
+    screen.set_brightness(1, 40)
+    screen.set_brightness(1, 41)
+    assert screen.get_brightness(1) == 41
+    emulator.drop_rate = 1
+    with pytest.raises(MCTRL300NoReplyError):
+        screen.set_brightness(2, 0)
+    serport.close()
+    return metrics
+
+
+def test_totals(metrics):
+    totals = metrics.snapshot()
+    assert set(totals) == {(1, REG), (2, REG)}
+    ok = totals[(1, REG)]
+    assert (ok['commands'], ok['replies'], ok['retries']) == (3, 3, 0)
+    assert ok['tx_bytes'] == 2 * WRITE_LEN + READ_LEN
+    assert ok['rx_bytes'] == 2 * ACK_LEN + WRITE_LEN  # the reply to the read has the data
+    assert 0 < ok['max_reply_time'] <= ok['reply_time']
+    assert ok['errors'] == {}
+    failed = totals[(2, REG)]
+    assert (failed['commands'], failed['rx_bytes']) == (1, 0)
+    assert failed['max_reply_time'] >= 0.2
+    assert failed['errors'] == {'MCTRL300NoReplyError': 1}
+
+
+def test_hooks():
+    metrics = MCTRL300Metrics()
+    seen: List[CommandMetrics] = []
+
+    def broken(_: CommandMetrics) -> None:
+        raise RuntimeError
+
+    metrics.add_hook(broken)  # logged, does not stop the other hooks
+    metrics.add_hook(seen.append)
+    m = CommandMetrics(1, REG, True, 0.001, 0.002, None, WRITE_LEN, 0, 0, None)
+    metrics.record(m)
+    metrics.remove_hook(seen.append)
+    metrics.record(m)
+    assert seen == [m]
+    assert metrics.snapshot()[(1, REG)]['replies'] == 0  # not waited for
+
+
+def test_prometheus_exporter(metrics):
+    exporter = PrometheusExporter(metrics, port=0)
+    url = f'http://127.0.0.1:{exporter.port}'
+    try:
+        with urllib.request.urlopen(f'{url}/metrics') as response:  # noqa: S310
+            assert response.headers['Content-Type'] == PROMETHEUS_CONTENT_TYPE
+            text = response.read().decode()
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(f'{url}/other')  # noqa: S310
+    finally:
+        exporter.close()
+    assert text == metrics.prometheus_text()
+    lines = text.splitlines()
+    assert '# TYPE mctrl300_commands_total counter' in lines
+    assert 'mctrl300_commands_total{port="1",register="0x02000001"} 3' in lines
+    assert f'mctrl300_tx_bytes_total{{port="2",register="0x02000001"}} {WRITE_LEN}' in lines
+    assert '# TYPE mctrl300_reply_seconds_max gauge' in lines
+    error = 'mctrl300_errors_total{port="2",register="0x02000001",error="MCTRL300NoReplyError"} 1'
+    assert error in lines
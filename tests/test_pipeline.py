@@ -0,0 +1,146 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+"""Pipelined requests against an in-memory controller: timeouts, slots and message ids."""
+
+__author__ = 'Dieter Vansteenwegen'
+__project__ = 'Novastar_MCTRL300_basic_controller'
+__project_link__ = 'https://github.com/dietervansteenwegen/Novastar_MCTRL300_basic_controller'
+
+import struct
+import threading
+from typing import Dict, Iterator, List, Tuple
+
+import pytest
+from novastar_mctrl300.decoder import (
+    CHECKSUM_OFFSET,
+    CMD_HEADER,
+    REPLY_HEADER,
+    MCTRL300FrameDecoder,
+    MCTRL300Reply,
+)
+from novastar_mctrl300.mctrl300 import MCTRL300, MCTRL300Error, MCTRL300NoReplyError
+
+REG = MCTRL300.REG_BRIGHTNESS_OVERALL
+TIMEOUT = 0.2
+
+
+class FakeSerial:
+    """Serial port with an MCTRL300 behind it that answers every command as soon as it is written.
+
+    Set drop to leave the commands unanswered.
+    """
+
+    def __init__(self):
+        self.timeout = None
+        self.drop = False
+        self.dropped = 0
+        self.sernos: List[int] = []  # of every command written
+        self.registers: Dict[Tuple[int, int], int] = {(1, REG): 0xFF, (2, REG): 0xFF}
+        self._decoder = MCTRL300FrameDecoder(header=CMD_HEADER)
+        self._rx = bytearray()
+        self._cond = threading.Condition()
+
+    @property
+    def in_waiting(self) -> int:
+        with self._cond:
+            return len(self._rx)
+
+    def reset_input_buffer(self) -> None:
+        with self._cond:
+            self._rx.clear()
+
+    def write(self, data: bytes) -> int:
+        for cmd in self._decoder.feed(data):
+            self.sernos.append(cmd.serno)
+            if self.drop:
+                self.dropped += 1
+                continue
+            reply = self._reply(cmd)
+            with self._cond:
+                self._rx += reply
+                self._cond.notify_all()
+        return len(data)
+
+    def read(self, size: int = 1) -> bytes:
+        with self._cond:
+            self._cond.wait_for(lambda: self._rx, timeout=self.timeout)
+            chunk = bytes(self._rx[:size])
+            del self._rx[:size]
+        return chunk
+
+    def _reply(self, cmd: MCTRL300Reply) -> bytearray:
+        """Execute cmd on the registers, see assets/documentation/command_layout.md."""
+        port = cmd.port + 1
+        addrs = range(cmd.reg_addr, cmd.reg_addr + cmd.data_len)
+        data = b''
+        if cmd.cmd_type == 0x01:
+            self.registers.update(((port, addr), value) for addr, value in zip(addrs, cmd.data))
+        else:
+            data = bytes(self.registers.get((port, addr), 0) for addr in addrs)
+        frame = bytearray(REPLY_HEADER)
+        # ack, serno, src, dest, card type, port, board, cmd type, reserved
+        frame += struct.pack('<BBBBBBHBB', 0, cmd.serno, 0, 0xFE, 1, cmd.port, 0, cmd.cmd_type, 0)
+        frame += struct.pack('<IH', cmd.reg_addr, cmd.data_len)
+        frame += data
+        frame += struct.pack('<H', (sum(frame[2:]) + CHECKSUM_OFFSET) & 0xFFFF)
+        return frame
+
+
+@pytest.fixture()
+def serport() -> FakeSerial:
+    return FakeSerial()
+
+
+@pytest.fixture()
+def pipeline(serport) -> Iterator:
+    from novastar_mctrl300.pipeline import MCTRL300Pipeline
+
+    with MCTRL300Pipeline(serport, window=2, timeout=TIMEOUT) as pipeline:
+        yield pipeline
+
+
+def test_replies(serport, pipeline):
+    writes = [pipeline.submit_write(1, 0x100 + i, i) for i in range(10)]
+    assert [f.result(timeout=1) for f in writes] == [b''] * 10
+    assert serport.registers[(1, 0x109)] == 9
+    assert pipeline.submit_read(1, 0x100, 10).result(timeout=1) == bytes(range(10))
+    assert pipeline.submit_read(2, REG).result(timeout=1) == b'\xff'
+
+
+def test_timeout_releases_slot(serport, pipeline):
+    serport.drop = True
+    lost = [pipeline.submit_read(1, REG) for _ in range(2)]
+    for future in lost:
+        with pytest.raises(MCTRL300NoReplyError):
+            future.result(timeout=1)
+    serport.drop = False
+    # the window is full again if the expired requests kept their slots
+    futures = [pipeline.submit_read(1, REG) for _ in range(2)]
+    assert [f.result(timeout=1) for f in futures] == [b'\xff'] * 2
+    assert not pipeline._pending
+
+
+def test_message_ids_wrap_and_skip_outstanding(serport, pipeline):
+    serport.drop = True
+    lost = pipeline.submit_read(1, REG)  # message id 0 stays outstanding
+    serport.drop = False
+    pipeline._msg_id = 0xFF
+    futures = [pipeline.submit_read(1, REG)]
+    futures.append(pipeline.submit_read(1, REG))  # 0 is in use
+    assert serport.sernos[-2:] == [0xFF, 1]
+    assert [f.result(timeout=1) for f in futures] == [b'\xff'] * 2
+    with pytest.raises(MCTRL300NoReplyError):
+        lost.result(timeout=1)
+    # 0 is free again once it expired, an id is reused without mixing up the replies
+    for _ in range(260):
+        assert pipeline.submit_read(1, REG).result(timeout=1) == b'\xff'
+
+
+def test_close_fails_outstanding(serport, pipeline):
+    serport.drop = True
+    future = pipeline.submit_read(1, REG)
+    pipeline.close()
+    with pytest.raises(MCTRL300Error):
+        future.result(timeout=1)
+    with pytest.raises(MCTRL300Error):
+        pipeline.submit_read(1, REG)
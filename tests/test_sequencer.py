@@ -0,0 +1,68 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+"""Timing of PatternSequencer against emulators with short dwell times."""
+
+__author__ = 'Dieter Vansteenwegen'
+__project__ = 'Novastar_MCTRL300_basic_controller'
+__project_link__ = 'https://github.com/dietervansteenwegen/Novastar_MCTRL300_basic_controller'
+
+from typing import List
+
+import pytest
+from novastar_mctrl300.mctrl300 import MCTRL300
+from novastar_mctrl300.sequencer import PatternSequencer, SequenceStep, StepReport, color_cycle
+
+DWELL = 0.05
+LATENCY = 0.01
+CYCLES = 3
+
+
+def controller(emulator) -> MCTRL300:
+    from novastar_mctrl300.serports import Mctrl300Serial
+
+    return MCTRL300(Mctrl300Serial(emulator.port), wait_for_ack=True, ack_timeout=0.5)
+
+
+def test_steps_on_time(make_emulator):
+    emulator = make_emulator(latency=LATENCY)
+    screen = controller(emulator)
+    reports: List[StepReport] = []
+    sequencer = PatternSequencer([(screen, 1)], color_cycle(DWELL), CYCLES, reports.append)
+    start_at = sequencer.start()
+    assert sequencer.wait(5)
+    screen.serport.close()
+
+    assert [(r.cycle, r.step) for r in reports] == [(c, s) for c in range(CYCLES) for s in range(3)]
+    assert sequencer.skipped == 0
+    assert all(r.error is None for r in reports)
+    assert [r.scheduled - start_at for r in reports] == pytest.approx(
+        [i * DWELL for i in range(3 * CYCLES)],
+    )
+    assert all(LATENCY <= r.done - r.sent < DWELL for r in reports)
+    first, later = reports[:3], reports[3:]
+    assert first[0].lead == 0  # no latency known yet
+    assert all(r.lead >= LATENCY for r in later)  # sent early by the latency of earlier cycles
+    assert all(abs(r.late) < DWELL / 2 for r in later)
+    assert emulator.read(1, 0, MCTRL300.REG_TEST_PATTERN, 1) == bytes([MCTRL300.PATTERN_BLUE])
+    assert emulator.received == 3 * CYCLES
+
+
+def test_slow_controllers_skip_steps(make_emulator):
+    slow = [controller(make_emulator(latency=0.08)) for _ in range(2)]
+    reports: List[StepReport] = []
+    steps = color_cycle(0.03)
+    sequencer = PatternSequencer([(s, 1) for s in slow], steps, CYCLES, reports.append)
+    sequencer.start()
+    assert sequencer.wait(5)
+    for screen in slow:
+        screen.serport.close()
+    assert sequencer.skipped > 0
+    assert len(reports) + sequencer.skipped == len(slow) * len(steps) * CYCLES
+    assert {r.screen for r in reports} == {0, 1}
+
+
+def test_invalid_steps():
+    with pytest.raises(ValueError, match='at least one step'):
+        PatternSequencer([], [])
+    with pytest.raises(ValueError, match='dwell time above 0'):
+        PatternSequencer([], [SequenceStep(MCTRL300.PATTERN_RED, dwell=0)])
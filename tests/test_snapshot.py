@@ -0,0 +1,101 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+"""Snapshot files, diffs and restore against the emulator."""
+
+__author__ = 'Dieter Vansteenwegen'
+__project__ = 'Novastar_MCTRL300_basic_controller'
+__project_link__ = 'https://github.com/dietervansteenwegen/Novastar_MCTRL300_basic_controller'
+
+from typing import Iterator
+
+import pytest
+from novastar_mctrl300.mctrl300 import MCTRL300
+from novastar_mctrl300.snapshot import MCTRL300Snapshot, RegisterRange, RegisterWrite
+
+BLOCK = RegisterRange(1, 0x02000100, 64)
+BOARD_BLOCK = RegisterRange(2, 0x02000200, 4, board=1)
+
+
+def test_diff_joins_short_gaps():
+    wanted = bytearray(64)
+    wanted[2] = 1
+    wanted[5:7] = b'\x02\x02'  # 2 unchanged bytes after the first change
+    wanted[40] = 3  # too far from the others
+    snapshot = MCTRL300Snapshot({BLOCK: bytes(wanted)})
+    live = MCTRL300Snapshot({BLOCK: bytes(64)})
+    assert snapshot.diff(live, max_gap=4) == [
+        RegisterWrite(1, BLOCK.reg_addr + 2, b'\x01\x00\x00\x02\x02'),
+        RegisterWrite(1, BLOCK.reg_addr + 40, b'\x03'),
+    ]
+    assert snapshot.diff(live, max_gap=0) == [
+        RegisterWrite(1, BLOCK.reg_addr + 2, b'\x01'),
+        RegisterWrite(1, BLOCK.reg_addr + 5, b'\x02\x02'),
+        RegisterWrite(1, BLOCK.reg_addr + 40, b'\x03'),
+    ]
+    assert snapshot.diff(snapshot) == []
+
+
+def test_diff_writes_ranges_missing_from_live():
+    snapshot = MCTRL300Snapshot({BOARD_BLOCK: b'\x01\x02\x03\x04'})
+    assert snapshot.diff(MCTRL300Snapshot()) == [
+        RegisterWrite(2, BOARD_BLOCK.reg_addr, b'\x01\x02\x03\x04', 1),
+    ]
+
+
+def test_wrong_length():
+    with pytest.raises(ValueError, match='bytes of data'):
+        MCTRL300Snapshot({BOARD_BLOCK: b'\x01'})
+
+
+@pytest.mark.parametrize('name', ['snap.json', 'snap.bin'])
+def test_save_and_load(tmp_path, name):
+    snapshot = MCTRL300Snapshot({BLOCK: bytes(range(64)), BOARD_BLOCK: b'\xff\x00\xff\x00'})
+    path = str(tmp_path / name)
+    snapshot.save(path)
+    assert MCTRL300Snapshot.load(path).registers == snapshot.registers
+
+
+def test_load_rejects_other_files(tmp_path):
+    path = tmp_path / 'snap.bin'
+    MCTRL300Snapshot({BLOCK: bytes(64)}).save(str(path))
+    path.write_bytes(path.read_bytes()[:-1])
+    with pytest.raises(ValueError, match='truncated'):
+        MCTRL300Snapshot.load(str(path))
+    path.write_text('{"ranges": []}')
+    with pytest.raises(ValueError, match='not an MCTRL300 snapshot'):
+        MCTRL300Snapshot.load(str(path))
+
+
+@pytest.fixture()
+def emulator_options() -> dict:
+    return {'boards_per_port': 2}
+
+
+@pytest.fixture()
+def screen(emulator) -> Iterator[MCTRL300]:
+    from novastar_mctrl300.serports import Mctrl300Serial
+
+    serport = Mctrl300Serial(emulator.port)
+    yield MCTRL300(serport, wait_for_ack=True)
+    serport.close()
+
+
+def test_restore(emulator, screen):
+    emulator.write(1, 0, BLOCK.reg_addr, bytes(range(64)))
+    emulator.write(2, 1, BOARD_BLOCK.reg_addr, b'\x01\x02\x03\x04')
+    snapshot = MCTRL300Snapshot.take(screen, [BLOCK, BOARD_BLOCK])
+    assert snapshot.registers[BLOCK] == bytes(range(64))
+
+    emulator.write(1, 0, BLOCK.reg_addr + 10, b'\xaa\xaa')
+    emulator.write(2, 1, BOARD_BLOCK.reg_addr + 3, b'\xaa')
+    assert snapshot.restore(screen, dry_run=True) == [
+        RegisterWrite(1, BLOCK.reg_addr + 10, b'\x0a\x0b'),
+        RegisterWrite(2, BOARD_BLOCK.reg_addr + 3, b'\x04', 1),
+    ]
+    assert emulator.read(1, 0, BLOCK.reg_addr + 10, 2) == b'\xaa\xaa'
+
+    assert len(snapshot.restore(screen)) == 2
+    assert emulator.read(1, 0, BLOCK.reg_addr, 64) == bytes(range(64))
+    assert emulator.read(2, 1, BOARD_BLOCK.reg_addr, 4) == b'\x01\x02\x03\x04'
+    assert emulator.read(2, 0, BOARD_BLOCK.reg_addr, 4) == bytes(4)  # other board untouched
+    assert snapshot.restore(screen) == []
@@ -0,0 +1,59 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+"""Scan of the receiving cards of an emulator with several cards per output."""
+
+__author__ = 'Dieter Vansteenwegen'
+__project__ = 'Novastar_MCTRL300_basic_controller'
+__project_link__ = 'https://github.com/dietervansteenwegen/Novastar_MCTRL300_basic_controller'
+
+from typing import Iterator
+
+import pytest
+from novastar_mctrl300.mctrl300 import MCTRL300
+from novastar_mctrl300.topology import ReceiverCard, scan
+
+BOARDS = 3  # more than the window, so a port takes several rounds
+
+
+@pytest.fixture()
+def emulator_options() -> dict:
+    return {'boards_per_port': BOARDS}
+
+
+@pytest.fixture()
+def pipeline(emulator) -> Iterator:
+    from novastar_mctrl300.pipeline import MCTRL300Pipeline
+    from novastar_mctrl300.serports import Mctrl300Serial
+
+    pipeline = MCTRL300Pipeline(Mctrl300Serial(emulator.port), window=2, timeout=0.2)
+    yield pipeline
+    pipeline.close()
+
+
+def test_scan(emulator, pipeline):
+    emulator.write(2, 1, MCTRL300.REG_BRIGHTNESS_OVERALL, b'\x40')
+    topology = scan(pipeline)
+    assert len(topology) == 2 * BOARDS
+    assert topology.boards(1) == topology.boards(2) == list(range(BOARDS))
+    assert topology.failed() == []
+    brightness = topology.register(MCTRL300.REG_BRIGHTNESS_OVERALL)
+    assert brightness.pop((2, 1)) == b'\x40'
+    assert set(brightness.values()) == {b'\xff'}
+    assert topology.card(1, 2) == ReceiverCard(
+        1,
+        2,
+        {
+            MCTRL300.REG_BRIGHTNESS_OVERALL: b'\xff',
+            MCTRL300.REG_TEST_PATTERN: bytes([MCTRL300.PATTERN_NORMAL]),
+        },
+        {},
+    )
+    assert repr(topology) == f'MCTRL300Topology(output 1: {BOARDS}, output 2: {BOARDS})'
+
+
+def test_scan_limits(pipeline):
+    topology = scan(pipeline, ports=(2,), registers=[(MCTRL300.REG_TEST_PATTERN, 1)], max_boards=2)
+    assert [(card.port, card.board) for card in topology] == [(2, 0), (2, 1)]
+    assert topology.register(MCTRL300.REG_BRIGHTNESS_OVERALL) == {(2, 0): None, (2, 1): None}
+    with pytest.raises(ValueError, match='At least one register'):
+        scan(pipeline, registers=[])
@@ -0,0 +1,106 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+"""Capture of the traffic with the emulator, and the analysis and replay of the capture."""
+
+__author__ = 'Dieter Vansteenwegen'
+__project__ = 'Novastar_MCTRL300_basic_controller'
+__project_link__ = 'https://github.com/dietervansteenwegen/Novastar_MCTRL300_basic_controller'
+
+import pathlib
+
+import pytest
+from novastar_mctrl300.mctrl300 import MCTRL300
+from novastar_mctrl300.trace import MAGIC, RX, TX, TraceReader, TraceRecorder, histogram
+
+REG = MCTRL300.REG_BRIGHTNESS_OVERALL
+LATENCY = 0.01
+
+
+@pytest.fixture()
+def emulator_options() -> dict:
+    return {'latency': LATENCY}
+
+
+@pytest.fixture()
+def capture(emulator, tmp_path) -> str:
+    """Capture of 2 writes and a read on output 1."""
+    from novastar_mctrl300.serports import Mctrl300Serial
+
+    path = str(tmp_path / 'show.trace')
+    with TraceRecorder(path) as recorder, Mctrl300Serial(emulator.port) as serport:
+        screen = MCTRL300(serport, wait_for_ack=True, ack_timeout=0.5, trace=recorder)
+        screen.set_brightness(1, 40)
+        screen.set_brightness(1, 41)
+        assert screen.get_brightness(1) == 41
+    return path
+
+
+def test_records_and_frames(capture):
+    with TraceReader(capture) as reader:
+        records = list(reader)
+        frames = list(reader.frames())
+    assert [r.direction for r in records[:2]] == [TX, RX]
+    assert all(a.timestamp <= b.timestamp for a, b in zip(records, records[1:]))  # noqa: B905
+    assert sum(len(r.data) for r in records if r.direction == TX) == 21 + 21 + 20
+    assert [(f.direction, f.frame.serno) for f in frames] == [
+        (TX, 0),
+        (RX, 0),
+        (TX, 1),
+        (RX, 1),
+        (TX, 2),
+        (RX, 2),
+    ]
+    assert {(f.frame.port, f.frame.reg_addr) for f in frames} == {(0, REG)}
+    assert frames[-1].frame.data == bytes([41])
+
+
+def test_latencies(capture):
+    with TraceReader(capture) as reader:
+        latencies = reader.latencies()
+    assert set(latencies) == {(1, REG, True), (1, REG, False)}
+    assert len(latencies[(1, REG, True)]) == 2
+    assert len(latencies[(1, REG, False)]) == 1
+    assert all(LATENCY <= s < 0.5 for samples in latencies.values() for s in samples)
+
+
+def test_truncated_last_record(capture):
+    with TraceReader(capture) as reader:
+        records = list(reader)
+    path = pathlib.Path(capture)
+    with path.open('r+b') as f:
+        f.truncate(path.stat().st_size - 1)  # killed while writing the last record
+    with TraceReader(capture) as reader:
+        assert list(reader) == records[:-1]
+        assert (1, REG, False) not in reader.latencies()  # the reply is gone
+
+
+def test_replay(capture, make_emulator):
+    from novastar_mctrl300.serports import Mctrl300Serial
+
+    target = make_emulator()
+    with TraceReader(capture) as reader, Mctrl300Serial(target.port) as serport:
+        assert reader.replay(serport, speed=None) == 3
+        serport.timeout = 1
+        assert len(serport.read(2 * 20 + 21)) == 2 * 20 + 21  # the replies, all commands are done
+    assert target.read(1, 0, REG, 1) == bytes([41])
+
+
+@pytest.mark.parametrize('content', [b'', b'MCTRACE', b'NOTATRACE'])
+def test_not_a_capture(tmp_path, content):
+    path = tmp_path / 'other'
+    path.write_bytes(content)
+    with pytest.raises(ValueError, match='not an MCTRL300 capture'):
+        TraceReader(str(path))
+    path.write_bytes(MAGIC)
+    with TraceReader(str(path)) as reader:
+        assert list(reader) == []
+
+
+def test_histogram():
+    lines = histogram([0.0001, 0.003, 0.004, 2], edges_ms=(1, 5)).splitlines()
+    assert [line.split()[-2:] for line in lines] == [
+        ['1', '#' * 20],
+        ['2', '#' * 40],
+        ['1', '#' * 20],
+    ]
+    assert lines[2].split()[:3] == ['>=', '5', 'ms']